@@ -0,0 +1,90 @@
+"""
+Recall@k and query latency of the IVF index against exact NumPy search.
+
+    python benchmarks/ann_recall.py --sizes 10000 100000 1000000 --nprobe 1 4 8 16 32
+    python benchmarks/ann_recall.py --snapshot src/app/snapshot
+
+Without --snapshot the corpus is a synthetic mixture of clusters, which is
+closer to real embeddings than uniform noise (uniform data is the worst case
+for any partitioning index).
+"""
+import argparse
+import time
+
+import numpy as np
+
+import common  # noqa: F401  (puts src/app on sys.path)
+from ann import IVFIndex
+from retrieval import NumpyIndex, _normalize, top_k
+
+
+def clustered_corpus(n: int, dim: int, clusters: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    return _normalize(centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32))
+
+
+def timed(fn, queries):
+    lat = []
+    out = []
+    for q in queries:
+        t = time.perf_counter()
+        out.append(fn(q))
+        lat.append((time.perf_counter() - t) * 1000)
+    return out, lat
+
+
+def bench_corpus(vectors, queries, k: int, nprobes, nlist):
+    flat = NumpyIndex(vectors, chunks=None)
+    exact, flat_lat = timed(lambda q: top_k((flat.vectors @ q)[None, :], k)[0], queries)
+    exact = [set(e.tolist()) for e in exact]
+
+    t = time.perf_counter()
+    ivf = IVFIndex.build(vectors, nlist=nlist)
+    build_s = time.perf_counter() - t
+
+    rows = [{"index": "exact", "nprobe": None, "recall": 1.0, **common.percentiles(flat_lat, (50, 99))}]
+    for nprobe in nprobes:
+        found, lat = timed(lambda q: ivf.search_ids(q, k, nprobe)[0][0], queries)
+        recall = np.mean([len(exact[i] & set(f.tolist())) / k for i, f in enumerate(found)])
+        rows.append({"index": "ivf", "nprobe": nprobe, "recall": float(recall), **common.percentiles(lat, (50, 99))})
+    return {"size": len(vectors), "nlist": ivf.nlist, "build_s": build_s, "results": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 200_000])
+    parser.add_argument("--snapshot", help="benchmark on a real snapshot instead of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--out", default="benchmarks/results/ann_recall.json")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.snapshot:
+        corpora = [np.asarray(NumpyIndex.load(args.snapshot).vectors)]
+    else:
+        corpora = (clustered_corpus(n, args.dim, clusters=max(16, n // 500)) for n in args.sizes)
+
+    reports = []
+    for vectors in corpora:
+        # queries are perturbed corpus points, like paraphrases of stored chunks
+        picks = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+        queries = _normalize(picks + 0.3 * rng.normal(size=picks.shape).astype(np.float32))
+        rep = bench_corpus(vectors, queries, args.k, args.nprobe, args.nlist)
+        reports.append(rep)
+
+        print(f"\nN={rep['size']:,}  nlist={rep['nlist']}  build={rep['build_s']:.1f}s")
+        for r in rep["results"]:
+            label = "exact" if r["index"] == "exact" else f"ivf nprobe={r['nprobe']}"
+            print(f"  {label:18} recall@{args.k}={r['recall']:.3f}  p50={r['p50']:.2f}ms  p99={r['p99']:.2f}ms")
+
+    common.write_report(args.out, {"benchmark": "ann_recall", "k": args.k, "corpora": reports})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Throughput and latency of the chat API against fake Gemini/Supabase.
+
+    python benchmarks/chat_load.py --concurrency 1 4 16 64
+    python benchmarks/chat_load.py --endpoint stream --gen-ms 3000 --rate-limit 0.05
+    python benchmarks/chat_load.py --endpoint batch --batch-size 25 --concurrency 1 4
+    HEDGE_PERCENTILE=95 python benchmarks/chat_load.py --tail 0.05 --tail-ms 2000
+    python benchmarks/chat_load.py --gen-failure 1.0   # generation down: breaker + degraded answers
+    ROUTING=1 python benchmarks/chat_load.py --fast-gen-ms 400   # known/short questions on the fast model
+
+With --endpoint batch every request is one /chat/batch call of --batch-size
+questions; latency is per call and throughput is counted in questions.
+
+The FastAPI app from src/app/main.py runs in-process behind httpx's ASGI
+transport; only the upstream clients are replaced. Any of the app's env
+settings (GENERATE_CONCURRENCY, RETRIEVAL_BACKEND, ...) can be set as usual.
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+
+import common
+from fakes import FakeConfig, FakeGenai, FakeSupabase, Latency
+
+QUESTIONS = [
+    "How many ANC visits are recommended during pregnancy?",
+    "What are the danger signs of high blood pressure in pregnancy?",
+    "Is it safe for a 16 year old to deliver at home?",
+    "What should I eat to control gestational diabetes?",
+    "When should a pregnant woman go to the health facility?",
+]
+
+
+def load_app(cfg, env=None):
+    # the app reads its settings at import time
+    os.environ.setdefault("GEMINI_API_KEY", "fake")
+    os.environ.setdefault("SUPABASE_URL", "http://fake.supabase.local")
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "fake")
+    for k, v in (env or {}).items():
+        os.environ[k] = str(v)
+    os.chdir(common.APP_DIR)
+
+    import main
+
+    # set before the lifespan runs, so it keeps these instead of building real clients
+    main.client = FakeGenai(cfg)
+    main.supabase = FakeSupabase(cfg)
+    return main
+
+
+def question(i, unique):
+    q = QUESTIONS[i % len(QUESTIONS)]
+    return f"{q} (case {i})" if unique else q
+
+
+async def one_request(client, endpoint, body):
+    t = time.perf_counter()
+    if endpoint == "chat":
+        r = await client.post("/chat", json=body)
+        status = r.status_code
+    elif endpoint == "batch":
+        r = await client.post("/chat/batch", json=body)
+        status = r.status_code
+        if status == 200 and any(item["error"] for item in r.json()["results"]):
+            status = "item_error"
+    else:
+        status = None
+        async with client.stream("POST", "/chat/stream", json=body) as r:
+            status = r.status_code
+            async for line in r.aiter_lines():
+                if line.startswith("event: error"):
+                    status = "stream_error"
+    return status, (time.perf_counter() - t) * 1000
+
+
+async def run_level(app, endpoint, concurrency, total, unique, offset, batch_size=1):
+    import httpx
+
+    latencies = []
+    statuses = Counter()
+    counter = iter(range(total))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        async def worker():
+            for i in counter:
+                if endpoint == "batch":
+                    base = offset + i * batch_size
+                    body = {"requests": [{"message": question(base + j, unique), "match_count": 3} for j in range(batch_size)]}
+                else:
+                    body = {"message": question(offset + i, unique), "match_count": 3}
+                status, ms = await one_request(client, endpoint, body)
+                statuses[str(status)] += 1
+                if status == 200:
+                    latencies.append(ms)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "statuses": dict(statuses),
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "questions_per_s": len(latencies) * batch_size / elapsed if elapsed else 0.0,
+        **common.percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoint", choices=["chat", "stream", "batch"], default="chat")
+    parser.add_argument("--batch-size", type=int, default=16, help="questions per /chat/batch call")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=None, help="per level, default max(20, 2 x concurrency)")
+    parser.add_argument("--repeat-questions", action="store_true", help="reuse the same few questions so caches can hit")
+    parser.add_argument("--embed-ms", type=float, default=40)
+    parser.add_argument("--rpc-ms", type=float, default=60)
+    parser.add_argument("--gen-ms", type=float, default=1500)
+    parser.add_argument("--fast-gen-ms", type=float, default=None, help="generation time of the fast route's model, default --gen-ms / 3")
+    parser.add_argument("--jitter", type=float, default=0.25, help="jitter as a fraction of each mean")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of upstream calls failing with 429")
+    parser.add_argument("--failure", type=float, default=0.0, help="fraction of upstream calls failing outright")
+    parser.add_argument("--gen-failure", type=float, default=None, help="failure fraction for generation alone, default --failure")
+    parser.add_argument("--tail", type=float, default=0.0, help="fraction of embedding and RPC calls that stall for --tail-ms")
+    parser.add_argument("--tail-ms", type=float, default=2000)
+    parser.add_argument("--out", default=os.path.join(common.ROOT, "benchmarks/results/chat_load.json"))
+    args = parser.parse_args()
+
+    def lat(ms, failure=args.failure, tail=args.tail):
+        return Latency(ms, ms * args.jitter, args.rate_limit, failure, tail, args.tail_ms)
+
+    gen_failure = args.failure if args.gen_failure is None else args.gen_failure
+    fast_gen_ms = args.gen_ms / 3 if args.fast_gen_ms is None else args.fast_gen_ms
+    cfg = FakeConfig(embed=lat(args.embed_ms), rpc=lat(args.rpc_ms), generate=lat(args.gen_ms, gen_failure, 0.0),
+                     fast_generate=lat(fast_gen_ms, gen_failure, 0.0), first_token_ms=args.gen_ms / 4)
+    env = {} if args.repeat_questions else {"ANSWER_CACHE_SIZE": 0}
+    app_module = load_app(cfg, env)
+    app = app_module.app
+
+    async def run_all():
+        levels = []
+        offset = 0
+        async with app.router.lifespan_context(app):
+            print(f"startup {app_module.startup['startup_ms']}ms (warm-up {app_module.startup['warmup_ms']}ms)")
+            for c in args.concurrency:
+                total = args.requests or max(20, 2 * c)
+                batch_size = args.batch_size if args.endpoint == "batch" else 1
+                res = await run_level(app, args.endpoint, c, total, not args.repeat_questions, offset, batch_size)
+                offset += total * batch_size
+                levels.append(res)
+                p = lambda k: f"{res[k]:.0f}" if res[k] is not None else "-"
+                print(f"c={c:<4} {res['throughput_rps']:7.2f} req/s {res['questions_per_s']:7.2f} q/s  p50={p('p50')}ms p95={p('p95')}ms p99={p('p99')}ms  {res['statuses']}")
+            startup = dict(app_module.startup)
+            batching = app_module.embed_coalescer.stats()
+            upstreams = {u.name: u.stats() for u in app_module.upstreams}
+            routing = app_module.router.stats()
+        return levels, startup, batching, upstreams, routing
+
+    levels, startup, batching, upstreams, routing = asyncio.run(run_all())
+    calls = {**app_module.client.counters, "rpc": app_module.supabase.counters["rpc"]}
+    print(f"upstream calls {calls}, mean embed batch {batching['batch_size']['mean']}")
+    for name, u in upstreams.items():
+        print(f"  {name:16} retries {u['retries']}  hedged {u['hedged']} (won {u['hedge_wins']})  starved {u['starved']}  "
+              f"breaker {u['breaker']['state']}, opened {u['breaker']['opened']}x, rejected {u['breaker']['rejected']}")
+    for name, r in routing["routes"].items():
+        g = r["generate_ms"]
+        print(f"  route {name:5} {r['model']:18} {r['requests']:5} answers  generate p50={g.get('p50', '-')}ms p95={g.get('p95', '-')}ms")
+    if routing["reasons"]:
+        print(f"  route reasons {routing['reasons']}")
+
+    common.write_report(args.out, {
+        "benchmark": "chat_load",
+        "endpoint": args.endpoint,
+        "fakes": {"embed_ms": args.embed_ms, "rpc_ms": args.rpc_ms, "gen_ms": args.gen_ms,
+                  "jitter": args.jitter, "rate_limit": args.rate_limit, "failure": args.failure,
+                  "fast_gen_ms": fast_gen_ms, "gen_failure": gen_failure, "tail": args.tail, "tail_ms": args.tail_ms},
+        "startup": startup,
+        "upstream_calls": calls,
+        "embed_batching": batching,
+        "upstreams": upstreams,
+        "routing": routing,
+        "levels": levels,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "src", "app")
+SYNTHETIC_DIR = os.path.join(ROOT, "data", "synthetic")
+
+# the app and the data scripts are plain script folders, not installed packages
+for _p in (APP_DIR, SYNTHETIC_DIR):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+
+def percentiles(samples, ps=(50, 95, 99)):
+    if not samples:
+        return {f"p{p}": None for p in ps}
+    s = sorted(samples)
+    return {f"p{p}": s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))] for p in ps}
+
+
+def git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def write_report(path: str, report: dict):
+    report = {"commit": git_rev(), **report}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {path}")
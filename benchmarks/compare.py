@@ -0,0 +1,70 @@
+"""
+Diff two benchmark reports, e.g. from two commits.
+
+    python benchmarks/compare.py old/chat_load.json benchmarks/results/chat_load.json
+
+Every numeric leaf present in both files is printed with its ratio; latency
+and seconds going up (or throughput going down) by more than --threshold is
+flagged.
+"""
+import argparse
+import json
+
+
+def flatten(obj, prefix=""):
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            yield from flatten(v, f"{prefix}.{k}" if prefix else str(k))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            # levels/corpora are keyed by their main parameter when there is one
+            key = next((f"{k}={v[k]}" for k in ("concurrency", "size", "nprobe", "mode") if isinstance(v, dict) and k in v), str(i))
+            yield from flatten(v, f"{prefix}[{key}]")
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        yield prefix, obj
+
+
+HIGHER_IS_BETTER = ("throughput", "rows_per_s", "recall", "hit_rate", ".ok")
+LOWER_IS_BETTER = (".p50", ".p95", ".p99", "seconds", "_s", "_ms", "_mb")
+
+
+def worse(name, ratio, threshold):
+    # settings and counts are printed but never flagged
+    leaf = name.rsplit(".", 1)[-1]
+    if name.startswith("fakes.") or leaf in ("concurrency", "requests", "size", "nprobe"):
+        return False
+    if any(s in name for s in HIGHER_IS_BETTER):
+        return ratio < 1 - threshold
+    if any(name.endswith(s) for s in LOWER_IS_BETTER):
+        return ratio > 1 + threshold
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+
+    old_vals = dict(flatten(old))
+    regressions = 0
+    for name, value in flatten(new):
+        if name not in old_vals or name == "commit":
+            continue
+        before = old_vals[name]
+        ratio = value / before if before else float("inf") if value else 1.0
+        flag = "  <-- regression" if worse(name, ratio, args.threshold) else ""
+        regressions += bool(flag)
+        print(f"{name:60} {before:12.3f} -> {value:12.3f}  x{ratio:.2f}{flag}")
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Local stand-ins for the Gemini and Supabase clients.
+
+They expose just the methods the app and the data scripts call, sleep for a
+configurable latency and can fail with a 429-style rate limit or a generic
+error at a given rate. Embeddings are deterministic per text so caches and
+retrieval behave like they would against the real API.
+"""
+import asyncio
+import hashlib
+import random
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class FakeRateLimit(Exception):
+    code = 429
+
+    def __init__(self, what):
+        super().__init__(f"429 RESOURCE_EXHAUSTED: fake rate limit on {what}")
+
+
+class FakeFailure(Exception):
+    code = 500
+
+
+@dataclass
+class Latency:
+    """mean and jitter in milliseconds, a slow tail, plus failure rates for one upstream call"""
+
+    mean_ms: float = 0.0
+    jitter_ms: float = 0.0
+    rate_limit: float = 0.0
+    failure: float = 0.0
+    # a fraction of calls stalls for tail_ms instead: the slow tail that hedging targets
+    tail: float = 0.0
+    tail_ms: float = 0.0
+
+    def delay(self, rng):
+        if self.tail and rng.random() < self.tail:
+            return self.tail_ms / 1000
+        return max(0.0, rng.gauss(self.mean_ms, self.jitter_ms)) / 1000
+
+    def maybe_fail(self, rng, what):
+        roll = rng.random()
+        if roll < self.rate_limit:
+            raise FakeRateLimit(what)
+        if roll < self.rate_limit + self.failure:
+            raise FakeFailure(f"fake upstream failure on {what}")
+
+
+@dataclass
+class FakeConfig:
+    embed: Latency = field(default_factory=lambda: Latency(40, 10))
+    rpc: Latency = field(default_factory=lambda: Latency(60, 20))
+    generate: Latency = field(default_factory=lambda: Latency(1500, 400))
+    # models whose name contains fast_marker (the app's fast route) answer with this latency instead
+    fast_generate: Latency = field(default_factory=lambda: Latency(500, 120))
+    fast_marker: str = "flash"
+    # time to first streamed token and number of streamed chunks
+    first_token_ms: float = 400
+    stream_chunks: int = 20
+    insert: Latency = field(default_factory=lambda: Latency(80, 20))
+    dim: int = 768
+    corpus: int = 1000
+    seed: int = 0
+
+
+def fake_vector(text, dim):
+    seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+    v = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+class _Models:
+    def __init__(self, cfg, rng, counters):
+        self.cfg = cfg
+        self.rng = rng
+        self.counters = counters
+
+    def _embed(self, contents):
+        texts = contents if isinstance(contents, list) else [contents]
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=fake_vector(t, self.cfg.dim).tolist()) for t in texts])
+
+    def _answer(self, contents):
+        return "This is a fake answer to: " + str(contents)[-80:].strip()
+
+    def _generation(self, model):
+        self.counters["generate"] += 1
+        self.counters["models"][model] = self.counters["models"].get(model, 0) + 1
+        return self.cfg.fast_generate if self.cfg.fast_marker in model else self.cfg.generate
+
+
+class FakeSyncModels(_Models):
+    def embed_content(self, model, contents, config=None):
+        self.counters["embed"] += 1
+        time.sleep(self.cfg.embed.delay(self.rng))
+        self.cfg.embed.maybe_fail(self.rng, "embed_content")
+        return self._embed(contents)
+
+    def generate_content(self, model, contents, config=None):
+        latency = self._generation(model)
+        time.sleep(latency.delay(self.rng))
+        latency.maybe_fail(self.rng, "generate_content")
+        return SimpleNamespace(text=self._answer(contents))
+
+
+class FakeAsyncModels(_Models):
+    async def embed_content(self, model, contents, config=None):
+        self.counters["embed"] += 1
+        await asyncio.sleep(self.cfg.embed.delay(self.rng))
+        self.cfg.embed.maybe_fail(self.rng, "embed_content")
+        return self._embed(contents)
+
+    async def generate_content(self, model, contents, config=None):
+        latency = self._generation(model)
+        await asyncio.sleep(latency.delay(self.rng))
+        latency.maybe_fail(self.rng, "generate_content")
+        return SimpleNamespace(text=self._answer(contents))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        latency = self._generation(model)
+        total = latency.delay(self.rng)
+        first = min(total, self.cfg.first_token_ms / 1000)
+        n = max(1, self.cfg.stream_chunks)
+        words = self._answer(contents).split()
+
+        async def chunks():
+            await asyncio.sleep(first)
+            latency.maybe_fail(self.rng, "generate_content_stream")
+            for i in range(n):
+                if i:
+                    await asyncio.sleep((total - first) / n)
+                yield SimpleNamespace(text=" ".join(words[i::n]) + " ")
+
+        return chunks()
+
+
+class FakeGenai:
+    """drop-in for genai.Client: .models (sync) and .aio.models (async)"""
+
+    def __init__(self, cfg=None):
+        self.cfg = cfg or FakeConfig()
+        self.counters = {"embed": 0, "generate": 0, "models": {}}
+        rng = random.Random(self.cfg.seed)
+        self.models = FakeSyncModels(self.cfg, rng, self.counters)
+        self.aio = SimpleNamespace(models=FakeAsyncModels(self.cfg, rng, self.counters))
+
+
+class _Query:
+    def __init__(self, owner, fn):
+        self.owner = owner
+        self.fn = fn
+
+    def execute(self):
+        return SimpleNamespace(data=self.fn())
+
+
+class _Table:
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+        self._range = None
+        self._filters = []
+        self._delete = False
+
+    def insert(self, rows):
+        return _Query(self.owner, lambda: self.owner._insert(self.name, rows))
+
+    def upsert(self, rows, on_conflict="id"):
+        return _Query(self.owner, lambda: self.owner._insert(self.name, rows, on_conflict))
+
+    def delete(self):
+        self._delete = True
+        return self
+
+    def select(self, *cols):
+        return self
+
+    def order(self, *a, **kw):
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def in_(self, col, values):
+        self._filters.append((col, set(values)))
+        return self
+
+    def execute(self):
+        if self._delete:
+            return SimpleNamespace(data=self.owner._delete(self.name, self._filters))
+        return SimpleNamespace(data=self.owner._select(self.name, self._range, self._filters))
+
+
+class FakeSupabase:
+    """drop-in for the supabase client: rpc('match_knowledge'), table(...).insert/upsert/select/delete"""
+
+    def __init__(self, cfg=None):
+        self.cfg = cfg or FakeConfig()
+        self.rng = random.Random(self.cfg.seed + 1)
+        self.counters = {"rpc": 0, "insert": 0, "delete": 0}
+        self.tables = {"knowledge": []}
+        for i in range(self.cfg.corpus):
+            content = f"Fake knowledge chunk {i} about antenatal care visit {i % 11}."
+            self.tables["knowledge"].append({"id": i + 1, "content": content, "embedding": fake_vector(content, self.cfg.dim).tolist()})
+        self._matrix = None
+
+    def _vectors(self):
+        rows = self.tables["knowledge"]
+        if self._matrix is None or len(self._matrix) != len(rows):
+            self._matrix = np.asarray([r["embedding"] for r in rows], dtype=np.float32)
+        return self._matrix
+
+    def rpc(self, name, params):
+        def run():
+            self.counters["rpc"] += 1
+            time.sleep(self.cfg.rpc.delay(self.rng))
+            self.cfg.rpc.maybe_fail(self.rng, name)
+            q = np.asarray(params["query_embedding"], dtype=np.float32)
+            scores = self._vectors() @ (q / (np.linalg.norm(q) or 1.0))
+            top = np.argsort(-scores)[:params["match_count"]]
+            rows = self.tables["knowledge"]
+            return [{"id": rows[i]["id"], "content": rows[i]["content"], "similarity": float(scores[i])} for i in top]
+
+        return _Query(self, run)
+
+    def table(self, name):
+        self.tables.setdefault(name, [])
+        return _Table(self, name)
+
+    def _insert(self, name, rows, on_conflict=None):
+        self.counters["insert"] += 1
+        time.sleep(self.cfg.insert.delay(self.rng))
+        self.cfg.insert.maybe_fail(self.rng, f"insert into {name}")
+        table = self.tables[name]
+        at = {r[on_conflict]: i for i, r in enumerate(table)} if on_conflict else {}
+        for r in rows:
+            if on_conflict and r[on_conflict] in at:
+                table[at[r[on_conflict]]] = {**table[at[r[on_conflict]]], **r}
+            else:
+                table.append({"id": len(table) + 1, **r})
+        return rows
+
+    def _delete(self, name, filters):
+        self.counters["delete"] += 1
+        keep, gone = [], []
+        for r in self.tables[name]:
+            (gone if all(r.get(col) in values for col, values in filters) else keep).append(r)
+        self.tables[name] = keep
+        return gone
+
+    def _select(self, name, rng, filters):
+        rows = self.tables[name]
+        for col, values in filters:
+            rows = [r for r in rows if r.get(col) in values]
+        if rng:
+            rows = rows[rng[0]:rng[1] + 1]
+        return rows
@@ -0,0 +1,201 @@
+"""
+Hybrid retrieval (metadata filter + BM25 prefilter + dense scoring of the
+survivors) against pure dense search: latency, and how many of the top k
+chunks actually match what a structured question asks for.
+
+    python benchmarks/hybrid_retrieval.py
+    python benchmarks/hybrid_retrieval.py --scale 50 --queries 500
+
+The corpus is the distinct knowledge chunks of synthetic_bdhs_10k.csv
+(knowledge_generator.frame_to_groups), repeated --scale times with a record
+number appended to reach larger sizes. Offline there is no embedding model,
+so vectors are feature-hashed word unigrams and bigrams: a lexical stand-in
+that is kinder to dense search on numbers and keywords than a real model.
+Questions are built from random field combinations in the style of
+data_matcher.py ("a woman aged 15 with low education, anc visits 2"); a
+result is relevant when the chunk's source fields meet every constraint.
+
+The corpus also holds a few prose guidance chunks per topic, which state
+none of the template's fields, and free-text questions about those topics
+("What are the danger signs of high blood pressure in pregnancy?") are
+scored separately: a result is relevant when it is a chunk on the
+question's topic.
+"""
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import common
+from hybrid import HybridIndex
+from knowledge_generator import COLUMNS, frame_to_groups, meta_at
+from retrieval import NumpyIndex, _normalize
+from text import tokenize
+
+
+def hashed_embedding(texts, dim):
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = tokenize(text)
+        for f in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), "little")
+            out[row, h % dim] += 1.0 if (h >> 63) else -1.0
+    return _normalize(out)
+
+
+# prose chunks: guidance in the knowledge base's register that the metadata filter cannot read
+PROSE = {
+    "bp_danger": [
+        "Severe headache, blurred vision and sudden swelling of the face and hands in a pregnant woman with high blood pressure are danger signs of pre-eclampsia; she should go to a health facility at once.",
+        "High blood pressure in pregnancy can progress to pre-eclampsia and eclampsia. Danger signs are severe headache, blurred vision, pain under the ribs and fits.",
+    ],
+    "high_risk": [
+        "A pregnancy is high risk when the mother is younger than 18 or older than 35, has high blood pressure or diabetes, had a previous caesarean section, or is carrying twins.",
+        "High risk pregnancies need more frequent antenatal check-ups and a planned delivery in a health facility with a skilled birth attendant.",
+    ],
+    "anc_schedule": [
+        "WHO recommends at least eight antenatal care contacts, the first within the first twelve weeks of pregnancy.",
+        "Antenatal visits check the mother's blood pressure, weight and urine and the baby's growth; the first visit should be as early as possible.",
+    ],
+    "nutrition": [
+        "During pregnancy a woman should eat one extra meal a day, with vegetables, fruit, pulses, fish, eggs or meat.",
+        "A balanced diet in pregnancy includes rice or bread, lentils, green leafy vegetables, fruit and milk; avoid alcohol and limit tea with meals.",
+    ],
+    "iron_folic": [
+        "Iron and folic acid tablets taken daily throughout pregnancy prevent anaemia and protect the baby from neural tube defects.",
+        "Take one iron and folic acid tablet every day from the first antenatal visit; dark stools are a harmless side effect.",
+    ],
+    "home_delivery": [
+        "Delivering at home without a skilled birth attendant is unsafe: bleeding after birth and obstructed labour can kill within hours.",
+        "Plan to give birth in a health facility and arrange transport and money in advance, especially if the pregnancy is high risk.",
+    ],
+    "bleeding": [
+        "Any vaginal bleeding during pregnancy is a danger sign; go to a health facility immediately.",
+        "Bleeding in pregnancy can come from miscarriage, placenta praevia or placental abruption and always needs urgent care.",
+    ],
+    "swelling": [
+        "Mild swelling of the feet in late pregnancy is common; rest with the feet raised and avoid standing for long periods.",
+        "Sudden swelling of the face and hands, unlike swollen feet, may be a sign of pre-eclampsia and needs a blood pressure check.",
+    ],
+}
+FREE_TEXT = {
+    "bp_danger": ["What are the danger signs of high blood pressure in pregnancy?",
+                  "My sister has high blood pressure and a severe headache, is that dangerous?"],
+    "high_risk": ["What makes a pregnancy high risk?", "What extra care does a high risk pregnancy need?"],
+    "anc_schedule": ["How many antenatal care contacts are recommended?", "When should the first antenatal visit be?"],
+    "nutrition": ["What should a pregnant woman eat every day?", "What foods make a balanced diet in pregnancy?"],
+    "iron_folic": ["Should I take iron and folic acid tablets every day?", "Why are iron tablets given in pregnancy?"],
+    "home_delivery": ["Is it safe to give birth at home?", "Should a high risk woman deliver in a health facility?"],
+    "bleeding": ["What does bleeding during pregnancy mean?", "Is vaginal bleeding in pregnancy a danger sign?"],
+    "swelling": ["How can I reduce swelling of my feet?", "Is swelling of the face and hands dangerous without high blood pressure?"],
+}
+
+
+def build_corpus(scale):
+    df = pd.read_csv(os.path.join(common.SYNTHETIC_DIR, "synthetic_bdhs_10k.csv"), usecols=COLUMNS)
+    texts, _, meta = frame_to_groups(df)
+    fields = [meta_at(meta, j) for j in range(len(texts))]
+    chunks, truth = [], []
+    for copy in range(scale):
+        suffix = f" Record {copy}." if copy else ""
+        for j, text in enumerate(texts):
+            chunks.append({"id": len(chunks), "content": text + suffix})
+            truth.append(fields[j])
+        for topic, prose in PROSE.items():
+            for text in prose:
+                chunks.append({"id": len(chunks), "content": text + suffix})
+                truth.append({"topic": topic})
+    return chunks, truth
+
+
+def make_queries(truth, n, rng):
+    """(question, constraints) pairs from the fields of random chunks"""
+    out = []
+    template = [i for i, f in enumerate(truth) if "age" in f]
+    for i in rng.choice(template, n):
+        f = truth[i]
+        c = {"age": f["age"], "low_education": f["low_education"]}
+        q = f"a woman aged {f['age']} with {'low' if f['low_education'] else 'higher'} education"
+        if f["few_anc_visits"] and rng.random() < 0.7:
+            c["anc_visits"] = f["anc_visits"]
+            q += f", anc visits {f['anc_visits']}"
+        if f["high_bp"] and rng.random() < 0.5:
+            c["high_bp"] = True
+            q += " and high blood pressure"
+        elif not f["high_bp"] and rng.random() < 0.3:
+            c["high_bp"] = False
+            q += " and no high blood pressure"
+        if rng.random() < 0.5:
+            c["high_risk"] = f["high_risk"]
+            q += ", high risk" if f["high_risk"] else ", not high risk"
+        out.append((q, c))
+    return out
+
+
+def free_text_queries():
+    return [(q, {"topic": topic}) for topic, questions in FREE_TEXT.items() for q in questions]
+
+
+def relevant(fields, constraints):
+    return all(fields.get(k) == v for k, v in constraints.items())
+
+
+def evaluate(name, search, queries, vectors, truth, k, label="structured"):
+    lat, precision, hit1 = [], [], []
+    for (text, constraints), vec in zip(queries, vectors):
+        t = time.perf_counter()
+        results = search(vec, text)
+        lat.append((time.perf_counter() - t) * 1000)
+        ok = [relevant(truth[r["id"]], constraints) for r in results]
+        precision.append(sum(ok) / k)
+        hit1.append(bool(ok) and ok[0])
+    row = {"index": name, "questions": label, "precision_at_k": float(np.mean(precision)), "hit_at_1": float(np.mean(hit1)),
+           **common.percentiles(lat, (50, 99))}
+    print(f"{name:16} {label:10} precision@{k} {row['precision_at_k']:.3f}  hit@1 {row['hit_at_1']:.3f}  "
+          f"p50 {row['p50']:.2f}ms  p99 {row['p99']:.2f}ms")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 20])
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--lexical-k", type=int, default=200)
+    parser.add_argument("--out", default="benchmarks/results/hybrid_retrieval.json")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    reports = []
+    for scale in args.scale:
+        chunks, truth = build_corpus(scale)
+        t = time.perf_counter()
+        flat = NumpyIndex(hashed_embedding([c["content"] for c in chunks], args.dim), chunks)
+        embed_s = time.perf_counter() - t
+        t = time.perf_counter()
+        hybrid = HybridIndex(flat, args.lexical_k)
+        filter_only = HybridIndex(flat, 0)
+        build_s = (time.perf_counter() - t) / 2
+
+        sets = {"structured": make_queries(truth, args.queries, rng), "free_text": free_text_queries()}
+        print(f"\n{len(chunks)} chunks, index build {build_s:.2f}s")
+        rows = []
+        for label, queries in sets.items():
+            qvecs = hashed_embedding([q for q, _ in queries], args.dim)
+            rows += [
+                evaluate("dense", lambda v, q: flat.search(v, args.k)[0], queries, qvecs, truth, args.k, label),
+                evaluate("metadata+dense", lambda v, q: filter_only.search(v, args.k, texts=[q])[0], queries, qvecs, truth, args.k, label),
+                evaluate("hybrid", lambda v, q: hybrid.search(v, args.k, texts=[q])[0], queries, qvecs, truth, args.k, label),
+            ]
+        reports.append({"chunks": len(chunks), "embed_s": embed_s, "build_s": build_s,
+                        "hybrid": hybrid.stats(), "results": rows})
+
+    common.write_report(args.out, {"benchmark": "hybrid_retrieval", "k": args.k, "corpora": reports})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Row loop vs vectorized knowledge generation.
+
+    python benchmarks/knowledge_generation.py                 # the bundled 10k csv
+    python benchmarks/knowledge_generation.py --rows 5000000  # csv tiled up to 5M rows
+
+Every mode runs in a fresh subprocess so peak RSS is per mode. Memory of the
+vectorized mode should stay flat as --rows grows when dedup is off.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+
+SOURCE = os.path.join(common.SYNTHETIC_DIR, "synthetic_bdhs_10k.csv")
+
+
+def tile_csv(src, rows, dst):
+    with open(src) as f:
+        header, *body = f.read().splitlines()
+    with open(dst, "w") as out:
+        out.write(header + "\n")
+        written = 0
+        while written < rows:
+            take = body[:rows - written]
+            out.write("\n".join(take) + "\n")
+            written += len(take)
+
+
+def run_one(csv_path, vectorized, dedup):
+    # child process: time generate() alone, report peak RSS
+    import knowledge_generator as kg
+
+    times = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # the first call also pays one-off imports inside pandas; report both
+        for _ in range(2):
+            t = time.perf_counter()
+            rows, written = kg.generate(csv_path, os.path.join(tmp, "k.txt"), vectorized=vectorized, dedup=dedup)
+            times.append(time.perf_counter() - t)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"rows": rows, "chunks": written, "cold_seconds": times[0], "seconds": times[1], "peak_rss_mb": peak_kb / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=None, help="tile the 10k csv up to this many rows")
+    parser.add_argument("--skip-rows-mode", action="store_true", help="only time the vectorized generator")
+    parser.add_argument("--out", default="benchmarks/results/knowledge_generation.json")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, vectorized, dedup = args.child
+        run_one(path, vectorized == "1", dedup == "1")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = SOURCE
+        if args.rows:
+            csv_path = os.path.join(tmp, "tiled.csv")
+            tile_csv(SOURCE, args.rows, csv_path)
+
+        results = []
+        for vectorized in (False, True):
+            if not vectorized and args.skip_rows_mode:
+                continue
+            for dedup in (False, True):
+                out = subprocess.check_output(
+                    [sys.executable, __file__, "--child", csv_path, str(int(vectorized)), str(int(dedup))],
+                    cwd=common.ROOT, text=True,
+                )
+                res = {"mode": "vectorized" if vectorized else "rows", "dedup": dedup, **json.loads(out.splitlines()[-1])}
+                results.append(res)
+                print(f"{res['mode']:10} dedup={str(dedup):5}  {res['rows']:>10,} rows  "
+                      f"{res['seconds'] * 1000:9.1f}ms (cold {res['cold_seconds'] * 1000:.1f}ms)  peak {res['peak_rss_mb']:.0f}MB")
+
+    common.write_report(args.out, {"benchmark": "knowledge_generation", "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Offline data paths with fake upstreams: ingestion, knowledge generation and
+synthetic-data post-processing.
+
+    python benchmarks/offline.py
+    python benchmarks/offline.py --only ingest --embed-ms 300 --rate-limit 0.1
+
+data_generator needs sdv installed (it is imported at module level); without
+it that section is reported as skipped rather than faked.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import common
+from fakes import FakeConfig, FakeGenai, FakeSupabase, Latency
+
+
+def bench_ingest(args):
+    os.environ.setdefault("GEMINI_API_KEY", "fake")
+    os.environ.setdefault("SUPABASE_URL", "http://fake.supabase.local")
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "fake")
+    os.environ["EMBED_RPM"] = str(args.embed_rpm)
+    import data_ingestor as di
+
+    cfg = FakeConfig(
+        embed=Latency(args.embed_ms, args.embed_ms / 4, args.rate_limit, args.failure),
+        insert=Latency(args.insert_ms, args.insert_ms / 4, 0.0, args.failure),
+        corpus=0,
+    )
+    fake_genai, fake_db = FakeGenai(cfg), FakeSupabase(cfg)
+    di.client, di.supabase = fake_genai, fake_db
+    di.EMBED_RPM = args.embed_rpm
+    di.BACKOFF_BASE = 0.05
+
+    def write_source(path, changed=0):
+        with open(path, "w") as f:
+            for i in range(args.ingest_rows):
+                edit = " (revised)" if i < changed else ""
+                f.write(f"Distinct knowledge chunk number {i} about maternal care{edit}.\n\n")
+
+    def run(src, store):
+        before = dict(fake_genai.counters), dict(fake_db.counters)
+        t = time.perf_counter()
+        result = di.process_in_batch(src, store)
+        elapsed = time.perf_counter() - t
+        return {
+            **result,
+            "table_rows": len(fake_db.tables["knowledge"]),
+            "seconds": elapsed,
+            "chunks_per_s": result["upserted"] / elapsed if elapsed else 0.0,
+            "embed_calls": fake_genai.counters["embed"] - before[0]["embed"],
+            "upsert_calls": fake_db.counters["insert"] - before[1]["insert"],
+            "delete_calls": fake_db.counters["delete"] - before[1]["delete"],
+        }
+
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        src, store = os.path.join(tmp, "knowledge.txt"), os.path.join(tmp, "embeddings")
+        write_source(src)
+        out["full"] = run(src, store)
+        # a rerun with 1% of the chunks edited only embeds and replaces those
+        write_source(src, changed=max(1, args.ingest_rows // 100))
+        out["incremental"] = run(src, store)
+    return out
+
+
+def bench_knowledge(args):
+    import knowledge_generator as kg
+
+    src = os.path.join(common.SYNTHETIC_DIR, "synthetic_bdhs_10k.csv")
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, vectorized in (("rows", False), ("vectorized", True)):
+            times = []
+            for _ in range(3):
+                t = time.perf_counter()
+                rows, written = kg.generate(src, os.path.join(tmp, "k.txt"), vectorized=vectorized)
+                times.append(time.perf_counter() - t)
+            out[mode] = {"rows": rows, "chunks": written, "seconds": min(times)}
+    return out
+
+
+class FakeSynthesizer:
+    """stands in for a trained CTGAN: seed rows plus the kind of noise CTGAN output has"""
+
+    def __init__(self, seed_data):
+        self.seed_data = seed_data
+
+    def sample(self, num_rows):
+        rng = np.random.default_rng(0)
+        df = self.seed_data.sample(num_rows, replace=True, random_state=0).reset_index(drop=True)
+        for col in df.columns:
+            if df[col].dtype.kind in "if":
+                df[col] = df[col] + rng.normal(0, 0.3, num_rows)
+        df["wealth_quintile"] = df["wealth_quintile"].str.upper().where(rng.random(num_rows) < 0.1, df["wealth_quintile"])
+        return df
+
+
+def bench_data_generator(args):
+    try:
+        import data_generator as dg
+    except ImportError as e:
+        return {"skipped": f"data_generator unavailable: {e}"}
+
+    seed = dg.build_seed_dataset(sample_size=5000)
+    synth = FakeSynthesizer(seed)
+    out = {}
+    for n in args.synthetic_rows:
+        t = time.perf_counter()
+        df = dg.generate_synthetic_data(synth, num_records=n)
+        gen = time.perf_counter() - t
+        t = time.perf_counter()
+        dg.validate_synthetic_data(seed, df)
+        val = time.perf_counter() - t
+        out[str(n)] = {"generate_s": gen, "validate_s": val, "frame_mb": df.memory_usage(deep=True).sum() / 2**20}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", choices=["ingest", "knowledge", "data_generator"], nargs="+")
+    parser.add_argument("--ingest-rows", type=int, default=2000)
+    parser.add_argument("--embed-ms", type=float, default=200)
+    parser.add_argument("--insert-ms", type=float, default=150)
+    parser.add_argument("--embed-rpm", type=float, default=6000)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--failure", type=float, default=0.0)
+    parser.add_argument("--synthetic-rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--out", default=os.path.join(common.ROOT, "benchmarks/results/offline.json"))
+    args = parser.parse_args()
+
+    sections = {"ingest": bench_ingest, "knowledge": bench_knowledge, "data_generator": bench_data_generator}
+    report = {}
+    for name, fn in sections.items():
+        if args.only and name not in args.only:
+            continue
+        print(f"\n== {name}")
+        report[name] = fn(args)
+        print(report[name])
+
+    common.write_report(args.out, {"benchmark": "offline", **report})
+
+
+if __name__ == "__main__":
+    main()
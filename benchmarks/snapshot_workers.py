@@ -0,0 +1,114 @@
+"""
+Memory and load time of a retrieval snapshot across several worker
+processes: chunk texts parsed from chunks.jsonl into every worker vs the
+memory-mapped chunks.bin + offsets.npy layout all workers share.
+
+    python benchmarks/snapshot_workers.py
+    python benchmarks/snapshot_workers.py --chunks 500000 --workers 8
+
+Each worker loads the snapshot, runs a few searches and reads every text,
+then reports its load time. While all of them are still running, the parent
+reads each one's /proc/<pid>/smaps_rollup (so Linux only): anonymous memory
+is the heap only that worker holds, which multiplies with the worker count;
+PSS is its share of everything resident, with mapped files split between
+the processes mapping them.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import common
+from retrieval import CHUNKS_FILE, NumpyIndex, write_snapshot
+
+
+def memory_mb(pid):
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss", "Anonymous"):
+                out[name] = int(rest.split()[0]) / 1024
+    return {"rss_mb": out["Rss"], "pss_mb": out["Pss"], "anon_mb": out["Anonymous"]}
+
+
+def worker(snapshot_dir):
+    # child: load and touch the snapshot, report, then stay alive until stdin closes
+    # so every worker still maps the files when the parent measures them
+    t = time.perf_counter()
+    index = NumpyIndex.load(snapshot_dir)
+    load_s = time.perf_counter() - t
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(5):
+        index.search(rng.normal(size=index.dim), 5)
+    # every text once, as a full scan (hybrid's BM25 build) would
+    sum(len(c["content"]) for c in index.chunks)
+    print(json.dumps({"load_s": load_s}), flush=True)
+    sys.stdin.read()
+
+
+def run_workers(snapshot_dir, n):
+    procs = [subprocess.Popen([sys.executable, __file__, "--child", snapshot_dir],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for _ in range(n)]
+    reports = [json.loads(p.stdout.readline()) for p in procs]
+    for p, r in zip(procs, reports):
+        r.update(memory_mb(p.pid))
+    for p in procs:
+        p.stdin.close()
+        p.wait()
+    return {
+        "workers": n,
+        "load_s_mean": float(np.mean([r["load_s"] for r in reports])),
+        "anon_mb_mean": float(np.mean([r["anon_mb"] for r in reports])),
+        "pss_mb_total": float(sum(r["pss_mb"] for r in reports)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--out", default=os.path.join(common.ROOT, "benchmarks/results/snapshot_workers.json"))
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        worker(args.child)
+        return
+
+    rng = np.random.default_rng(0)
+    texts = [f"Knowledge chunk {i}: a pregnant woman aged {15 + i % 35} with {i % 4} antenatal visits." * 3
+             for i in range(args.chunks)]
+    vectors = rng.normal(size=(args.chunks, args.dim)).astype(np.float32)
+
+    layouts = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = os.path.join(tmp, "mmap")
+        write_snapshot(shared, range(args.chunks), texts, vectors)
+        # the previous layout: same vectors, texts in chunks.jsonl
+        legacy = os.path.join(tmp, "jsonl")
+        os.makedirs(legacy)
+        os.link(os.path.join(shared, "vectors.npy"), os.path.join(legacy, "vectors.npy"))
+        with open(os.path.join(legacy, CHUNKS_FILE), "w") as f:
+            for i, t in enumerate(texts):
+                f.write(json.dumps({"id": i, "content": t}) + "\n")
+        # written back, so the page cache holds clean pages the workers can share
+        os.sync()
+
+        for name, path in (("jsonl", legacy), ("mmap", shared)):
+            layouts[name] = run_workers(path, args.workers)
+            r = layouts[name]
+            print(f"{name:6} {args.workers} workers: load {r['load_s_mean']:.2f}s  "
+                  f"heap {r['anon_mb_mean']:.0f}MB each  pss total {r['pss_mb_total']:.0f}MB")
+
+    common.write_report(args.out, {"benchmark": "snapshot_workers", "chunks": args.chunks, "dim": args.dim, "layouts": layouts})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Memory and runtime of the synthetic data frame path: default pandas dtypes with
+row-by-row cleaning vs compact dtypes with per-distinct-value cleaning.
+
+    python benchmarks/synthetic_frames.py               # 1M rows
+    python benchmarks/synthetic_frames.py --rows 5000000
+
+Each mode runs in a fresh subprocess. The raw frame stands in for CTGAN output
+(see offline.FakeSynthesizer) and is built before measuring starts; the peak
+reported is what post-processing and validation allocate on top of it
+(tracemalloc, which numpy and pandas report to), plus the process peak RSS.
+Needs sdv installed because data_generator imports it.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import common
+
+
+def run_one(rows, compact):
+    # child process
+    import contextlib
+    import io
+
+    import data_generator as dg
+    from offline import FakeSynthesizer
+
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    out = {}
+    tracemalloc.start()
+
+    with quiet:
+        t = time.perf_counter()
+        seed = dg.build_seed_dataset(sample_size=rows, compact=compact)
+        out["seed_seconds"] = time.perf_counter() - t
+        out["seed_frame_mb"] = seed.memory_usage(deep=True).sum() / 2**20
+        out["seed_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+
+        raw = FakeSynthesizer(dg.build_seed_dataset(sample_size=5000, compact=False)).sample(rows)
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+
+        t = time.perf_counter()
+        df = dg.post_process_synthetic_data(raw, compact=compact)
+        out["post_process_seconds"] = time.perf_counter() - t
+        out["frame_mb"] = df.memory_usage(deep=True).sum() / 2**20
+
+        t = time.perf_counter()
+        dg.validate_synthetic_data(seed, df)
+        out["validate_seconds"] = time.perf_counter() - t
+
+    out["peak_above_raw_mb"] = (tracemalloc.get_traced_memory()[1] - base) / 2**20
+    out["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(out))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--out", default="benchmarks/results/synthetic_frames.json")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_one(int(args.child[0]), args.child[1] == "1")
+        return
+
+    modes = {}
+    for name, compact in (("default_dtypes", False), ("compact", True)):
+        proc = subprocess.run([sys.executable, __file__, "--child", str(args.rows), "1" if compact else "0"],
+                              capture_output=True, text=True, check=True)
+        modes[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+        m = modes[name]
+        print(f"{name:15} post-process {m['post_process_seconds']:6.2f}s  validate {m['validate_seconds']:5.2f}s  "
+              f"frame {m['frame_mb']:6.1f}MB  peak +{m['peak_above_raw_mb']:6.1f}MB  rss {m['peak_rss_mb']:6.0f}MB")
+
+    common.write_report(args.out, {"benchmark": "synthetic_frames", "rows": args.rows, "modes": modes})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Parquet storage for the synthetic dataset and the knowledge records.
+
+Files keep their column types (int8 counts, float32 vitals, dictionary-encoded
+categories), are written in row groups so they can be read back a group or a
+batch at a time, and are opened memory-mapped so only the projected columns of
+the groups actually read are paged in. CSV and plain text stay available as
+export formats; callers pick the format from the file extension.
+"""
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from embedding_store import chunk_id
+
+ROW_GROUP_ROWS = 100_000
+
+# what a knowledge record says about the rows it was generated from; the
+# sentence template only depends on these, so they are the same for every
+# source row of a record
+KNOWLEDGE_SCHEMA = pa.schema([
+    # embedding_store.chunk_id(content): the id of the chunk in the knowledge table and in snapshots
+    ("id", pa.int64()),
+    ("content", pa.string()),
+    ("count", pa.int32()),
+    ("row_ids", pa.list_(pa.int64())),
+    ("age", pa.int8()),
+    ("low_education", pa.bool_()),
+    ("few_anc_visits", pa.bool_()),
+    # only set when few_anc_visits, the one case where the text states the number
+    ("anc_visits", pa.int8()),
+    ("high_bp", pa.bool_()),
+    ("high_risk", pa.bool_()),
+])
+KNOWLEDGE_META = ["age", "low_education", "few_anc_visits", "anc_visits", "high_bp", "high_risk"]
+
+
+def is_parquet(path):
+    return str(path).endswith(".parquet")
+
+
+def file_metadata(path):
+    """the key/value metadata written with write_frame/KnowledgeWriter, decoded"""
+    raw = pq.read_schema(path, memory_map=True).metadata or {}
+    return {k.decode(): json.loads(v) for k, v in raw.items() if not k.startswith(b"pandas")}
+
+
+def num_rows(path):
+    return pq.ParquetFile(path, memory_map=True).metadata.num_rows
+
+
+def _with_metadata(schema, metadata):
+    if not metadata:
+        return schema
+    return schema.with_metadata({**(schema.metadata or {}), **{k: json.dumps(v) for k, v in metadata.items()}})
+
+
+class FrameWriter:
+    """
+    appends pandas frames to one Parquet file, each write becoming row groups
+    of at most row_group_rows; the schema is taken from the first frame
+    """
+
+    def __init__(self, path, metadata=None, row_group_rows=ROW_GROUP_ROWS):
+        self.path = path
+        self.metadata = metadata
+        self.row_group_rows = row_group_rows
+        self.rows = 0
+        self._writer = None
+
+    def write(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, _with_metadata(table.schema, self.metadata))
+        self._writer.write_table(table.cast(self._writer.schema), row_group_size=self.row_group_rows)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def write_frame(df, path, metadata=None, row_group_rows=ROW_GROUP_ROWS):
+    with FrameWriter(path, metadata, row_group_rows) as writer:
+        writer.write(df)
+
+
+def iter_frames(path, columns=None, batch_rows=ROW_GROUP_ROWS):
+    """pandas frames of at most batch_rows rows, with only `columns` read from disk"""
+    pf = pq.ParquetFile(path, memory_map=True)
+    for batch in pf.iter_batches(batch_size=batch_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+def read_row_groups(path, row_groups, columns=None):
+    pf = pq.ParquetFile(path, memory_map=True)
+    return pf.read_row_groups(row_groups, columns=columns).to_pandas()
+
+
+def num_row_groups(path):
+    return pq.ParquetFile(path, memory_map=True).num_row_groups
+
+
+class KnowledgeWriter:
+    """streams knowledge records (dicts with content, count, row_ids and the KNOWLEDGE_META fields)"""
+
+    def __init__(self, path, metadata=None, row_group_rows=ROW_GROUP_ROWS):
+        self.row_group_rows = row_group_rows
+        self._writer = pq.ParquetWriter(path, _with_metadata(KNOWLEDGE_SCHEMA, metadata))
+        self._buffer = []
+        self.written = 0
+
+    def write(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.row_group_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        columns = {name: [] for name in KNOWLEDGE_SCHEMA.names}
+        for rec in self._buffer:
+            meta = rec.get("meta") or {}
+            columns["id"].append(chunk_id(rec["content"]))
+            columns["content"].append(rec["content"])
+            columns["count"].append(rec.get("count", 1))
+            columns["row_ids"].append(rec.get("row_ids", []))
+            for name in KNOWLEDGE_META:
+                columns[name].append(meta.get(name))
+        self._writer.write_table(pa.table(columns, schema=KNOWLEDGE_SCHEMA))
+        self.written += len(self._buffer)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_knowledge(path, columns=None):
+    """the knowledge records as a memory-mapped Arrow table; slice it to read a batch"""
+    return pq.read_table(path, columns=columns, memory_map=True)
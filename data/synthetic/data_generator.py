@@ -1,13 +1,121 @@
 import pandas as pd
 import numpy as np
+import argparse
+import hashlib
+import io
+import json
 import os
+import time
 import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import sdv
 from sdv.single_table import CTGANSynthesizer
 from sdv.metadata import SingleTableMetadata
+import columnar
+from streaming_stats import CategoryCounts, CoMoments, HistogramSketch, Moments
 
 warnings.filterwarnings('ignore')
 
-def build_seed_dataset(sample_size=5000):
+# Trained synthesizers are cached here, one file per seed data + hyperparameter combination
+MODEL_DIR = 'data/synthetic/models'
+OUTPUT_PATH = 'data/synthetic/synthetic_bdhs_10k.parquet'
+
+# Rows sampled per worker task when generating large datasets in chunks
+CHUNK_ROWS = 100_000
+
+# Compact column types. Counts and IDs fit in int8, binary flags are stored as
+# int8 0/1 (so CSV output and means are unchanged), vitals as float32 and the
+# two text columns as categoricals. A 1M-row frame drops from ~225 MB to ~27 MB.
+WEALTH_CATEGORIES = ['poorest', 'poorer', 'middle', 'richer', 'richest']
+RESIDENCE_TYPES = ['urban', 'rural']
+BINARY_COLUMNS = [
+    'skilled_delivery', 'facility_delivery', 'complications',
+    'preeclampsia_risk', 'gdm_risk', 'high_risk'
+]
+COMPACT_DTYPES = {
+    'age': np.int8,
+    'education_years': np.int8,
+    'anc_visits': np.int8,
+    'district_id': np.int8,
+    'sys_bp': np.float32,
+    'dia_bp': np.float32,
+    'heart_rate': np.float32,
+    'glucose': np.float32,
+    'wealth_quintile': pd.CategoricalDtype(WEALTH_CATEGORIES, ordered=True),
+    'urban_rural': pd.CategoricalDtype(RESIDENCE_TYPES),
+    **{column: np.int8 for column in BINARY_COLUMNS},
+}
+
+# Valid range of every numeric column; post-processing clips to these and the
+# streaming validator bins over them
+VALUE_BOUNDS = {
+    'age': (15, 49), 'education_years': (0, 12), 'anc_visits': (0, 10), 'district_id': (1, 64),
+    'sys_bp': (80, 200), 'dia_bp': (50, 140), 'heart_rate': (50, 120), 'glucose': (60, 200),
+}
+
+# CTGAN hyperparameters. These control the tradeoff between training time and quality,
+# and they are part of the model cache key: changing any of them retrains the model.
+CTGAN_PARAMS = {
+    # epochs controls how many times the model sees the entire dataset
+    # More epochs = better learning but longer training time
+    # 300 is a sweet spot for datasets of this size
+    'epochs': 300,
+
+    # batch_size controls how many records are processed together
+    # Larger batches train faster but use more memory
+    'batch_size': 500,
+
+    # We disable verbose output to avoid cluttering the console
+    'verbose': False,
+
+    # Disable GPU even if available, as CTGAN can be unstable on GPU
+    # for small-medium datasets. CPU training is more reliable.
+    'cuda': False,
+
+    # generator_dim and discriminator_dim control model complexity
+    # We use smaller networks for faster training on this dataset size
+    'generator_dim': (256, 256),
+    'discriminator_dim': (256, 256),
+
+    # Learning rate for the neural networks
+    # Default 2e-4 works well for most tabular data
+    'generator_lr': 2e-4,
+    'discriminator_lr': 2e-4,
+}
+
+def compact_dtypes(data):
+    """
+    Casts the columns of a seed or synthetic frame to COMPACT_DTYPES in place.
+    
+    Values must already be in range (clipped and rounded); this only changes
+    how they are stored.
+    
+    Parameters:
+        data (pd.DataFrame): Frame with the BDHS columns
+    
+    Returns:
+        pd.DataFrame: The same frame
+    """
+    for column, dtype in COMPACT_DTYPES.items():
+        if column in data.columns and data[column].dtype != dtype:
+            data[column] = data[column].astype(dtype)
+    return data
+
+
+def choose_category(categories, sample_size, probabilities, compact):
+    """
+    np.random.choice over category labels. With compact=True the draws are kept
+    as categorical codes instead of a column of Python strings; the global random
+    stream is consumed the same way, so both give the same values.
+    """
+    if not compact:
+        return np.random.choice(categories, sample_size, p=probabilities)
+    codes = np.random.choice(len(categories), sample_size, p=probabilities)
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def build_seed_dataset(sample_size=5000, compact=True):
     np.random.seed(42)
     print("Building seed dataset with BDHS 2017-18 distributions...")
     
@@ -53,11 +161,11 @@ def build_seed_dataset(sample_size=5000):
         'education_years': np.random.choice(education_years, sample_size, 
                                            p=education_probabilities),
         
-        'wealth_quintile': np.random.choice(wealth_categories, sample_size, 
-                                           p=wealth_probabilities),
+        'wealth_quintile': choose_category(wealth_categories, sample_size,
+                                           wealth_probabilities, compact),
         
-        'urban_rural': np.random.choice(residence_types, sample_size, 
-                                       p=residence_probabilities),
+        'urban_rural': choose_category(residence_types, sample_size,
+                                       residence_probabilities, compact),
         
         'anc_visits': np.random.choice(anc_visit_counts, sample_size, 
                                       p=anc_probabilities),
@@ -134,6 +242,9 @@ def build_seed_dataset(sample_size=5000):
     for column in continuous_columns:
         seed_data[column] = seed_data[column].round()
     
+    if compact:
+        compact_dtypes(seed_data)
+    
     print(f"✓ Seed dataset created: {len(seed_data)} records")
     print(f"  - Variables: {len(seed_data.columns)}")
     print(f"  - High-risk pregnancies: {seed_data['high_risk'].sum()} ({seed_data['high_risk'].mean():.1%})")
@@ -141,7 +252,7 @@ def build_seed_dataset(sample_size=5000):
     return seed_data
 
 
-def train_synthetic_generator(training_data):
+def train_synthetic_generator(training_data, params=None):
     """
     Trains a CTGAN model to learn the patterns in our seed data.
     
@@ -153,13 +264,23 @@ def train_synthetic_generator(training_data):
     
     Parameters:
         training_data (pd.DataFrame): The seed dataset to learn from
+        params (dict): CTGAN hyperparameters, defaults to CTGAN_PARAMS
     
     Returns:
         CTGANSynthesizer: Trained model ready to generate synthetic data
     """
     
     print("\nInitializing CTGAN synthesizer...")
-    
+
+    # SDV does not accept pandas categoricals, so those columns are handed over as
+    # plain strings (the seed set is small; the rest of the pipeline keeps the compact types)
+    categorical_columns = [
+        column for column in training_data.columns
+        if isinstance(training_data[column].dtype, pd.CategoricalDtype)
+    ]
+    if categorical_columns:
+        training_data = training_data.astype({column: object for column in categorical_columns})
+
     # First, we need to tell SDV about our data structure using metadata
     # This helps the model understand which columns are categorical vs continuous
     metadata = SingleTableMetadata()
@@ -171,36 +292,8 @@ def train_synthetic_generator(training_data):
         print(f"  - {column_name}: {column_info['sdtype']}")
     
     # Initialize the CTGAN synthesizer with carefully chosen hyperparameters
-    # These control the tradeoff between training time and quality
-    synthesizer = CTGANSynthesizer(
-        metadata=metadata,
-        
-        # epochs controls how many times the model sees the entire dataset
-        # More epochs = better learning but longer training time
-        # 300 is a sweet spot for datasets of this size
-        epochs=300,
-        
-        # batch_size controls how many records are processed together
-        # Larger batches train faster but use more memory
-        batch_size=500,
-        
-        # We disable verbose output to avoid cluttering the console
-        verbose=False,
-        
-        # Disable GPU even if available, as CTGAN can be unstable on GPU
-        # for small-medium datasets. CPU training is more reliable.
-        cuda=False,
-        
-        # generator_dim and discriminator_dim control model complexity
-        # We use smaller networks for faster training on this dataset size
-        generator_dim=(256, 256),
-        discriminator_dim=(256, 256),
-        
-        # Learning rate for the neural networks
-        # Default 2e-4 works well for most tabular data
-        generator_lr=2e-4,
-        discriminator_lr=2e-4
-    )
+    # (see CTGAN_PARAMS for what each of them controls)
+    synthesizer = CTGANSynthesizer(metadata=metadata, **(params or CTGAN_PARAMS))
     
     print(f"\nTraining CTGAN model on {len(training_data)} records...")
     print("This typically takes 3-5 minutes on a modern CPU...")
@@ -215,6 +308,65 @@ def train_synthetic_generator(training_data):
     return synthesizer
 
 
+def model_cache_key(training_data, params):
+    """
+    Builds the cache key for a trained synthesizer.
+    
+    The key covers everything that changes what the model learns: the seed data
+    itself (hashed row by row, so edits to build_seed_dataset are picked up too),
+    the hyperparameters and the SDV version that pickled the model.
+    
+    Parameters:
+        training_data (pd.DataFrame): The seed dataset the model is trained on
+        params (dict): CTGAN hyperparameters
+    
+    Returns:
+        str: A short hex digest usable in a file name
+    """
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(training_data, index=False).values.tobytes())
+    digest.update(json.dumps({'params': params, 'columns': list(training_data.columns),
+                              'sdv': sdv.__version__}, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def load_or_train_synthesizer(training_data, params=None, model_dir=MODEL_DIR, retrain=False):
+    """
+    Returns a trained synthesizer, reusing a cached one when the seed data and
+    hyperparameters match a previous run.
+    
+    Training takes minutes of CPU while loading a saved model takes about a
+    second, so reruns (for example to sample a different number of rows) skip
+    training entirely.
+    
+    Parameters:
+        training_data (pd.DataFrame): The seed dataset to learn from
+        params (dict): Hyperparameter overrides on top of CTGAN_PARAMS
+        model_dir (str): Where trained models are kept
+        retrain (bool): Train again even if a cached model exists
+    
+    Returns:
+        tuple: (CTGANSynthesizer, path of the saved model)
+    """
+    params = {**CTGAN_PARAMS, **(params or {})}
+    model_path = os.path.join(model_dir, f"ctgan-{model_cache_key(training_data, params)}.pkl")
+    
+    if os.path.exists(model_path) and not retrain:
+        print(f"\n✓ Loaded cached CTGAN model: {model_path}")
+        return CTGANSynthesizer.load(model_path), model_path
+    
+    synthesizer = train_synthetic_generator(training_data, params)
+    
+    # Save under a temporary name first so an interrupted save never leaves
+    # a truncated model behind that a later run would try to load
+    os.makedirs(model_dir, exist_ok=True)
+    synthesizer.save(model_path + '.tmp')
+    os.replace(model_path + '.tmp', model_path)
+    print(f"✓ Model cached at: {model_path}")
+    
+    return synthesizer, model_path
+
+
 def generate_synthetic_data(synthesizer, num_records=10000):
     """
     Uses the trained model to generate brand new synthetic records.
@@ -239,6 +391,70 @@ def generate_synthetic_data(synthesizer, num_records=10000):
     print("✓ Synthetic data generated!")
     print("\nApplying post-processing to ensure data quality...")
     
+    synthetic_data = post_process_synthetic_data(synthetic_data)
+    
+    print("✓ Post-processing complete!")
+    
+    return synthetic_data
+
+
+def clean_wealth_quintile(value):
+    value_str = str(value).lower().strip()
+    if 'poorest' in value_str and 'poorer' not in value_str:
+        return 'poorest'
+    elif 'poorer' in value_str:
+        return 'poorer'
+    elif 'middle' in value_str:
+        return 'middle'
+    elif 'richer' in value_str:
+        return 'richer'
+    else:
+        return 'richest'
+
+
+def clean_residence(value):
+    value_str = str(value).lower().strip()
+    return 'urban' if 'urban' in value_str else 'rural'
+
+
+def clean_categorical(values, clean, dtype):
+    """
+    Applies a per-value cleaning function to a whole column at once.
+    
+    CTGAN only ever produces a handful of distinct strings per column, so each
+    distinct value is cleaned once and the result is spread back to every row
+    through its factorized code. This is exactly equivalent to values.apply(clean)
+    but touches Python only len(uniques) times instead of once per row.
+    
+    Parameters:
+        values (pd.Series): Raw column
+        clean (callable): Maps one raw value to a valid category
+        dtype (pd.CategoricalDtype): Target categories
+    
+    Returns:
+        pd.Categorical: The cleaned column
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    cleaned = dtype.categories.get_indexer([clean(value) for value in uniques])
+    return pd.Categorical.from_codes(cleaned[codes], dtype=dtype)
+
+
+def post_process_synthetic_data(synthetic_data, compact=True):
+    """
+    Cleans raw CTGAN output into valid records.
+    
+    Parameters:
+        synthetic_data (pd.DataFrame): Rows as sampled from the synthesizer
+        compact (bool): Store the result with COMPACT_DTYPES and clean the text
+            columns per distinct value. False keeps the original row-by-row
+            cleaning and int64/float64/object columns.
+    
+    Returns:
+        pd.DataFrame: The same rows with values clipped, rounded and normalized
+    """
+    if compact:
+        return _post_process_compact(synthetic_data)
+    
     # Even though CTGAN is good, it sometimes generates values slightly outside
     # the valid range. We need to clean these up to ensure data quality.
     
@@ -268,49 +484,333 @@ def generate_synthetic_data(synthesizer, num_records=10000):
     
     # Binary columns must be exactly 0 or 1 (sometimes CTGAN generates 0.1 or 0.9)
     # We use 0.5 as the threshold: anything above becomes 1, anything below becomes 0
-    binary_columns = [
-        'skilled_delivery', 'facility_delivery', 'complications',
-        'preeclampsia_risk', 'gdm_risk', 'high_risk'
-    ]
-    
-    for column in binary_columns:
+    for column in BINARY_COLUMNS:
         synthetic_data[column] = (synthetic_data[column] > 0.5).astype(int)
     
     # Categorical columns need to be cleaned because CTGAN might generate
     # slight variations like "richest " (with a space) or "Richest" (capitalized)
     
     # For wealth quintile, we map any variations back to standard categories
-    def clean_wealth_quintile(value):
-        value_str = str(value).lower().strip()
-        if 'poorest' in value_str and 'poorer' not in value_str:
-            return 'poorest'
-        elif 'poorer' in value_str:
-            return 'poorer'
-        elif 'middle' in value_str:
-            return 'middle'
-        elif 'richer' in value_str:
-            return 'richer'
-        else:
-            return 'richest'
-    
     synthetic_data['wealth_quintile'] = (
         synthetic_data['wealth_quintile'].apply(clean_wealth_quintile)
     )
     
     # For urban/rural, ensure only these two values exist
-    def clean_residence(value):
-        value_str = str(value).lower().strip()
-        return 'urban' if 'urban' in value_str else 'rural'
-    
     synthetic_data['urban_rural'] = (
         synthetic_data['urban_rural'].apply(clean_residence)
     )
     
-    print("✓ Post-processing complete!")
+    return synthetic_data
+
+
+def _post_process_compact(synthetic_data):
+    # Same rules as above, written straight into the compact dtypes so no
+    # intermediate int64/float64 column is kept around
+    for column, (low, high) in VALUE_BOUNDS.items():
+        values = synthetic_data[column].to_numpy(dtype=np.float64)
+        synthetic_data[column] = np.clip(values, low, high).round().astype(COMPACT_DTYPES[column])
+    
+    for column in BINARY_COLUMNS:
+        synthetic_data[column] = (synthetic_data[column].to_numpy() > 0.5).astype(np.int8)
+    
+    synthetic_data['wealth_quintile'] = clean_categorical(
+        synthetic_data['wealth_quintile'], clean_wealth_quintile, COMPACT_DTYPES['wealth_quintile']
+    )
+    synthetic_data['urban_rural'] = clean_categorical(
+        synthetic_data['urban_rural'], clean_residence, COMPACT_DTYPES['urban_rural']
+    )
     
     return synthetic_data
 
 
+# Each worker process loads the saved model once and reuses it for all its chunks
+_worker_synthesizer = None
+
+
+def _init_sampling_worker(model_path):
+    global _worker_synthesizer
+    warnings.filterwarnings('ignore')
+    _worker_synthesizer = CTGANSynthesizer.load(model_path)
+
+
+def chunk_seed(seed, chunk_index):
+    """Independent, reproducible seed for one chunk, whichever worker samples it."""
+    return int(np.random.SeedSequence([seed, chunk_index]).generate_state(1)[0])
+
+
+def _sample_chunk(task):
+    chunk_index, num_rows, seed = task
+    synthesizer = _worker_synthesizer
+    
+    # Reset and reseed before every chunk so its rows depend only on its seed,
+    # not on which chunks this worker happened to sample before it
+    synthesizer.reset_sampling()
+    synthesizer._set_random_state(seed)
+    np.random.seed(seed)
+    
+    chunk = post_process_synthetic_data(synthesizer.sample(num_rows=num_rows))
+    
+    # Validation statistics are computed here too, so the parent only merges them
+    return chunk, ValidationStats().update(chunk)
+
+
+def sample_in_chunks(model_path, num_records, output_path, chunk_rows=CHUNK_ROWS,
+                     workers=None, seed=0, on_chunk=None):
+    """
+    Generates a large synthetic dataset in chunks across a process pool and
+    streams it to disk as the chunks arrive: to Parquet, one or more row
+    groups per chunk, when output_path ends in .parquet, otherwise to CSV.
+    
+    Every chunk gets its own seed derived from `seed` and its position, and
+    chunks are written in order, so the output is identical for any number of
+    workers. Only a few chunks per worker are ever in memory, which keeps
+    10M+ row runs at a flat memory footprint. Each worker also summarizes its
+    chunks into ValidationStats, merged here into stats for the whole dataset.
+    
+    Parameters:
+        model_path (str): Saved synthesizer, see load_or_train_synthesizer
+        num_records (int): How many synthetic records to generate
+        output_path (str): Parquet or CSV file to write
+        chunk_rows (int): Rows per chunk
+        workers (int): Worker processes, defaults to the number of CPUs
+        seed (int): Base seed for the whole run
+        on_chunk (callable): Called with every post-processed chunk in order
+    
+    Returns:
+        tuple: (number of records written, ValidationStats of all of them)
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = iter([
+        (index, min(chunk_rows, num_records - start), chunk_seed(seed, index))
+        for index, start in enumerate(range(0, num_records, chunk_rows))
+    ])
+    total_chunks = (num_records + chunk_rows - 1) // chunk_rows
+    
+    print(f"\nGenerating {num_records:,} synthetic records in {total_chunks} chunks "
+          f"of {chunk_rows:,} on {workers} workers...")
+    
+    output_directory = os.path.dirname(output_path)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    
+    written = 0
+    stats = ValidationStats()
+    start_time = time.monotonic()
+    tmp_path = output_path + '.tmp'
+    if columnar.is_parquet(output_path):
+        out = columnar.FrameWriter(tmp_path, {'seed': seed, 'chunk_rows': chunk_rows}, row_group_rows=chunk_rows)
+        write_chunk = out.write
+    else:
+        out = open(tmp_path, 'w', newline='')
+        write_chunk = lambda chunk: chunk.to_csv(out, header=(written == 0), index=False)
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_sampling_worker,
+                             initargs=(model_path,)) as pool, out:
+        # Keep two chunks per worker in flight: enough to stay busy while the
+        # previous chunk is written, without finished chunks piling up in memory
+        pending = deque(pool.submit(_sample_chunk, task) for _, task in zip(range(2 * workers), tasks))
+        
+        while pending:
+            chunk, chunk_stats = pending.popleft().result()
+            stats.merge(chunk_stats)
+            task = next(tasks, None)
+            if task is not None:
+                pending.append(pool.submit(_sample_chunk, task))
+            
+            write_chunk(chunk)
+            written += len(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+            
+            elapsed = time.monotonic() - start_time
+            print(f"  {written:,}/{num_records:,} records ({written / elapsed:,.0f} rows/s)")
+    
+    os.replace(tmp_path, output_path)
+    print(f"✓ Synthetic data streamed to: {output_path}")
+    
+    return written, stats
+
+
+def wealth_numeric(wealth):
+    """Wealth quintile as 1 (poorest) to 5 (richest), for object or categorical columns."""
+    if isinstance(wealth.dtype, pd.CategoricalDtype) and list(wealth.cat.categories) == WEALTH_CATEGORIES:
+        return (wealth.cat.codes + 1).where(wealth.cat.codes >= 0)
+    return wealth.map({quintile: rank for rank, quintile in enumerate(WEALTH_CATEGORIES, 1)})
+
+
+def wealth_access_frame(data):
+    return pd.DataFrame({
+        'wealth_numeric': wealth_numeric(data['wealth_quintile']).to_numpy(np.float64),
+        'anc_visits': data['anc_visits'].to_numpy(np.float64),
+        'skilled_delivery': data['skilled_delivery'].to_numpy(np.float64),
+    })
+
+
+class ValidationStats:
+    """
+    Everything the validation report needs, as mergeable one-pass accumulators.
+    
+    A dataset can be fed chunk by chunk with update(), and stats computed for
+    different parts of it (in different processes, say) combine with merge()
+    into exactly the stats of the whole, so datasets far larger than memory
+    can be validated.
+    """
+    
+    RATE_COLUMNS = ['skilled_delivery', 'facility_delivery', 'complications', 'high_risk']
+    CLINICAL_COLUMNS = ['sys_bp', 'dia_bp', 'heart_rate', 'glucose']
+    DISTRIBUTION_COLUMNS = ['age', 'education_years', 'anc_visits', 'sys_bp', 'dia_bp', 'heart_rate', 'glucose']
+    # every column update() reads, so columnar files can be read projected
+    COLUMNS = sorted(set(RATE_COLUMNS + CLINICAL_COLUMNS + DISTRIBUTION_COLUMNS) | {'wealth_quintile', 'urban_rural'})
+    
+    def __init__(self):
+        self.rows = 0
+        self.anc_4plus = Moments(1)
+        self.rates = Moments(len(self.RATE_COLUMNS))
+        self.clinical = Moments(len(self.CLINICAL_COLUMNS))
+        self.wealth = CategoryCounts()
+        self.residence = CategoryCounts()
+        # wealth rank, ANC visits, skilled delivery
+        self.access = CoMoments(3)
+        self.distributions = {
+            column: HistogramSketch(*VALUE_BOUNDS[column]) for column in self.DISTRIBUTION_COLUMNS
+        }
+    
+    def update(self, data):
+        self.rows += len(data)
+        self.anc_4plus.update((data['anc_visits'] >= 4).to_numpy(np.float64))
+        self.rates.update(data[self.RATE_COLUMNS].to_numpy(np.float64))
+        self.clinical.update(data[self.CLINICAL_COLUMNS].to_numpy(np.float64))
+        self.wealth.update(data['wealth_quintile'])
+        self.residence.update(data['urban_rural'])
+        self.access.update(wealth_access_frame(data).to_numpy())
+        for column, sketch in self.distributions.items():
+            sketch.update(data[column].to_numpy(np.float64))
+        return self
+    
+    def merge(self, other):
+        self.rows += other.rows
+        for name in ('anc_4plus', 'rates', 'clinical', 'wealth', 'residence', 'access'):
+            getattr(self, name).merge(getattr(other, name))
+        for column, sketch in self.distributions.items():
+            sketch.merge(other.distributions[column])
+        return self
+    
+    def indicators(self):
+        rates = dict(zip(self.RATE_COLUMNS, self.rates.mean))
+        return {
+            'ANC 4+ visits': self.anc_4plus.mean[0],
+            'Skilled delivery': rates['skilled_delivery'],
+            'Facility delivery': rates['facility_delivery'],
+            'Complications': rates['complications'],
+            'High-risk pregnancy': rates['high_risk'],
+        }
+
+
+def _csv_blocks(path, block_bytes):
+    # byte ranges of roughly block_bytes, each starting at the beginning of a line
+    size = os.path.getsize(path)
+    blocks = []
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + block_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            blocks.append((start, end))
+            start = end
+    return header, blocks
+
+
+def _stats_for_block(task):
+    path, header, start, end, chunk_rows = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    stats = ValidationStats()
+    for chunk in pd.read_csv(io.BytesIO(header + data), chunksize=chunk_rows):
+        stats.update(chunk)
+    return stats
+
+
+def stats_from_csv(path, workers=None, block_bytes=64 * 2**20, chunk_rows=CHUNK_ROWS):
+    """
+    Computes ValidationStats for a CSV file of any size.
+    
+    The file is split into byte blocks at line boundaries. Each block is read
+    chunk by chunk by one of `workers` processes, and the partial stats are
+    merged, so memory use depends on the block size rather than the file size.
+    
+    Parameters:
+        path (str): CSV file written by save_synthetic_data or sample_in_chunks
+        workers (int): Worker processes, defaults to the number of CPUs
+        block_bytes (int): Bytes per worker task
+        chunk_rows (int): Rows parsed at a time inside a block
+    
+    Returns:
+        ValidationStats: Stats of every row in the file
+    """
+    header, blocks = _csv_blocks(path, block_bytes)
+    tasks = [(path, header, start, end, chunk_rows) for start, end in blocks]
+    workers = min(workers or os.cpu_count() or 1, max(1, len(tasks)))
+    
+    stats = ValidationStats()
+    if workers == 1:
+        for task in tasks:
+            stats.merge(_stats_for_block(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # merging is order independent, so partial stats are folded in as they come
+            for partial in pool.map(_stats_for_block, tasks):
+                stats.merge(partial)
+    return stats
+
+
+def _stats_for_row_groups(task):
+    path, row_groups = task
+    stats = ValidationStats()
+    for index in row_groups:
+        stats.update(columnar.read_row_groups(path, [index], columns=ValidationStats.COLUMNS))
+    return stats
+
+
+def stats_from_parquet(path, workers=None):
+    """
+    Computes ValidationStats for a Parquet file of any size.
+    
+    Row groups are dealt out to `workers` processes, which read them one at a
+    time from the memory-mapped file, and only the columns the validation
+    report uses. The partial stats are merged as for stats_from_csv.
+    
+    Parameters:
+        path (str): Parquet file written by save_synthetic_data or sample_in_chunks
+        workers (int): Worker processes, defaults to the number of CPUs
+    
+    Returns:
+        ValidationStats: Stats of every row in the file
+    """
+    groups = list(range(columnar.num_row_groups(path)))
+    workers = min(workers or os.cpu_count() or 1, max(1, len(groups)))
+    tasks = [(path, groups[i::workers]) for i in range(workers)]
+    
+    stats = ValidationStats()
+    if workers == 1:
+        for task in tasks:
+            stats.merge(_stats_for_row_groups(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for partial in pool.map(_stats_for_row_groups, tasks):
+                stats.merge(partial)
+    return stats
+
+
+def stats_from_file(path, workers=None):
+    """stats_from_parquet or stats_from_csv, by file extension"""
+    if columnar.is_parquet(path):
+        return stats_from_parquet(path, workers)
+    return stats_from_csv(path, workers)
+
+
 def validate_synthetic_data(real_data, synthetic_data):
     """
     Compares synthetic data against the original to verify quality.
@@ -319,10 +819,15 @@ def validate_synthetic_data(real_data, synthetic_data):
     while not being identical (which would defeat the privacy purpose).
     
     Parameters:
-        real_data (pd.DataFrame): Original seed data
-        synthetic_data (pd.DataFrame): Generated synthetic data
+        real_data (pd.DataFrame or ValidationStats): Original seed data
+        synthetic_data (pd.DataFrame or ValidationStats): Generated synthetic data,
+            or stats accumulated over data too large to hold in memory
     """
     
+    real = real_data if isinstance(real_data, ValidationStats) else ValidationStats().update(real_data)
+    synthetic = (synthetic_data if isinstance(synthetic_data, ValidationStats)
+                 else ValidationStats().update(synthetic_data))
+    
     print("\n" + "="*60)
     print("SYNTHETIC DATA QUALITY VALIDATION")
     print("="*60)
@@ -331,17 +836,11 @@ def validate_synthetic_data(real_data, synthetic_data):
     print("-" * 60)
     
     # Compare the main maternal health outcomes
-    indicators = {
-        'ANC 4+ visits': ('anc_visits', lambda x: (x >= 4).mean()),
-        'Skilled delivery': ('skilled_delivery', lambda x: x.mean()),
-        'Facility delivery': ('facility_delivery', lambda x: x.mean()),
-        'Complications': ('complications', lambda x: x.mean()),
-        'High-risk pregnancy': ('high_risk', lambda x: x.mean())
-    }
-    
-    for indicator_name, (column, func) in indicators.items():
-        real_value = func(real_data[column])
-        synthetic_value = func(synthetic_data[column])
+    real_indicators = real.indicators()
+    synthetic_indicators = synthetic.indicators()
+    
+    for indicator_name, real_value in real_indicators.items():
+        synthetic_value = synthetic_indicators[indicator_name]
         difference = abs(real_value - synthetic_value)
         
         print(f"{indicator_name:25} Real: {real_value:6.1%}  " +
@@ -353,58 +852,63 @@ def validate_synthetic_data(real_data, synthetic_data):
     
     # Verify wealth quintile distribution (should be ~20% each)
     print("\nWealth Quintile Distribution:")
-    for quintile in ['poorest', 'poorer', 'middle', 'richer', 'richest']:
-        real_pct = (real_data['wealth_quintile'] == quintile).mean()
-        synth_pct = (synthetic_data['wealth_quintile'] == quintile).mean()
+    for quintile in WEALTH_CATEGORIES:
+        real_pct = real.wealth.proportion(quintile)
+        synth_pct = synthetic.wealth.proportion(quintile)
         print(f"  {quintile:10} Real: {real_pct:5.1%}  Synthetic: {synth_pct:5.1%}")
     
     # Verify urban-rural split
     print("\nUrban-Rural Distribution:")
-    for residence in ['urban', 'rural']:
-        real_pct = (real_data['urban_rural'] == residence).mean()
-        synth_pct = (synthetic_data['urban_rural'] == residence).mean()
+    for residence in RESIDENCE_TYPES:
+        real_pct = real.residence.proportion(residence)
+        synth_pct = synthetic.residence.proportion(residence)
         print(f"  {residence:10} Real: {real_pct:5.1%}  Synthetic: {synth_pct:5.1%}")
     
     print("\n3. Clinical Measurements (Mean ± Std):")
     print("-" * 60)
     
-    clinical_vars = ['sys_bp', 'dia_bp', 'heart_rate', 'glucose']
-    for var in clinical_vars:
-        real_mean = real_data[var].mean()
-        real_std = real_data[var].std()
-        synth_mean = synthetic_data[var].mean()
-        synth_std = synthetic_data[var].std()
-        
-        print(f"{var:12} Real: {real_mean:6.1f}±{real_std:4.1f}  " +
-              f"Synthetic: {synth_mean:6.1f}±{synth_std:4.1f}")
+    real_std = real.clinical.std()
+    synth_std = synthetic.clinical.std()
+    for i, var in enumerate(ValidationStats.CLINICAL_COLUMNS):
+        print(f"{var:12} Real: {real.clinical.mean[i]:6.1f}±{real_std[i]:4.1f}  " +
+              f"Synthetic: {synthetic.clinical.mean[i]:6.1f}±{synth_std[i]:4.1f}")
     
     print("\n4. Correlation Preservation (Wealth vs Healthcare Access):")
     print("-" * 60)
     
     # Check if wealth-healthcare correlations are preserved
-    wealth_order = {'poorest': 1, 'poorer': 2, 'middle': 3, 'richer': 4, 'richest': 5}
-    real_data_copy = real_data.copy()
-    synthetic_data_copy = synthetic_data.copy()
+    # (rows: wealth rank, ANC visits, skilled delivery)
+    real_corr = real.access.corr()
+    synth_corr = synthetic.access.corr()
     
-    real_data_copy['wealth_numeric'] = real_data_copy['wealth_quintile'].map(wealth_order)
-    synthetic_data_copy['wealth_numeric'] = synthetic_data_copy['wealth_quintile'].map(wealth_order)
+    print(f"Wealth × ANC visits:      Real: {real_corr[0, 1]:+.3f}  " +
+          f"Synthetic: {synth_corr[0, 1]:+.3f}")
+    print(f"Wealth × Skilled delivery: Real: {real_corr[0, 2]:+.3f}  " +
+          f"Synthetic: {synth_corr[0, 2]:+.3f}")
     
-    real_corr = real_data_copy[['wealth_numeric', 'anc_visits', 'skilled_delivery']].corr()
-    synth_corr = synthetic_data_copy[['wealth_numeric', 'anc_visits', 'skilled_delivery']].corr()
+    print("\n5. Distribution Distance (Kolmogorov-Smirnov):")
+    print("-" * 60)
     
-    print(f"Wealth × ANC visits:      Real: {real_corr.loc['wealth_numeric', 'anc_visits']:+.3f}  " +
-          f"Synthetic: {synth_corr.loc['wealth_numeric', 'anc_visits']:+.3f}")
-    print(f"Wealth × Skilled delivery: Real: {real_corr.loc['wealth_numeric', 'skilled_delivery']:+.3f}  " +
-          f"Synthetic: {synth_corr.loc['wealth_numeric', 'skilled_delivery']:+.3f}")
+    # The largest gap between the real and synthetic CDFs: 0 means identical
+    # distributions, values above ~0.1 deserve a closer look
+    for var in ValidationStats.DISTRIBUTION_COLUMNS:
+        real_sketch = real.distributions[var]
+        synth_sketch = synthetic.distributions[var]
+        print(f"{var:16} KS: {real_sketch.ks(synth_sketch):.3f}  " +
+              f"Median Real: {real_sketch.quantile(0.5):5.0f}  Synthetic: {synth_sketch.quantile(0.5):5.0f}")
     
     print("\n" + "="*60)
     print("✓ Validation complete!")
     print("="*60)
 
 
-def save_synthetic_data(synthetic_data, output_path='data/synthetic/synthetic_bdhs_10k.csv'):
+def save_synthetic_data(synthetic_data, output_path=OUTPUT_PATH):
     """
-    Saves the synthetic dataset to a CSV file.
+    Saves the synthetic dataset to a Parquet file, or to CSV when
+    output_path does not end in .parquet.
+    
+    Parquet keeps the compact column types, so reading the file back gives
+    the same frame without re-parsing or re-inferring anything.
     
     Parameters:
         synthetic_data (pd.DataFrame): The synthetic data to save
@@ -417,8 +921,10 @@ def save_synthetic_data(synthetic_data, output_path='data/synthetic/synthetic_bd
         os.makedirs(output_directory)
         print(f"Created directory: {output_directory}")
     
-    # Save to CSV
-    synthetic_data.to_csv(output_path, index=False)
+    if columnar.is_parquet(output_path):
+        columnar.write_frame(synthetic_data, output_path)
+    else:
+        synthetic_data.to_csv(output_path, index=False)
     
     file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
     print(f"\n✓ Synthetic data saved to: {output_path}")
@@ -432,6 +938,21 @@ def main():
     Main execution function that orchestrates the entire synthetic data generation pipeline.
     """
     
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000, help='synthetic records to generate')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='.parquet, or .csv to export CSV')
+    parser.add_argument('--seed-size', type=int, default=5000, help='records in the seed dataset')
+    parser.add_argument('--epochs', type=int, default=CTGAN_PARAMS['epochs'])
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--retrain', action='store_true', help='ignore a cached model')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help='above this many rows, sample in parallel chunks and stream to disk')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0, help='base seed for chunked sampling')
+    parser.add_argument('--validate', metavar='FILE',
+                        help='only validate an existing synthetic Parquet or CSV file against the seed data, streaming through it')
+    args = parser.parse_args()
+    
     print("="*60)
     print("SYNTHETIC BDHS DATA GENERATOR")
     print("Bangladesh Demographic and Health Survey 2017-18")
@@ -440,19 +961,34 @@ def main():
     print("that maintains the statistical properties of the real BDHS survey.\n")
     
     # Step 1: Create realistic seed data
-    seed_data = build_seed_dataset(sample_size=5000)
-    
-    # Step 2: Train the CTGAN model
-    trained_model = train_synthetic_generator(seed_data)
+    seed_data = build_seed_dataset(sample_size=args.seed_size)
     
-    # Step 3: Generate synthetic records
-    synthetic_records = generate_synthetic_data(trained_model, num_records=10000)
+    if args.validate:
+        print(f"\nValidating {args.validate} in chunks...")
+        validate_synthetic_data(seed_data, stats_from_file(args.validate, args.workers))
+        return
     
-    # Step 4: Validate the synthetic data quality
-    validate_synthetic_data(seed_data, synthetic_records)
+    # Step 2: Train the CTGAN model, or load it if this exact setup was trained before
+    trained_model, model_path = load_or_train_synthesizer(
+        seed_data, {'epochs': args.epochs}, args.model_dir, args.retrain
+    )
     
-    # Step 5: Save the results
-    save_synthetic_data(synthetic_records)
+    if args.rows <= args.chunk_rows:
+        # Step 3: Generate synthetic records
+        synthetic_records = generate_synthetic_data(trained_model, num_records=args.rows)
+        
+        # Step 4: Validate the synthetic data quality
+        validate_synthetic_data(seed_data, synthetic_records)
+        
+        # Step 5: Save the results
+        save_synthetic_data(synthetic_records, args.output)
+    else:
+        # Steps 3-5 for large datasets: sample in parallel, stream every chunk to disk.
+        # The full dataset never exists in memory; it is validated from the
+        # statistics the workers accumulate chunk by chunk.
+        _, synthetic_stats = sample_in_chunks(model_path, args.rows, args.output, args.chunk_rows,
+                                              args.workers, args.seed)
+        validate_synthetic_data(seed_data, synthetic_stats)
     
     print("\n" + "="*60)
     print("GENERATION COMPLETE!")
@@ -461,7 +997,7 @@ def main():
     print("without privacy concerns. The data preserves key statistical")
     print("relationships from BDHS 2017-18 while representing no real individuals.")
     print("\nNext steps:")
-    print("  1. Load the CSV into your analysis environment")
+    print("  1. Load the dataset into your analysis environment")
     print("  2. Build predictive models for maternal health outcomes")
     print("  3. Test interventions and policy scenarios")
     print("  4. Share findings without privacy restrictions")
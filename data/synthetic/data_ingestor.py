@@ -2,60 +2,201 @@ from supabase import create_client
 # deprecated, change this
 from google import genai
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from dedup import read_chunks
+from embedding_store import EmbeddingStore, chunk_id
+import argparse
 import os
+import queue
+import random
+import threading
 import time
 
 load_dotenv()
 
 
 BATCH_SIZE = 100
-RATE_DELAY = 15
 MODEL = "models/text-embedding-004"
+DIMENSIONS = 768
+SOURCE = "./knowledges-01.txt"
+# embeddings already paid for, and what the knowledge table holds; see embedding_store.py
+EMBED_STORE = os.getenv("EMBED_STORE", "./embeddings")
+
+# embedding requests per minute and burst size for the token bucket
+EMBED_RPM = float(os.getenv("EMBED_RPM", 60))
+EMBED_BURST = int(os.getenv("EMBED_BURST", 5))
+# embedded batches allowed to wait for insert before embedding pauses
+INFLIGHT = 4
+MAX_RETRIES = 6
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 120.0
 
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
 
 def embedding_task(txt):
     try:
-        resp = client.models.embed_content(model=MODEL, contents=txt, config=genai.types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT", output_dimensionality=768))
+        resp = client.models.embed_content(model=MODEL, contents=txt, config=genai.types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT", output_dimensionality=DIMENSIONS))
         return [embedding.values for embedding in resp.embeddings]
     except Exception as e:
         print(f"Error embedding batch {e}")
         raise
 
-def process_in_batch():
-    with open("./knowledges-01.txt") as f:
-        lines = [l.strip() for l in f if l.strip()]
-    
-    line_count = len(lines)
 
-    print(f"total: {line_count} is to process")
+class TokenBucket:
+    """allows `rate` calls per second on average, with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def with_retries(fn, what, attempts=MAX_RETRIES):
+    # exponential backoff with full jitter; the last error is re-raised
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            print(f"{what} failed ({e}), retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class Progress:
+    def __init__(self, total_rows):
+        self.total = total_rows
+        self.rows = 0
+        self.start = time.monotonic()
+
+    def add(self, n):
+        self.rows += n
+        elapsed = time.monotonic() - self.start
+        rate = self.rows / elapsed if elapsed else 0.0
+        eta = (self.total - self.rows) / rate if rate else float("inf")
+        return f"{self.rows}/{self.total} rows, {rate:.1f} rows/s, eta {eta:.0f}s"
 
-    for i in range(0, line_count, BATCH_SIZE):
-        batch = lines[i:i+BATCH_SIZE]
-        batch_num = i // BATCH_SIZE + 1
-        total_batch = (line_count + BATCH_SIZE - 1) // BATCH_SIZE
 
-        print(f"Processing batch {batch_num}/{total_batch} ({len(batch)}) items...")
+def table_ids(page=1000):
+    ids = []
+    while True:
+        rows = supabase.table("knowledge").select("id").order("id").range(len(ids), len(ids) + page - 1).execute().data or []
+        ids.extend(r["id"] for r in rows)
+        if len(rows) < page:
+            return ids
+
+
+def process_in_batch(source=SOURCE, store_dir=EMBED_STORE, batch_size=BATCH_SIZE, reconcile=False):
+    """
+    syncs the knowledge table with `source`: chunks without a stored embedding
+    are embedded, chunks the table does not hold yet (or holds with another
+    model's embedding) are upserted by their content-derived id, and rows whose
+    chunk is gone are deleted. Re-running after an error or a small edit only
+    does what is left. With reconcile, the ids to delete come from the table
+    itself instead of the last sync, e.g. to clear rows inserted before there
+    was a store
+    """
+    contents = read_chunks(source)
+    store = EmbeddingStore(store_dir, MODEL, DIMENSIONS)
+    to_embed, to_upsert, to_delete = store.plan(contents)
+    if reconcile:
+        current = {chunk_id(c) for c in contents}
+        to_delete = sorted(i for i in table_ids() if i not in current)
+
+    print(f"{len(contents)} distinct chunks, {len(store)} stored embeddings: {len(to_embed)} to embed, "
+          f"{len(to_upsert)} to upsert, {len(to_delete)} to delete, {len(contents) - len(to_upsert)} unchanged")
+    total_batch = (len(to_upsert) + batch_size - 1) // batch_size
+
+    published = store.published()
+    bucket = TokenBucket(EMBED_RPM / 60, EMBED_BURST)
+    progress = Progress(len(to_upsert))
+    ready = queue.Queue(maxsize=INFLIGHT)
+    lock = threading.Lock()
+    failed = []
+
+    def embed(batch_num):
+        batch = to_upsert[(batch_num - 1) * batch_size:batch_num * batch_size]
+        missing = store.missing(batch)
+
+        def call():
+            bucket.take()
+            return embedding_task(missing)
 
         try:
-            embed = embedding_task(batch)
+            if missing:
+                vectors = with_retries(call, f"embedding batch {batch_num}")
+                with lock:
+                    store.add(missing, vectors)
+            with lock:
+                vectors = store.get(batch)
+            ready.put((batch_num, [{"id": chunk_id(txt), "content": txt, "embedding": emb.tolist()} for txt, emb in zip(batch, vectors)]))
+        except Exception as e:
+            ready.put((batch_num, e))
+
+    def upsert_all():
+        # upserts run on their own thread so they overlap with the next embeddings
+        for _ in range(total_batch):
+            batch_num, rec = ready.get()
+            try:
+                if isinstance(rec, Exception):
+                    raise rec
+                with_retries(lambda: supabase.table("knowledge").upsert(rec, on_conflict="id").execute(), f"upserting batch {batch_num}")
+                with lock:
+                    published.update((r["id"], store.key(r["content"])) for r in rec)
+                    store.set_published(published)
+                print(f"batch {batch_num}/{total_batch} upserted, {progress.add(len(rec))}")
+            except Exception as e:
+                failed.append(batch_num)
+                print(f"Error processing batch {batch_num}: {e} (left for the next run)")
 
-            rec = [
-                    {"content": txt, "embedding": emb} for txt, emb in zip(batch, embed)
-                ]
-            supabase.table("knowledge").insert(rec).execute()
-            print(f"batch {batch_num} uploaded successfully")
+    upserter = threading.Thread(target=upsert_all, daemon=True)
+    upserter.start()
+    # a couple of embedding calls in flight; the token bucket keeps the overall rate
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(embed, range(1, total_batch + 1)))
+    upserter.join()
 
-            if i + BATCH_SIZE < line_count:
-                print(f"waiting {RATE_DELAY} for rate limit...")
-                time.sleep(RATE_DELAY)
+    deleted = 0
+    for start in range(0, len(to_delete), batch_size):
+        ids = to_delete[start:start + batch_size]
+        try:
+            with_retries(lambda: supabase.table("knowledge").delete().in_("id", ids).execute(), "deleting stale rows")
         except Exception as e:
-            print(f"Error processing batch {batch_num}: {e}")
-            print("waiting 1 min")
-            time.sleep(60)
+            print(f"Error deleting {len(ids)} stale rows: {e} (left for the next run)")
             continue
+        for i in ids:
+            published.pop(i, None)
+        store.set_published(published)
+        deleted += len(ids)
+
+    if failed:
+        print(f"{len(failed)} batches failed: {sorted(failed)}, rerun to retry them")
+    else:
+        print(f"all {total_batch} batches upserted, {deleted} stale rows deleted")
+    return {"embedded": len(to_embed), "upserted": progress.rows, "deleted": deleted, "failed": sorted(failed)}
 
 if __name__ == "__main__":
-    process_in_batch()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default=SOURCE, help="knowledges .parquet or text file")
+    parser.add_argument("--store", default=EMBED_STORE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--reconcile", action="store_true", help="delete every table row that is not a chunk of --source")
+    args = parser.parse_args()
+    process_in_batch(args.source, args.store, args.batch_size, args.reconcile)
     print("knowledge uploaded")
@@ -2,37 +2,260 @@ from supabase import create_client
 # deprecated, change this
 from google import genai
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from embedding_store import APP_DIR, EmbeddingStore, chunk_id
+import argparse
+import json
 import os
+import random
+import sys
 import time
 
+import numpy as np
+
 load_dotenv()
 
 
 BATCH_SIZE = 100
 RATE_DELAY = 15
 MODEL = "models/text-embedding-004"
+DIMENSIONS = 768
+SOURCE = "./synthetic_bdhs_10k.csv"
+# query embeddings of earlier runs, so evaluating another config does not pay for them again
+QUERY_STORE = os.getenv("QUERY_STORE", "./embeddings/queries")
+BACKENDS = ("supabase", "numpy", "ivf", "hybrid")
+
+# created on first use: an evaluation of a local snapshot with stored query embeddings needs no keys
+client = None
+supabase = None
+
+def gemini():
+    global client
+    if client is None:
+        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    return client
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+def db():
+    global supabase
+    if supabase is None:
+        supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    return supabase
 
-def embedding_task(txt):
+def embedding_task(txt, dim=DIMENSIONS):
+    # a list of texts gets a list of vectors, one text its vector
     try:
-        resp = client.models.embed_content(model=MODEL, contents=[txt], config=genai.types.EmbedContentConfig(task_type="RETRIEVAL_QUERY"))
-        return resp.embeddings[0].values
+        resp = gemini().models.embed_content(model=MODEL, contents=txt if isinstance(txt, list) else [txt],
+                                             config=genai.types.EmbedContentConfig(task_type="RETRIEVAL_QUERY", output_dimensionality=dim))
+        vectors = [e.values for e in resp.embeddings]
+        return vectors if isinstance(txt, list) else vectors[0]
     except Exception as e:
         print(f"Error embedding batch {e}")
         raise
 
-def search_knowledge(q):
+def search_knowledge(q, match_count=3):
     q_embed = embedding_task(q)
 
-    res = supabase.rpc('match_knowledge', {
+    res = db().rpc('match_knowledge', {
         "query_embedding": q_embed,
-        "match_count": 3
+        "match_count": match_count
     }).execute()
 
     return res.data
 
+
+# queries with known answers
+
+def row_question(meta, rng):
+    """a free-text question about one synthetic row, stating every field its knowledge chunk depends on"""
+    age = meta["age"]
+    parts = [rng.choice([f"a woman aged {age}", f"a {age} year old pregnant woman", f"pregnant, age {age},"])]
+    parts.append(rng.choice(["with low education", "with little formal education"]) if meta["low_education"]
+                 else rng.choice(["with secondary education", "with higher education"]))
+    if meta["few_anc_visits"]:
+        parts.append(rng.choice([f"anc visits {meta['anc_visits']}", f"{meta['anc_visits']} antenatal visits"]))
+    if meta["high_bp"]:
+        parts.append(rng.choice(["high blood pressure", "hypertension"]))
+    parts.append("high risk" if meta["high_risk"] else "not high risk")
+    return " ".join(parts[:2]) + ", " + ", ".join(parts[2:])
+
+def make_queries(source=SOURCE, n=1000, seed=0):
+    """
+    n questions about random rows of a synthetic .csv/.parquet, each with
+    the id of the knowledge chunk its row was turned into as the answer
+    """
+    from knowledge_generator import iter_chunks, meta_at
+
+    rows = []
+    for _, texts, inverse, meta in iter_chunks(source):
+        ids = [chunk_id(t) for t in texts]
+        fields = [meta_at(meta, j) for j in range(len(texts))]
+        rows.extend((ids[j], fields[j]) for j in inverse.tolist())
+    rng = random.Random(seed)
+    # more questions than rows repeats rows, with other wording
+    picked = rng.sample(range(len(rows)), n) if n <= len(rows) else [rng.randrange(len(rows)) for _ in range(n)]
+    return [{"query": row_question(rows[i][1], rng), "expected_ids": [rows[i][0]]} for i in picked]
+
+def read_queries(path):
+    """[{"query", "expected_ids"?}] from a .jsonl file, or one question per line of any other file"""
+    with open(path) as f:
+        lines = [l.strip() for l in f if l.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(l) for l in lines]
+    return [{"query": l} for l in lines]
+
+
+# evaluation
+
+def query_vectors(texts, store_dir=QUERY_STORE, dim=DIMENSIONS, batch_size=BATCH_SIZE):
+    """embeddings of the queries, only the ones not embedded by an earlier run go to the API"""
+    store = EmbeddingStore(store_dir, MODEL, dim)
+    missing = list(dict.fromkeys(store.missing(texts)))
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        store.add(batch, embedding_task(batch, dim))
+        print(f"embedded {min(start + batch_size, len(missing))}/{len(missing)} queries")
+    return store.get(texts), len(missing)
+
+def make_searcher(backend, snapshot_dir=None, nprobe=16, lexical_k=200):
+    """(search(text, vector, k) -> results, index or None)"""
+    if backend == "supabase":
+        def search(text, vec, k):
+            return db().rpc('match_knowledge', {"query_embedding": list(map(float, vec)), "match_count": k}).execute().data
+        return search, None
+
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    from retrieval import NumpyIndex
+    if backend == "ivf":
+        from ann import IVFIndex
+        index = IVFIndex.load(snapshot_dir, nprobe=nprobe)
+    elif backend == "hybrid":
+        from hybrid import HybridIndex
+        index = HybridIndex(NumpyIndex.load(snapshot_dir), lexical_k)
+    else:
+        index = NumpyIndex.load(snapshot_dir)
+
+    def search(text, vec, k):
+        if backend == "hybrid":
+            return index.search([vec], k, texts=[text])[0]
+        return index.search([vec], k)[0]
+    return search, index
+
+def percentiles(samples, ps=(50, 95, 99)):
+    if not samples:
+        return {f"p{p}": None for p in ps}
+    s = sorted(samples)
+    return {f"p{p}": round(s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))], 3) for p in ps}
+
+def evaluate(queries, backend="supabase", k=5, concurrency=8, snapshot_dir=None, dim=DIMENSIONS,
+             store_dir=QUERY_STORE, nprobe=16, lexical_k=200, end_to_end=False):
+    """
+    runs every query against one backend, `concurrency` at a time, and
+    returns a report: throughput, latency percentiles and, over the queries
+    with expected_ids, recall@1/3/k and MRR. Latency is retrieval only, with
+    the query embeddings computed (or loaded) up front; end_to_end embeds
+    each query inside its timed call instead, one API call per query
+    """
+    texts = [q["query"] for q in queries]
+    search, index = make_searcher(backend, snapshot_dir, nprobe, lexical_k)
+    embedded, embed_s = 0, 0.0
+    vectors = [None] * len(texts)
+    if not end_to_end:
+        t = time.perf_counter()
+        vectors, embedded = query_vectors(texts, store_dir, dim)
+        embed_s = time.perf_counter() - t
+
+    def run(i):
+        t = time.perf_counter()
+        try:
+            vec = embedding_task(texts[i], dim) if end_to_end else vectors[i]
+            found = search(texts[i], vec, k)
+        except Exception as e:
+            return i, None, (time.perf_counter() - t) * 1000, repr(e)
+        return i, found, (time.perf_counter() - t) * 1000, None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(run, range(len(texts))))
+    elapsed = time.perf_counter() - start
+
+    latencies, ranks, errors = [], [], []
+    for i, found, ms, error in outcomes:
+        if error is not None:
+            errors.append({"query": texts[i], "error": error})
+            continue
+        latencies.append(ms)
+        expected = set(queries[i].get("expected_ids") or ())
+        if expected:
+            # 1-based rank of the first expected chunk, 0 when it is not in the top k
+            hit = next((r for r, res in enumerate(found, 1) if chunk_id(res["content"]) in expected), 0)
+            ranks.append(hit)
+
+    ranks = np.array(ranks, dtype=np.int64)
+    recall = {f"@{n}": float(((ranks > 0) & (ranks <= n)).mean()) if len(ranks) else None
+              for n in sorted({1, 3, k}) if n <= k}
+    return {
+        "backend": backend,
+        "snapshot": snapshot_dir if backend != "supabase" else None,
+        "queries": len(texts),
+        "labelled": int(len(ranks)),
+        "k": k,
+        "concurrency": concurrency,
+        "dim": dim,
+        "end_to_end": end_to_end,
+        "seconds": round(elapsed, 3),
+        "throughput_qps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {**percentiles(latencies), "mean": round(float(np.mean(latencies)), 3) if latencies else None},
+        "recall": recall,
+        "mrr": float(np.where(ranks > 0, 1.0 / np.maximum(ranks, 1), 0.0).mean()) if len(ranks) else None,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "query_embeddings": {"embedded": embedded, "seconds": round(embed_s, 3)},
+        "index": index.stats() if index is not None and hasattr(index, "stats") else None,
+    }
+
+
 if __name__ == "__main__":
-    print(search_knowledge("a woman aged 15 with low education and no happiness, anc visits 2"))
-    print("knowledge found")
+    # python data_matcher.py search "a woman aged 15 with low education, anc visits 2"
+    # python data_matcher.py queries --n 5000 --out queries.jsonl
+    # python data_matcher.py eval --queries queries.jsonl --backend hybrid --snapshot ../../src/app/snapshot --concurrency 16
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", nargs="?", default="search", choices=["search", "queries", "eval"])
+    parser.add_argument("query", nargs="?", default="a woman aged 15 with low education, anc visits 2")
+    parser.add_argument("--source", default=SOURCE, help="synthetic .csv/.parquet the questions are generated from")
+    parser.add_argument("--n", type=int, default=1000, help="questions to generate when no --queries file is given")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", help=".jsonl of {query, expected_ids} or a text file of questions")
+    parser.add_argument("--backend", choices=BACKENDS, default="supabase")
+    parser.add_argument("--snapshot", default=os.path.join(APP_DIR, "snapshot"), help="snapshot dir for numpy/ivf/hybrid")
+    parser.add_argument("--match-count", "-k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=DIMENSIONS)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--lexical-k", type=int, default=200)
+    parser.add_argument("--store", default=QUERY_STORE, help="where query embeddings are kept between runs")
+    parser.add_argument("--end-to-end", action="store_true", help="embed each query inside its timed call")
+    parser.add_argument("--out", default=None, help="report (eval) or questions (queries) file")
+    args = parser.parse_args()
+
+    if args.command == "search":
+        print(search_knowledge(args.query, args.match_count))
+        print("knowledge found")
+    elif args.command == "queries":
+        out = args.out or "./queries.jsonl"
+        with open(out, "w") as f:
+            for q in make_queries(args.source, args.n, args.seed):
+                f.write(json.dumps(q) + "\n")
+        print(f"{args.n} questions written to {out}")
+    else:
+        queries = read_queries(args.queries) if args.queries else make_queries(args.source, args.n, args.seed)
+        report = evaluate(queries, args.backend, args.match_count, args.concurrency, args.snapshot, args.dim,
+                          args.store, args.nprobe, args.lexical_k, args.end_to_end)
+        lat = report["latency_ms"]
+        print(f"{report['backend']}: {report['queries']} queries, {report['throughput_qps']} q/s, "
+              f"p50 {lat['p50']}ms p95 {lat['p95']}ms p99 {lat['p99']}ms, recall {report['recall']}, "
+              f"mrr {report['mrr']}, {report['errors']} errors")
+        out = args.out or "./matcher_report.json"
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"report written to {out}")
@@ -0,0 +1,177 @@
+"""
+Collapse repeated knowledge chunks before they are embedded.
+
+row_to_text() fills one template, so most rows of the synthetic csv turn
+into byte-identical sentences. Every record that comes out of here is one
+distinct chunk with the number of rows that produced it and their ids:
+
+    {"content": "...", "count": 12, "row_ids": [3, 17, ...]}
+
+Near-duplicates (e.g. the same sentence with a different age) can also be
+merged with MinHash over word shingles, verified by exact Jaccard.
+"""
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+import columnar
+from embedding_store import APP_DIR
+
+_PRIME = (1 << 31) - 1
+
+
+def canonicalize(text):
+    # same result as re.sub(r"\s+", " ", text).strip(), several times faster
+    return " ".join(text.split())
+
+
+def _hashes(shingles):
+    # stable across runs, unlike hash(); reduced below the prime so a*h + b fits in uint64
+    return np.array([int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") % _PRIME for s in shingles], dtype=np.uint64)
+
+
+class MinHasher:
+    def __init__(self, num_perm=64, bands=16, seed=7):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+
+    def signature(self, shingles):
+        h = _hashes(shingles)
+        return ((self.a[:, None] * h[None, :] + self.b[:, None]) % _PRIME).min(axis=1).tolist()
+
+    def band_keys(self, sig):
+        return [(i, tuple(sig[i * self.rows:(i + 1) * self.rows])) for i in range(self.bands)]
+
+
+class Deduper:
+    """incremental exact dedup, fed row by row or a whole chunk of rows at once"""
+
+    def __init__(self):
+        self._records = {}
+
+    def __len__(self):
+        return len(self._records)
+
+    def _record(self, key, meta):
+        rec = self._records.get(key)
+        if rec is None:
+            rec = self._records[key] = {"content": key, "count": 0, "row_ids": []}
+            if meta is not None:
+                rec["meta"] = meta
+        return rec
+
+    def add(self, row_id, text, meta=None):
+        key = canonicalize(text)
+        if not key:
+            return
+        rec = self._record(key, meta)
+        rec["count"] += 1
+        rec["row_ids"].append(row_id)
+
+    def add_many(self, row_ids, texts, inverse=None, meta=None):
+        """
+        add a chunk of rows. If `inverse` is given, `texts` holds the distinct
+        texts only and row i has text texts[inverse[i]]. `meta`, one dict per
+        entry of `texts`, is kept on the record the text first creates
+        """
+        # group the chunk first so canonicalize() runs once per distinct text
+        if inverse is None:
+            uniq, first, inverse, counts = np.unique(np.asarray(texts, dtype=object), return_index=True, return_inverse=True, return_counts=True)
+            if meta is not None:
+                meta = [meta[i] for i in first.tolist()]
+        else:
+            uniq = texts
+            counts = np.bincount(inverse, minlength=len(uniq))
+            first = np.full(len(uniq), len(inverse))
+            np.minimum.at(first, inverse, np.arange(len(inverse)))
+        grouped = np.asarray(row_ids)[np.argsort(inverse, kind="stable")]
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        for j in np.argsort(first):
+            key = canonicalize(uniq[j])
+            if not key:
+                continue
+            rec = self._record(key, meta[j] if meta is not None else None)
+            rec["count"] += int(counts[j])
+            rec["row_ids"].extend(grouped[starts[j]:starts[j] + counts[j]].tolist())
+
+    def records(self, near=False, threshold=0.75):
+        """
+        records in first-seen order. With near=True, a chunk whose shingle
+        Jaccard similarity to an already kept chunk is >= threshold is folded
+        into a copy of that chunk's record; the stored records are left as
+        they are, so calling this again gives the same result.
+        """
+        if not near:
+            return list(self._records.values())
+
+        # the app's shingles, so near-duplicates here are what its prompt context treats as one text
+        if APP_DIR not in sys.path:
+            sys.path.insert(0, APP_DIR)
+        from text import jaccard, shingles
+
+        hasher = MinHasher()
+        buckets = {}
+        kept = []
+        for rec in self._records.values():
+            sh = shingles(rec["content"])
+            keys = hasher.band_keys(hasher.signature(sh))
+            target = None
+            for k in keys:
+                for cand in buckets.get(k, ()):
+                    if jaccard(sh, cand[1]) >= threshold:
+                        target = cand[0]
+                        break
+                if target is not None:
+                    break
+            if target is None:
+                rec = {**rec, "row_ids": list(rec["row_ids"])}
+                kept.append(rec)
+                for k in keys:
+                    buckets.setdefault(k, []).append((rec, sh))
+            else:
+                target["count"] += rec["count"]
+                target["row_ids"].extend(rec["row_ids"])
+        return kept
+
+
+def dedup_chunks(chunks, near=False, threshold=0.75):
+    """chunks: iterable of (row_id, text). Returns records in first-seen order."""
+    deduper = Deduper()
+    for row_id, text in chunks:
+        deduper.add(row_id, text)
+    return deduper.records(near=near, threshold=threshold)
+
+
+def write_meta(path, records):
+    with open(path, "w") as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+
+
+def meta_path(text_path):
+    # ./knowledges.txt -> ./knowledges.meta.jsonl
+    return os.path.splitext(text_path)[0] + ".meta.jsonl"
+
+
+def read_chunks(source):
+    """
+    the distinct chunk texts of a knowledges file, in order. Only the content
+    column of a .parquet file from knowledge_generator.py is read, and it is
+    not deduplicated again if it already was; a text file is one chunk per
+    non-empty line
+    """
+    if columnar.is_parquet(source):
+        content = columnar.read_knowledge(source, columns=["content"]).column("content").to_pylist()
+        if columnar.file_metadata(source).get("dedup", "none") != "none":
+            return content
+        raw = content
+    else:
+        with open(source) as f:
+            raw = [l.strip() for l in f if l.strip()]
+    return [r["content"] for r in dedup_chunks(enumerate(raw))]
@@ -0,0 +1,202 @@
+"""
+Local, content-addressed store of knowledge chunk embeddings.
+
+A chunk's embedding is stored under the sha256 of (model, dimensionality,
+content), so re-running ingestion only calls the embedding API for chunks
+that are new or whose text changed, and switching model or dimensionality
+never mixes vectors. Each model/dimensionality pair gets its own directory:
+
+    embeddings/text-embedding-004-768/
+        keys.bin      32-byte keys, one per row
+        vectors.f32   float32 rows, memory-mapped for reading
+        store.json    model, dim and the committed row count
+
+Files are append-only. store.json is replaced last, so rows from a write
+that did not finish are ignored and overwritten by the next one.
+
+The store also remembers which chunk id held which key in the `knowledge`
+table after the last sync (published.npy), which is how ingestion knows what
+to upsert and what to delete. Chunk ids are derived from the content alone,
+so the same chunk keeps its row across runs and models.
+
+The vectors plus the chunk texts are enough to rebuild the app's local
+retrieval snapshot without any network call:
+
+    python embedding_store.py snapshot --source knowledges.parquet --out ../../src/app/snapshot
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+KEY_BYTES = 32
+# keys as raw bytes: numpy "S" strings would drop a digest's trailing zero bytes
+PUBLISHED_DTYPE = np.dtype([("id", "<i8"), ("key", "u1", (KEY_BYTES,))])
+# the app, whose retrieval module owns the snapshot layout
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "app")
+
+
+def chunk_id(content):
+    # positive int64 from the content hash: a stable primary key for the chunk's row
+    return int.from_bytes(hashlib.sha256(content.encode()).digest()[:8], "big") >> 1
+
+
+def _save_atomic(path, write):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class EmbeddingStore:
+    """embeddings of one model and dimensionality, looked up by content"""
+
+    def __init__(self, root, model, dim):
+        self.root = root
+        self.model = model
+        self.dim = dim
+        self.path = os.path.join(root, f"{re.sub(r'[^A-Za-z0-9_.-]+', '-', model.split('/')[-1])}-{dim}")
+        self.rows = 0
+        self._index = {}
+        self._vectors = None
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        if not os.path.exists(self._file("store.json")):
+            return
+        with open(self._file("store.json")) as f:
+            meta = json.load(f)
+        if meta["model"] != self.model or meta["dim"] != self.dim:
+            raise ValueError(f"{self.path} holds {meta['model']} x {meta['dim']}, not {self.model} x {self.dim}")
+        self.rows = meta["rows"]
+        with open(self._file("keys.bin"), "rb") as f:
+            keys = f.read(self.rows * KEY_BYTES)
+        self._index = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(self.rows)}
+
+    def key(self, content):
+        return hashlib.sha256(f"{self.model}\0{self.dim}\0{content}".encode()).digest()
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, content):
+        return self.key(content) in self._index
+
+    def missing(self, contents):
+        """the contents that have no embedding yet, in order"""
+        return [c for c in contents if self.key(c) not in self._index]
+
+    @property
+    def vectors(self):
+        if self._vectors is None or self._vectors.shape[0] != self.rows:
+            if not self.rows:
+                return np.empty((0, self.dim), dtype=np.float32)
+            self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        return self._vectors
+
+    def get(self, contents):
+        """(len(contents), dim) float32 matrix; KeyError for a content that was never added"""
+        rows = [self._index[self.key(c)] for c in contents]
+        return np.asarray(self.vectors[rows], dtype=np.float32).reshape(len(rows), self.dim)
+
+    def add(self, contents, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        new = {}
+        for c, v in zip(contents, vectors):
+            k = self.key(c)
+            if k not in self._index and k not in new:
+                new[k] = v
+        if not new:
+            return 0
+
+        os.makedirs(self.path, exist_ok=True)
+        for name, data, width in (("keys.bin", b"".join(new), KEY_BYTES),
+                                  ("vectors.f32", np.stack(list(new.values())).tobytes(), 4 * self.dim)):
+            path = self._file(name)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                # anything past the committed rows is left over from an unfinished write
+                f.seek(self.rows * width)
+                f.write(data)
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+
+        for k in new:
+            self._index[k] = len(self._index)
+        self.rows = len(self._index)
+        meta = {"model": self.model, "dim": self.dim, "rows": self.rows}
+        _save_atomic(self._file("store.json"), lambda f: f.write(json.dumps(meta).encode()))
+        return len(new)
+
+    # what the `knowledge` table holds, as of the last sync
+
+    def published(self):
+        """{chunk id: key} of the rows in the table"""
+        path = os.path.join(self.root, "published.npy")
+        if not os.path.exists(path):
+            return {}
+        arr = np.load(path)
+        return {i: k.tobytes() for i, k in zip(arr["id"].tolist(), arr["key"])}
+
+    def set_published(self, published):
+        arr = np.zeros(len(published), dtype=PUBLISHED_DTYPE)
+        arr["id"] = sorted(published)
+        arr["key"] = np.frombuffer(b"".join(published[i] for i in arr["id"].tolist()), dtype=np.uint8).reshape(-1, KEY_BYTES)
+        os.makedirs(self.root, exist_ok=True)
+        _save_atomic(os.path.join(self.root, "published.npy"), lambda f: np.save(f, arr))
+
+    def plan(self, contents):
+        """
+        what a sync of `contents` to the table has to do:
+        (contents to embed, contents to upsert, chunk ids to delete)
+        """
+        published = self.published()
+        current = {chunk_id(c): c for c in contents}
+        embed = self.missing(current.values())
+        upsert = [c for i, c in current.items() if published.get(i) != self.key(c)]
+        delete = sorted(set(published) - set(current))
+        return embed, upsert, delete
+
+    def write_snapshot(self, out_dir, contents):
+        """
+        a retrieval snapshot for src/app from the stored embeddings of
+        `contents`, written by the app's own retrieval.write_snapshot so the
+        layout cannot drift from what the app loads
+        """
+        if APP_DIR not in sys.path:
+            sys.path.insert(0, APP_DIR)
+        from retrieval import write_snapshot
+
+        write_snapshot(out_dir, [chunk_id(c) for c in contents], contents, self.get(contents))
+
+
+if __name__ == "__main__":
+    from dedup import read_chunks
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["snapshot", "status"])
+    parser.add_argument("--source", default="./knowledges-01.txt", help="knowledges .parquet or text file")
+    parser.add_argument("--store", default="./embeddings")
+    parser.add_argument("--model", default="models/text-embedding-004")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--out", default="../../src/app/snapshot")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.store, args.model, args.dim)
+    contents = read_chunks(args.source)
+    embed, upsert, delete = store.plan(contents)
+    print(f"{len(store)} stored embeddings, {len(contents)} chunks in {args.source}: "
+          f"{len(embed)} to embed, {len(upsert)} to upsert, {len(delete)} to delete")
+
+    if args.command == "snapshot":
+        if embed:
+            raise SystemExit(f"{len(embed)} chunks have no embedding yet, run data_ingestor.py first")
+        store.write_snapshot(args.out, contents)
+        print(f"snapshot written to {args.out}: {len(contents)} x {args.dim}")
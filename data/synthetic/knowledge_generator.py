@@ -1,4 +1,16 @@
+import argparse
 import csv
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import columnar
+from dedup import Deduper, meta_path, write_meta
+
+CHUNK_ROWS = 100_000
+COLUMNS = ["age", "anc_visits", "sys_bp", "dia_bp", "education_years", "high_risk"]
 
 
 def row_to_text(row):
@@ -35,16 +47,195 @@ def row_to_text(row):
     text_corpus += "Regular antenatal care and monitoring can improve maternal outcomes."
     return text_corpus
 
-kn = []
+def row_meta(row):
+    # the fields row_to_text() branches on, stored with the knowledge record
+    anc_visits = int(row["anc_visits"])
+    return {
+        "age": int(row["age"]),
+        "low_education": int(row["education_years"]) < 5,
+        "few_anc_visits": anc_visits < 4,
+        "anc_visits": anc_visits if anc_visits < 4 else None,
+        "high_bp": float(row["sys_bp"]) >= 140.0 or float(row["dia_bp"]) <= 90.0,
+        "high_risk": int(row["high_risk"]) == 1,
+    }
+
+def meta_at(meta, j):
+    """row_meta() of distinct text j, from the arrays frame_to_groups() returns"""
+    rec = {name: values[j].item() for name, values in meta.items()}
+    if not rec["few_anc_visits"]:
+        rec["anc_visits"] = None
+    return rec
+
+def frame_to_groups(df):
+    """
+    row_to_text() for a whole frame. The sentence only depends on a handful of
+    derived columns, so rows are grouped on those with numpy and each distinct
+    sentence is built once. Returns (distinct texts, row -> text index, meta)
+    where meta holds the row_meta() fields as arrays over the distinct texts.
+    """
+    age = np.asarray(df["age"]).astype(np.int64)
+    anc_visits = np.asarray(df["anc_visits"]).astype(np.int64)
+    sys_bp = np.asarray(df["sys_bp"], dtype=np.float64)
+    dia_bp = np.asarray(df["dia_bp"], dtype=np.float64)
+    educat = np.asarray(df["education_years"]).astype(np.int64)
+    h_risk = np.asarray(df["high_risk"]).astype(np.int64)
+
+    few_anc = anc_visits < 4
+    low_edu = educat < 5
+    high_bp = (sys_bp >= 140.0) | (dia_bp <= 90.0)
+    risk = h_risk == 1
+
+    # pack the fields into one int64 key so grouping is a 1-d np.unique
+    age_lo = age.min(initial=0)
+    anc_lo = min(anc_visits.min(initial=0), 0)
+    anc_code = np.where(few_anc, anc_visits - anc_lo + 1, 0)
+    key = (age - age_lo) * (4 - anc_lo + 1) + anc_code
+    key = ((key * 2 + low_edu) * 2 + high_bp) * 2 + risk
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+
+    texts = np.empty(len(first), dtype=object)
+    for j, i in enumerate(first.tolist()):
+        text_corpus = f"A pregnant woman aged {age[i]}. "
+        text_corpus += "with low formal education " if low_edu[i] else "with moderate to high formal education"
+        if few_anc[i]:
+            text_corpus += f"who attended fewer ({anc_visits[i]}) than recommended antenatal visits "
+        if high_bp[i]:
+            text_corpus += "and shows signs of high blood pressure "
+        text_corpus += "is considered high risk during pregnancy. " if risk[i] else "is not classified as high risk. "
+        texts[j] = text_corpus + "Regular antenatal care and monitoring can improve maternal outcomes."
+    meta = {
+        "age": age[first].astype(np.int8),
+        "low_education": low_edu[first],
+        "few_anc_visits": few_anc[first],
+        "anc_visits": anc_visits[first].astype(np.int8),
+        "high_bp": high_bp[first],
+        "high_risk": risk[first],
+    }
+    return texts, inverse.reshape(-1), meta
+
+
+def frame_to_text(df):
+    texts, inverse, _ = frame_to_groups(df)
+    return texts[inverse]
+
+
+def iter_rows(path):
+    if columnar.is_parquet(path):
+        rows = (row for df in columnar.iter_frames(path) for row in df.to_dict("records"))
+        for row_id, row in enumerate(rows):
+            yield row_id, row_to_text(row), row_meta(row)
+        return
+
+    with open(path) as f_in:
+        reader = csv.DictReader(f_in)
+
+        for row_id, row in enumerate(reader):
+            yield row_id, row_to_text(row), row_meta(row)
+
+
+def read_frames(path, chunk_rows=CHUNK_ROWS):
+    # only the columns the template reads are parsed, one chunk in memory at a time
+    if columnar.is_parquet(path):
+        return columnar.iter_frames(path, columns=COLUMNS, batch_rows=chunk_rows)
+    # pandas' chunked C reader keeps memory flat; pyarrow's streaming csv reader
+    # was faster but its peak RSS kept growing with file size
+    return pd.read_csv(path, usecols=COLUMNS, chunksize=chunk_rows)
+
+
+def iter_chunks(path, chunk_rows=CHUNK_ROWS):
+    start = 0
+    for df in read_frames(path, chunk_rows):
+        n = len(df)
+        if not n:
+            continue
+        texts, inverse, meta = frame_to_groups(df)
+        yield np.arange(start, start + n), texts, inverse, meta
+        start += n
+
+
+def generate(input_path, output_path, vectorized=True, dedup=True, near=False, threshold=0.75, chunk_rows=CHUNK_ROWS):
+    """
+    writes chunks to output_path and returns (rows read, chunks written).
+    A .parquet output holds one record per chunk with its source row ids and
+    row_meta() fields; anything else is the plain text export, chunks
+    separated by blank lines, with counts and row ids in a .meta.jsonl file
+    """
+    if vectorized:
+        chunks = iter_chunks(input_path, chunk_rows)
+    else:
+        # the original row loop, as a one-row "chunk" stream
+        chunks = (([row_id], [text], None, meta) for row_id, text, meta in iter_rows(input_path))
+    parquet = columnar.is_parquet(output_path)
+    file_meta = {"source": os.path.basename(input_path), "dedup": "near" if near else "exact" if dedup else "none"}
+
+    rows = 0
+    if not dedup:
+        # streamed straight to disk, nothing is kept
+        if parquet:
+            with columnar.KnowledgeWriter(output_path, file_meta) as writer:
+                for row_ids, texts, inverse, meta in chunks:
+                    if inverse is None:
+                        writer.write({"content": texts[0], "row_ids": [int(row_ids[0])], "meta": meta})
+                    else:
+                        for i, j in enumerate(inverse.tolist()):
+                            writer.write({"content": texts[j], "row_ids": [int(row_ids[i])], "meta": meta_at(meta, j)})
+                    rows += len(row_ids)
+            return rows, rows
+
+        with open(output_path, "w") as f_out:
+            for row_ids, texts, inverse, _ in chunks:
+                if inverse is not None:
+                    texts = texts[inverse]
+                f_out.write("\n\n".join(texts) + "\n\n")
+                rows += len(row_ids)
+        return rows, rows
+
+    deduper = Deduper()
+    for row_ids, texts, inverse, meta in chunks:
+        if inverse is None:
+            deduper.add(row_ids[0], texts[0], meta)
+        else:
+            deduper.add_many(row_ids, texts, inverse, [meta_at(meta, j) for j in range(len(texts))])
+        rows += len(row_ids)
+
+    records = deduper.records(near=near, threshold=threshold)
+    if parquet:
+        with columnar.KnowledgeWriter(output_path, file_meta) as writer:
+            for r in records:
+                writer.write(r)
+        return rows, len(records)
+
+    # counts and source row ids live next to the text file
+    write_meta(meta_path(output_path), records)
+    with open(output_path, "w") as f_out:
+        for r in records:
+            f_out.write(r["content"] + "\n\n")
+    return rows, len(records)
+
+
+def default_input():
+    # the parquet dataset when data_generator.py has written one, else the bundled csv
+    return "./synthetic_bdhs_10k.parquet" if os.path.exists("./synthetic_bdhs_10k.parquet") else "./synthetic_bdhs_10k.csv"
+
 
-with open("./synthetic_bdhs_10k.csv") as f_in:
-    reader = csv.DictReader(f_in)
+def main():
+    parser = argparse.ArgumentParser(description="turn synthetic rows into knowledge chunks")
+    parser.add_argument("--input", default=default_input(), help=".parquet or .csv")
+    parser.add_argument("--output", default="./knowledges.parquet", help=".parquet, or any other extension for plain text")
+    parser.add_argument("--no-dedup", action="store_true", help="write one chunk per row, duplicates included")
+    parser.add_argument("--near", action="store_true", help="also merge near-identical chunks")
+    parser.add_argument("--threshold", type=float, default=0.75, help="jaccard threshold for --near")
+    parser.add_argument("--rows", action="store_true", help="use the row-by-row generator instead of the vectorized one")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per chunk in vectorized mode")
+    args = parser.parse_args()
 
-    for row in reader:
-        kn.append(row_to_text(row))
+    start = time.perf_counter()
+    rows, written = generate(
+        args.input, args.output, vectorized=not args.rows, dedup=not args.no_dedup,
+        near=args.near, threshold=args.threshold, chunk_rows=args.chunk_rows,
+    )
 
-with open("./knowledges.txt", "w") as f_out:
-    for k in kn:
-        f_out.write(k + "\n\n")
+    print(f"Generated: {written} knowledge chunks from {rows} rows in {time.perf_counter() - start:.2f}s")
 
-print(f"Generated: {len(kn)} knowledge chunks")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Mergeable one-pass accumulators for validating datasets that do not fit in
+memory. Each one can be fed chunk by chunk with update() and combined with
+merge(), so partial results from several processes add up to exactly what a
+single pass over all the data would give.
+"""
+import numpy as np
+import pandas as pd
+
+
+class Moments:
+    """count, mean and variance per column (Welford, merged with Chan et al.)"""
+
+    def __init__(self, k: int):
+        self.n = np.zeros(k)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+
+    def update(self, x):
+        x = np.asarray(x, dtype=np.float64).reshape(len(x), -1)
+        valid = ~np.isnan(x)
+        n = valid.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n > 0, np.nansum(x, axis=0) / n, 0.0)
+        m2 = np.nansum((x - mean) ** 2, axis=0)
+        return self._combine(n, mean, m2)
+
+    def merge(self, other: "Moments"):
+        return self._combine(other.n, other.mean, other.m2)
+
+    def _combine(self, n_b, mean_b, m2_b):
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = np.where(n > 0, self.mean + delta * n_b / n, 0.0)
+            self.m2 = np.where(n > 0, self.m2 + m2_b + delta ** 2 * self.n * n_b / n, 0.0)
+        self.n = n
+        return self
+
+    def var(self, ddof: int = 1):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > ddof, self.m2 / (self.n - ddof), np.nan)
+
+    def std(self, ddof: int = 1):
+        return np.sqrt(self.var(ddof))
+
+
+class CoMoments:
+    """means and the co-moment matrix of k columns, for correlations; rows with a NaN are skipped"""
+
+    def __init__(self, k: int):
+        self.n = 0
+        self.mean = np.zeros(k)
+        self.c = np.zeros((k, k))
+
+    def update(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        x = x[~np.isnan(x).any(axis=1)]
+        if not len(x):
+            return self
+        mean = x.mean(axis=0)
+        d = x - mean
+        return self._combine(len(x), mean, d.T @ d)
+
+    def merge(self, other: "CoMoments"):
+        if other.n:
+            self._combine(other.n, other.mean, other.c)
+        return self
+
+    def _combine(self, n_b, mean_b, c_b):
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.c = self.c + c_b + np.outer(delta, delta) * (self.n * n_b / n)
+        self.mean = self.mean + delta * (n_b / n)
+        self.n = n
+        return self
+
+    def corr(self):
+        sd = np.sqrt(np.diag(self.c))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.c / np.outer(sd, sd)
+
+
+class CategoryCounts:
+    """value counts of one column"""
+
+    def __init__(self):
+        self.counts = {}
+        self.n = 0
+
+    def update(self, values):
+        counts = pd.Series(values).value_counts(dropna=False)
+        for value, count in counts.items():
+            key = str(value)
+            self.counts[key] = self.counts.get(key, 0) + int(count)
+        self.n += int(counts.sum())
+        return self
+
+    def merge(self, other: "CategoryCounts"):
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self.n += other.n
+        return self
+
+    def proportion(self, value):
+        return self.counts.get(str(value), 0) / self.n if self.n else float("nan")
+
+
+class HistogramSketch:
+    """
+    fixed-width bins over [lo, hi]; values outside land in the edge bins.
+    With width 1 over integer-valued data (ages, counts, rounded vitals) the
+    CDF, and so the KS distance, is exact; quantiles are bin lower edges.
+    """
+
+    def __init__(self, lo: float, hi: float, width: float = 1.0):
+        self.lo = lo
+        self.width = width
+        self.counts = np.zeros(int(np.floor((hi - lo) / width)) + 1, dtype=np.int64)
+
+    def update(self, values):
+        v = np.asarray(values, dtype=np.float64)
+        v = v[~np.isnan(v)]
+        idx = np.clip(np.floor((v - self.lo) / self.width).astype(np.int64), 0, len(self.counts) - 1)
+        self.counts += np.bincount(idx, minlength=len(self.counts))
+        return self
+
+    def merge(self, other: "HistogramSketch"):
+        self.counts += other.counts
+        return self
+
+    def cdf(self):
+        total = self.counts.sum()
+        return np.cumsum(self.counts) / total if total else np.zeros(len(self.counts))
+
+    def quantile(self, q: float):
+        i = int(np.searchsorted(self.cdf(), q, side="left"))
+        return self.lo + min(i, len(self.counts) - 1) * self.width
+
+    def ks(self, other: "HistogramSketch"):
+        # two-sample Kolmogorov-Smirnov distance: the largest gap between the two CDFs
+        return float(np.abs(self.cdf() - other.cdf()).max())
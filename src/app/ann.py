@@ -0,0 +1,127 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from retrieval import NumpyIndex, _normalize, top_k
+
+IVF_FILES = ("ivf_centroids.npy", "ivf_offsets.npy", "ivf_ids.npy", "ivf_vectors.npy")
+
+
+def _assign(vectors, centroids, chunk: int = 65536):
+    out = np.empty(vectors.shape[0], dtype=np.int32)
+    for s in range(0, vectors.shape[0], chunk):
+        out[s:s + chunk] = np.argmax(vectors[s:s + chunk] @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(vectors, nlist: int, iters: int = 20, sample: int = 256, seed: int = 0):
+    """spherical k-means on a sample of at most `sample` points per list"""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    take = min(n, nlist * sample)
+    train = np.asarray(vectors[np.sort(rng.choice(n, take, replace=False))], dtype=np.float32)
+    centroids = train[rng.choice(take, nlist, replace=False)].copy()
+
+    for _ in range(iters):
+        labels = _assign(train, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        empty = counts == 0
+        sums[~empty] = np.add.reduceat(train[order], starts[~empty], axis=0)
+        # re-seed empty lists from random training points
+        sums[empty] = train[rng.choice(take, int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """inverted-file index: vectors grouped by nearest centroid, `nprobe` lists scanned per query"""
+
+    name = "ivf"
+
+    def __init__(self, centroids, offsets, ids, vectors, chunks=None, nprobe: int = 16):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.chunks = chunks
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @classmethod
+    def build(cls, vectors, nlist: int | None = None, iters: int = 20, seed: int = 0, chunks=None, nprobe: int = 16):
+        vectors = _normalize(vectors)
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(vectors.shape[0])))
+        nlist = min(nlist, vectors.shape[0])
+        centroids = train_centroids(vectors, nlist, iters=iters, seed=seed)
+        labels = _assign(vectors, centroids)
+        ids = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+        return cls(centroids, offsets, ids, np.ascontiguousarray(vectors[ids]), chunks, nprobe)
+
+    def save(self, out_dir: str):
+        os.makedirs(out_dir, exist_ok=True)
+        for name, arr in zip(IVF_FILES, (self.centroids, self.offsets, self.ids, self.vectors)):
+            np.save(os.path.join(out_dir, name), arr)
+
+    @classmethod
+    def load(cls, snapshot_dir: str, nprobe: int = 16, chunks=None):
+        arrs = [np.load(os.path.join(snapshot_dir, f), mmap_mode="r") for f in IVF_FILES]
+        if chunks is None:
+            chunks = NumpyIndex.load(snapshot_dir).chunks
+        return cls(*arrs, chunks=chunks, nprobe=nprobe)
+
+    def search_ids(self, queries, k: int, nprobe: int | None = None):
+        """(row ids, scores) per query; row ids index the original snapshot order"""
+        q = _normalize(np.atleast_2d(queries))
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = top_k(q @ self.centroids.T, nprobe)
+        out = []
+        for row in range(q.shape[0]):
+            spans = [(self.offsets[c], self.offsets[c + 1]) for c in probes[row]]
+            cand = np.concatenate([np.arange(s, e) for s, e in spans]) if spans else np.empty(0, np.int64)
+            if cand.size == 0:
+                out.append((np.empty(0, np.int64), np.empty(0, np.float32)))
+                continue
+            scores = self.vectors[cand] @ q[row]
+            best = top_k(scores[None, :], k)[0]
+            out.append((self.ids[cand[best]], scores[best]))
+        return out
+
+    def search(self, queries, k: int, nprobe: int | None = None):
+        return [
+            [{"id": self.chunks[i].get("id"), "content": self.chunks[i]["content"], "similarity": float(s)}
+             for i, s in zip(ids, scores)]
+            for ids, scores in self.search_ids(queries, k, nprobe)
+        ]
+
+
+def ivf_exists(snapshot_dir: str):
+    return all(os.path.exists(os.path.join(snapshot_dir, f)) for f in IVF_FILES)
+
+
+if __name__ == "__main__":
+    # python ann.py ./snapshot --nlist 1024   (snapshot from `python retrieval.py export`)
+    parser = argparse.ArgumentParser(description="build an IVF index next to a retrieval snapshot")
+    parser.add_argument("snapshot_dir")
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--iters", type=int, default=20)
+    args = parser.parse_args()
+
+    flat = NumpyIndex.load(args.snapshot_dir)
+    t = time.perf_counter()
+    index = IVFIndex.build(flat.vectors, nlist=args.nlist, iters=args.iters)
+    index.save(args.snapshot_dir)
+    print(f"built ivf over {len(index)} vectors, {index.nlist} lists in {time.perf_counter() - t:.1f}s")
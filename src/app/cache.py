@@ -0,0 +1,283 @@
+from array import array
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+_PUNCT = re.compile(r"[^\w\s]+")
+
+# shared sqlite files are trimmed back to their size limit every this many writes
+PRUNE_EVERY = 256
+
+
+def normalize_query(txt: str):
+    # "How many ANC visits?" and "how many  anc visits" share one entry
+    return " ".join(_PUNCT.sub(" ", txt.lower()).split())
+
+
+def open_shared(path: str):
+    # WAL lets every worker process read while one writes
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class EmbeddingCache:
+    """
+    LRU + TTL cache of query embeddings, optionally backed by a sqlite file.
+    The file can be shared by several worker processes: a key missing here
+    is looked up there, so an embedding fetched by one worker is a hit in all
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 86400, path: str | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_hits = 0
+        self._data = OrderedDict()
+        self._db = None
+        self._writes = 0
+        if path:
+            self._open(path)
+
+    def _open(self, path):
+        self._db = open_shared(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB, ts REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_ts ON embeddings (ts)")
+        self._db.execute("DELETE FROM embeddings WHERE ts < ?", (time.time() - self.ttl,))
+        rows = self._db.execute(
+            "SELECT key, vec, ts FROM embeddings ORDER BY ts DESC LIMIT ?", (self.maxsize,)
+        ).fetchall()
+        # oldest first so the most recent rows end up at the MRU end
+        for key, blob, ts in reversed(rows):
+            self._data[key] = (array("f", blob).tolist(), ts)
+
+    def key(self, txt: str):
+        return normalize_query(txt)
+
+    def get(self, key: str):
+        item = self._data.get(key)
+        if item is None and self._db is not None:
+            item = self._shared(key)
+        if item is None:
+            self.misses += 1
+            return None
+        vec, ts = item
+        if time.time() - ts > self.ttl:
+            self._drop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return vec
+
+    def _shared(self, key: str):
+        # put there by another worker since this one loaded the file
+        row = self._db.execute("SELECT vec, ts FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        item = (array("f", row[0]).tolist(), row[1])
+        self._data[key] = item
+        self._evict()
+        self.shared_hits += 1
+        return item
+
+    def put(self, key: str, vec):
+        ts = time.time()
+        self._data[key] = (list(vec), ts)
+        self._data.move_to_end(key)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", (key, array("f", vec).tobytes(), ts)
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune()
+        self._evict()
+
+    def _evict(self):
+        # only this process's memory; other workers may still be using the row in the file
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def _prune(self):
+        self._db.execute("DELETE FROM embeddings WHERE ts < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,),
+        )
+
+    def _drop(self, key):
+        self._data.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "shared_hits": self.shared_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def chunk_set_key(results):
+    """order-independent fingerprint of the chunks a query retrieved"""
+    return frozenset(hashlib.sha1(r["content"].encode()).hexdigest() for r in results)
+
+
+class SemanticCache:
+    """
+    answers keyed on query embedding similarity plus the retrieved chunk set.
+
+    cached query vectors live in one preallocated float32 matrix, so a lookup
+    is a single matrix-vector product over at most `maxsize` rows. With a
+    sqlite `path` shared by several workers, every answer is also appended
+    there and each lookup first pulls in the rows other workers added
+    """
+
+    def __init__(self, maxsize: int = 2048, threshold: float = 0.95, dim: int = 768, path: str | None = None):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._vecs = np.zeros((maxsize, dim), dtype=np.float32)
+        self._entries = [None] * maxsize
+        self._used = np.zeros(maxsize, dtype=np.int64)
+        self._size = 0
+        self._clock = 0
+        self.shared = 0
+        self._db = None
+        self._seen = 0
+        self._own = set()
+        if path:
+            self._open(path)
+
+    def _open(self, path):
+        self._db = open_shared(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY AUTOINCREMENT, vec BLOB, chunks TEXT, response TEXT, sources TEXT)"
+        )
+        # start from the newest maxsize answers
+        last = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM answers").fetchone()[0]
+        self._seen = max(0, last - self.maxsize)
+        self._sync()
+
+    def _sync(self):
+        rows = self._db.execute(
+            "SELECT id, vec, chunks, response, sources FROM answers WHERE id > ? ORDER BY id", (self._seen,)
+        ).fetchall()
+        for row_id, vec, chunks, response, sources in rows:
+            self._seen = row_id
+            if row_id in self._own:
+                self._own.discard(row_id)
+                continue
+            self._store(np.frombuffer(vec, dtype=np.float32), frozenset(json.loads(chunks)), response, json.loads(sources))
+            self.shared += 1
+
+    def __len__(self):
+        return self._size
+
+    def _unit(self, vec):
+        v = np.asarray(vec, dtype=np.float32)
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def _close(self, vec):
+        """(slot, similarity) of the cached queries above threshold, closest first"""
+        if self._db is not None:
+            self._sync()
+        if not self._size:
+            return []
+        scores = self._vecs[:self._size] @ self._unit(vec)
+        close = np.flatnonzero(scores >= self.threshold)
+        return [(int(slot), float(scores[slot])) for slot in close[np.argsort(-scores[close])]]
+
+    def get(self, vec, chunks: frozenset):
+        """(entry, similarity) for the closest cached query above threshold with the same chunks"""
+        for slot, score in self._close(vec):
+            entry = self._entries[slot]
+            if entry["chunks"] == chunks:
+                self._clock += 1
+                self._used[slot] = self._clock
+                self.hits += 1
+                return entry, score
+        self.misses += 1
+        return None, None
+
+    def nearest(self, vec, chunks: frozenset = None):
+        """
+        the closest cached query above threshold whose answer drew on at least
+        one of `chunks` (any, when None): a fallback when no answer can be generated
+        """
+        for slot, _ in self._close(vec):
+            entry = self._entries[slot]
+            if chunks is None or entry["chunks"] & chunks:
+                return entry
+        return None
+
+    def put(self, vec, chunks: frozenset, response: str, sources):
+        self._store(vec, chunks, response, sources)
+        if self._db is not None:
+            cur = self._db.execute(
+                "INSERT INTO answers (vec, chunks, response, sources) VALUES (?, ?, ?, ?)",
+                (self._unit(vec).tobytes(), json.dumps(sorted(chunks)), response, json.dumps(sources)),
+            )
+            self._own.add(cur.lastrowid)
+            if cur.lastrowid % PRUNE_EVERY == 0:
+                self._db.execute("DELETE FROM answers WHERE id <= ?", (cur.lastrowid - self.maxsize,))
+
+    def _store(self, vec, chunks: frozenset, response: str, sources):
+        if self._size < self.maxsize:
+            slot = self._size
+            self._size += 1
+        else:
+            # least recently used slot is overwritten in place
+            slot = int(np.argmin(self._used))
+            self.evictions += 1
+        self._clock += 1
+        self._vecs[slot] = self._unit(vec)
+        self._used[slot] = self._clock
+        self._entries[slot] = {"chunks": chunks, "response": response, "sources": sources}
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "shared": self.shared,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,33 @@
+import os
+
+import httpx
+from google import genai
+from supabase import ClientOptions, create_client
+
+
+def require_env(*names):
+    missing = [n for n in names if not os.getenv(n)]
+    if missing:
+        raise RuntimeError(f"missing environment variables: {', '.join(missing)}")
+    return [os.getenv(n) for n in names]
+
+
+def pool_limits(pool_size: int, keepalive: float):
+    # keep idle connections around so requests skip the TLS handshake
+    return httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=keepalive)
+
+
+def make_genai_client(pool_size: int, keepalive: float):
+    (api_key,) = require_env("GEMINI_API_KEY")
+    limits = pool_limits(pool_size, keepalive)
+    return genai.Client(
+        api_key=api_key,
+        http_options=genai.types.HttpOptions(client_args={"limits": limits}, async_client_args={"limits": limits}),
+    )
+
+
+def make_supabase_client(pool_size: int, keepalive: float, timeout: float = 120):
+    # a call given up on at its await still holds a worker thread until httpx times it out
+    url, key = require_env("SUPABASE_URL", "SUPABASE_SERVICE_KEY")
+    http = httpx.Client(limits=pool_limits(pool_size, keepalive), timeout=timeout)
+    return create_client(url, key, options=ClientOptions(httpx_client=http)), http
@@ -0,0 +1,60 @@
+from text import jaccard, shingles
+
+
+def estimate_tokens(text: str):
+    # about 4 characters per token for English; close enough to budget a prompt without a tokenizer
+    return (len(text) + 3) // 4
+
+
+def assemble_context(results, token_budget: int = 0, min_similarity: float = 0.0,
+                     near_dup: float = 1.0, margin: float = None):
+    """
+    picks the chunks that go into the prompt, best first: drops exact and
+    near duplicates (word-shingle jaccard >= near_dup), chunks under
+    min_similarity or more than `margin` below the best one, and whatever
+    no longer fits in token_budget (0 = no budget). The best chunk is always
+    kept, cut to the budget if it does not fit on its own.
+    returns (kept, report)
+    """
+    ranked = sorted(results, key=lambda r: r.get("similarity", 0), reverse=True)
+    dropped = {"duplicate": 0, "low_similarity": 0, "adaptive": 0, "budget": 0}
+    kept, seen = [], []
+    used = 0
+    top = ranked[0].get("similarity", 0) if ranked else 0
+
+    for i, r in enumerate(ranked):
+        sim = r.get("similarity", 0)
+        if i and sim < min_similarity:
+            dropped["low_similarity"] += 1
+            continue
+        if i and margin is not None and sim < top - margin:
+            dropped["adaptive"] += 1
+            continue
+
+        sh = shingles(r["content"])
+        if any(jaccard(sh, s) >= near_dup for s in seen):
+            dropped["duplicate"] += 1
+            continue
+
+        cost = estimate_tokens(r["content"]) + 1
+        if token_budget and used + cost > token_budget:
+            if kept:
+                dropped["budget"] += 1
+                continue
+            r = {**r, "content": r["content"][:token_budget * 4]}
+            cost = estimate_tokens(r["content"])
+        seen.append(sh)
+        kept.append(r)
+        used += cost
+
+    before = estimate_tokens("\n".join(r["content"] for r in results))
+    after = estimate_tokens("\n".join(r["content"] for r in kept))
+    report = {
+        "retrieved": len(results),
+        "kept": len(kept),
+        "dropped": dropped,
+        "tokens_retrieved": before,
+        "tokens_kept": after,
+        "tokens_saved": before - after,
+    }
+    return kept, report
@@ -0,0 +1,306 @@
+import re
+
+import numpy as np
+
+from retrieval import _normalize, top_k
+from text import tokenize
+
+# the knowledge_generator.py sentence template; chunks written from it carry these facts in their text
+_CHUNK_AGE = re.compile(r"\baged (\d+)\b")
+_CHUNK_FEW_ANC = re.compile(r"\bfewer \((\d+)\) than recommended antenatal visits\b")
+_TEMPLATE = "Regular antenatal care and monitoring can improve maternal outcomes."
+
+# what a query can ask for, checked in order
+_Q_AGE_RANGE = re.compile(r"\b(?:aged?|between)\s*(\d{2})\s*(?:-|to|and)\s*(\d{2})\b")
+_Q_AGE = re.compile(r"\b(?:aged?|age of)\s*(\d{2})\b|\b(\d{2})[- ]years?[- ]old\b")
+_Q_AGE_UNDER = re.compile(r"\b(?:under|below|younger than)\s*(\d{2})\b")
+_Q_AGE_OVER = re.compile(r"\b(?:over|above|older than)\s*(\d{2})\b")
+_Q_LOW_EDU = re.compile(r"\b(?:low|no|little|poor|without)\s+(?:formal\s+)?education\b|\b(?:uneducated|illiterate)\b")
+_Q_HIGH_EDU = re.compile(r"\b(?:high|higher|moderate|secondary)\s+(?:formal\s+)?education\b|\beducated\b")
+_Q_ANC = re.compile(r"\b(?:anc|antenatal)(?:\s+care)?\s+visits?\s*(?:of|:|=)?\s*(\d+)\b|\b(\d+)\s+(?:anc|antenatal)(?:\s+care)?\s+visits?\b")
+_Q_NO_ANC = re.compile(r"\bno\s+(?:anc|antenatal)\b")
+_Q_FEW_ANC = re.compile(r"\bfew(?:er)?\s+(?:anc|antenatal)\b")
+_Q_HIGH_BP = re.compile(r"\bhigh\s+(?:blood\s+pressure|bp)\b|\bhypertensi\w*")
+_Q_NORMAL_BP = re.compile(r"\b(?:normal|low)\s+(?:blood\s+pressure|bp)\b")
+_Q_NOT_HIGH_RISK = re.compile(r"\b(?:not|no|low)\s+(?:classified\s+as\s+)?(?:high[- ])?risk\b")
+_Q_HIGH_RISK = re.compile(r"\bhigh[- ]risk\b")
+
+# "no high blood pressure", "does not have hypertension", "isn't high risk", "non-hypertensive"
+_NEGATION = re.compile(r"\b(?:no|not|without|never|non)\b|n't\b")
+_CLAUSE = re.compile(r"[,.;:!?]|\b(?:and|but|with|who|while)\b")
+
+# constraints dropped one by one, in this order, when too few chunks match them all
+RELAX_ORDER = ("anc_visits", "age", "low_education", "high_bp", "few_anc_visits", "high_risk")
+AGE_WIDEN = (2, 5)
+
+
+def chunk_fields(chunk):
+    """
+    the structured fields of a chunk, read back from the template sentence;
+    snapshots hold only ids, texts and vectors. None where the chunk does
+    not say
+    """
+    text = chunk["content"]
+    if _TEMPLATE not in text:
+        return {}
+    age = _CHUNK_AGE.search(text)
+    anc = _CHUNK_FEW_ANC.search(text)
+    return {
+        "age": int(age.group(1)) if age else None,
+        "low_education": "with low formal education" in text,
+        "few_anc_visits": anc is not None,
+        "anc_visits": int(anc.group(1)) if anc else None,
+        "high_bp": "high blood pressure" in text,
+        "high_risk": "is considered high risk" in text,
+    }
+
+
+def _negated(t: str, start: int):
+    # a negation among the last three words of the same clause before the match
+    clause = _CLAUSE.split(t[:start])[-1]
+    return bool(_NEGATION.search(" ".join(clause.split()[-3:])))
+
+
+def parse_query(text: str):
+    """
+    filter constraints in a free-text question, e.g. "a woman aged 15 with low
+    education, anc visits 2" -> {"age": (15, 15), "low_education": True,
+    "few_anc_visits": True, "anc_visits": 2}. A negated mention ("no high
+    blood pressure") constrains the field to False
+    """
+    t = text.lower()
+    c = {}
+    if m := _Q_AGE_RANGE.search(t):
+        c["age"] = (int(m.group(1)), int(m.group(2)))
+    elif m := _Q_AGE.search(t):
+        n = int(m.group(1) or m.group(2))
+        c["age"] = (n, n)
+    elif m := _Q_AGE_UNDER.search(t):
+        c["age"] = (0, int(m.group(1)) - 1)
+    elif m := _Q_AGE_OVER.search(t):
+        c["age"] = (int(m.group(1)) + 1, 200)
+
+    if m := _Q_LOW_EDU.search(t):
+        c["low_education"] = not _negated(t, m.start())
+    elif m := _Q_HIGH_EDU.search(t):
+        c["low_education"] = _negated(t, m.start())
+
+    if m := _Q_ANC.search(t):
+        n = int(m.group(1) or m.group(2))
+        c["few_anc_visits"] = n < 4
+        if n < 4:
+            c["anc_visits"] = n
+    elif _Q_NO_ANC.search(t):
+        c["few_anc_visits"] = True
+        c["anc_visits"] = 0
+    elif _Q_FEW_ANC.search(t):
+        c["few_anc_visits"] = True
+
+    if m := _Q_HIGH_BP.search(t):
+        c["high_bp"] = not _negated(t, m.start())
+    elif _Q_NORMAL_BP.search(t):
+        c["high_bp"] = False
+
+    if _Q_NOT_HIGH_RISK.search(t):
+        c["high_risk"] = False
+    elif m := _Q_HIGH_RISK.search(t):
+        c["high_risk"] = not _negated(t, m.start())
+    return c
+
+
+class MetadataIndex:
+    """
+    columnar filter over chunk fields: age as a sorted array for range
+    lookups, the flags and ANC counts as one boolean bitmap per value. A
+    chunk that does not state a field at all (prose rather than the
+    template) is not excluded by a constraint on it; the constraint counts
+    as unstated for that chunk, so the search can rank it below chunks
+    that state a match
+    """
+
+    FLAGS = ("low_education", "few_anc_visits", "high_bp", "high_risk")
+    FIELDS = ("age", "anc_visits") + FLAGS
+
+    def __init__(self, fields):
+        self.n = len(fields)
+        age = np.array([f.get("age") if f.get("age") is not None else -1 for f in fields], dtype=np.int16)
+        self.age_order = np.argsort(age, kind="stable")
+        self.age_sorted = age[self.age_order]
+        self.stated = {name: np.array([name in f for f in fields], dtype=bool) for name in self.FIELDS}
+        self.bitmaps = {}
+        for name in self.FLAGS:
+            values = [f.get(name) for f in fields]
+            self.bitmaps[(name, True)] = np.array([v is True for v in values])
+            self.bitmaps[(name, False)] = np.array([v is False for v in values])
+        anc = np.array([f.get("anc_visits") if f.get("anc_visits") is not None else -1 for f in fields], dtype=np.int16)
+        for v in np.unique(anc[anc >= 0]).tolist():
+            self.bitmaps[("anc_visits", v)] = anc == v
+
+    def _age(self, lo, hi):
+        mask = np.zeros(self.n, dtype=bool)
+        start = np.searchsorted(self.age_sorted, max(lo, 0), side="left")
+        end = np.searchsorted(self.age_sorted, hi, side="right")
+        mask[self.age_order[start:end]] = True
+        return mask
+
+    def match(self, constraints):
+        """
+        (mask of the chunks meeting or not stating every constraint, how many
+        of the constraints each chunk does not state); (None, None) without
+        constraints
+        """
+        if not constraints:
+            return None, None
+        mask = np.ones(self.n, dtype=bool)
+        unstated = np.zeros(self.n, dtype=np.int8)
+        for name, value in constraints.items():
+            if name == "age":
+                hit = self._age(*value)
+            else:
+                hit = self.bitmaps.get((name, value))
+                if hit is None:
+                    hit = np.zeros(self.n, dtype=bool)
+            missing = ~self.stated[name]
+            mask &= hit | missing
+            unstated += missing
+        return mask, unstated
+
+    def relaxed_match(self, constraints, min_count: int):
+        """
+        match(), loosening the constraints until at least min_count chunks
+        state a match for all of them (see relaxations). Returns (mask or
+        None, unstated counts or None, constraints applied)
+        """
+        for tried in relaxations(constraints):
+            mask, unstated = self.match(tried)
+            if np.count_nonzero(mask & (unstated == 0)) >= min_count:
+                return mask, unstated, tried
+        return None, None, {}
+
+
+def relaxations(constraints):
+    """the constraints, then the age range widened, then constraints dropped in RELAX_ORDER"""
+    tried = dict(constraints)
+    if not tried:
+        return
+    yield tried
+    if "age" in tried:
+        lo, hi = tried["age"]
+        for w in AGE_WIDEN:
+            yield {**tried, "age": (lo - w, hi + w)}
+    for name in RELAX_ORDER:
+        if name in tried:
+            tried = {k: v for k, v in tried.items() if k != name}
+            if tried:
+                yield tried
+
+
+class BM25Index:
+    """inverted index over chunk text with BM25 weights computed at build time"""
+
+    def __init__(self, texts, k1: float = 1.2, b: float = 0.75):
+        self.n = len(texts)
+        docs = [tokenize(t) for t in texts]
+        lengths = np.array([len(d) for d in docs], dtype=np.float32)
+        avgdl = float(lengths.mean()) if self.n else 0.0
+        postings = {}
+        for i, doc in enumerate(docs):
+            counts = {}
+            for w in doc:
+                counts[w] = counts.get(w, 0) + 1
+            for w, tf in counts.items():
+                postings.setdefault(w, ([], []))
+                postings[w][0].append(i)
+                postings[w][1].append(tf)
+
+        self.postings = {}
+        for w, (ids, tfs) in postings.items():
+            ids = np.array(ids, dtype=np.int32)
+            tf = np.array(tfs, dtype=np.float32)
+            idf = np.log(1 + (self.n - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = k1 * (1 - b + b * lengths[ids] / avgdl)
+            self.postings[w] = (ids, (idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+
+    def scores(self, query: str):
+        out = np.zeros(self.n, dtype=np.float32)
+        for w in set(tokenize(query)):
+            p = self.postings.get(w)
+            if p is not None:
+                out[p[0]] += p[1]
+        return out
+
+
+class HybridIndex:
+    """
+    exact cosine search over a snapshot (see NumpyIndex), narrowed first by
+    the constraints parsed from the question (MetadataIndex) and then to
+    the lexical_k best BM25 matches, so only the survivors are dense-scored.
+    A survivor that does not state a constrained field ranks as if its
+    similarity were unstated_penalty lower per such field. Without the
+    question text it is plain dense search
+    """
+
+    name = "hybrid"
+
+    def __init__(self, flat, lexical_k: int = 200, unstated_penalty: float = 0.02):
+        self.flat = flat
+        self.vectors = flat.vectors
+        self.chunks = flat.chunks
+        self.lexical_k = lexical_k
+        self.unstated_penalty = unstated_penalty
+        self.metadata = MetadataIndex([chunk_fields(c) for c in self.chunks])
+        self.bm25 = BM25Index([c["content"] for c in self.chunks])
+        self.queries = 0
+        self.filtered = 0
+        self.relaxed = 0
+        self.candidates_total = 0
+
+    def __len__(self):
+        return len(self.flat)
+
+    def candidates(self, text: str, k: int):
+        """(chunk ids to dense-score, constrained fields each one does not state, constraints applied)"""
+        constraints = parse_query(text)
+        mask, unstated, applied = self.metadata.relaxed_match(constraints, k)
+        if mask is None:
+            ids = np.arange(len(self.flat))
+            unstated = np.zeros(len(ids), dtype=np.int8)
+        else:
+            ids = np.flatnonzero(mask)
+            unstated = unstated[ids]
+        if self.lexical_k and len(ids) > self.lexical_k:
+            lex = self.bm25.scores(text)[ids]
+            # only prefilter when the words actually match something, so a paraphrase
+            # with no word in common still gets dense search
+            if np.count_nonzero(lex) >= k:
+                best = top_k(lex[None, :], self.lexical_k)[0]
+                keep = np.sort(best[lex[best] > 0])
+                ids, unstated = ids[keep], unstated[keep]
+
+        self.queries += 1
+        self.filtered += bool(applied)
+        self.relaxed += applied != constraints
+        self.candidates_total += len(ids)
+        return ids, unstated, applied
+
+    def search(self, queries, k: int, texts=None):
+        if texts is None:
+            return self.flat.search(queries, k)
+        q = _normalize(np.atleast_2d(queries))
+        out = []
+        for row, text in enumerate(texts):
+            ids, unstated, _ = self.candidates(text, k)
+            scores = np.asarray(self.vectors[ids]) @ q[row]
+            # ranked with the penalty, reported with the plain similarity
+            best = top_k((scores - self.unstated_penalty * unstated)[None, :], k)[0]
+            out.append([self.flat._record(int(ids[i]), scores[i]) for i in best])
+        return out
+
+    def stats(self):
+        return {
+            "chunks": len(self.flat),
+            "queries": self.queries,
+            "filtered": self.filtered,
+            "relaxed": self.relaxed,
+            "mean_candidates": self.candidates_total / self.queries if self.queries else 0.0,
+        }
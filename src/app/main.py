@@ -1,22 +1,334 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from supabase import create_client
 from google import genai
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager, contextmanager
+from clients import make_genai_client, make_supabase_client
+from pipeline import Admission, Coalescer, LatencyWindow, Overloaded, Stage
+from metrics import CHARS, SECONDS, STAGE_SECONDS, Registry, Trace, current_trace, error_kind, timed
+from context import assemble_context
+from cache import EmbeddingCache, SemanticCache, chunk_set_key
+from retrieval import NumpyIndex, SupabaseRetriever, snapshot_exists, snapshot_id
+from ann import IVFIndex, ivf_exists
+from hybrid import HybridIndex
+from resilience import CircuitBreaker, CircuitOpen, Deadline, Upstream, transient
+from routing import Route, Router, load_known_questions
+import asyncio
+import json
+import logging
+import math
 import os
+import time
+
+IMPORTED_AT = time.perf_counter()
+
+# uvicorn sets this logger up, so these lines show up with its own
+log = logging.getLogger("uvicorn.error")
 
 MODEL = "models/text-embedding-004"
 
 load_dotenv()
 
-app = FastAPI()
+# per-stage concurrency, queue-depth cap and per-request timeout (seconds)
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 16))
+RETRIEVE_CONCURRENCY = int(os.getenv("RETRIEVE_CONCURRENCY", 16))
+GENERATE_CONCURRENCY = int(os.getenv("GENERATE_CONCURRENCY", 8))
+MAX_PENDING = int(os.getenv("MAX_PENDING", 64))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 60))
+
+# upstream calls: embedding and retrieval each get at most their share of REQUEST_TIMEOUT, generation the rest;
+# transient failures are retried with jittered backoff while that budget still covers a typical call
+EMBED_TIMEOUT_SHARE = float(os.getenv("EMBED_TIMEOUT_SHARE", 0.15))
+RETRIEVE_TIMEOUT_SHARE = float(os.getenv("RETRIEVE_TIMEOUT_SHARE", 0.15))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", 2))
+RETRY_BACKOFF_MS = float(os.getenv("RETRY_BACKOFF_MS", 100))
+# embedding and RPC calls still running after this percentile of their recent latency are sent a second time; 0 = never
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 0))
+# an upstream is failed fast for BREAKER_RESET_S after BREAKER_FAILURES consecutive failures; 0 = no breaker
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET_S = float(os.getenv("BREAKER_RESET_S", 10))
+# when generation is unavailable, answer with the closest cached answer or else the retrieved text itself
+DEGRADED_ANSWERS = os.getenv("DEGRADED_ANSWERS", "1") == "1"
+
+# concurrent query embeddings are sent as one batch: flushed after EMBED_BATCH_WAIT_MS or at EMBED_BATCH_SIZE
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 5))
+
+# /chat/batch: most questions per call, and how many of one batch's answers are generated at once
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+# Gemini accepts at most this many contents per embed_content call
+EMBED_MAX_BATCH = 100
+
+# query embedding cache; set EMBED_CACHE_PATH to keep it across restarts and share it between worker processes
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 4096))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", 86400))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH") or None
+
+# answers reused for paraphrases: cosine >= threshold and the same retrieved chunks; size 0 disables.
+# ANSWER_CACHE_PATH shares them between worker processes through a sqlite file
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 2048))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH") or None
+
+# prompt context: token budget (0 = none), similarity floor, near-duplicate jaccard threshold;
+# with ADAPTIVE_MATCH_COUNT=1 up to ADAPTIVE_MAX chunks are fetched and those within ADAPTIVE_MARGIN of the best are kept
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+CONTEXT_MIN_SIMILARITY = float(os.getenv("CONTEXT_MIN_SIMILARITY", 0.3))
+CONTEXT_NEAR_DUP = float(os.getenv("CONTEXT_NEAR_DUP", 0.75))
+ADAPTIVE_MATCH_COUNT = os.getenv("ADAPTIVE_MATCH_COUNT", "0") == "1"
+ADAPTIVE_MAX = int(os.getenv("ADAPTIVE_MAX", 10))
+ADAPTIVE_MARGIN = float(os.getenv("ADAPTIVE_MARGIN", 0.1))
+
+# answer generation; with ROUTING=1 known questions (word overlap with ROUTE_KNOWN_QUESTIONS) and short questions
+# (<= ROUTE_MAX_WORDS) whose best chunk has similarity >= ROUTE_MIN_SIMILARITY go to the fast model/token cap
+GENERATION_MODEL = os.getenv("GENERATION_MODEL", "gemini-2.5-pro")
+GENERATION_MAX_TOKENS = int(os.getenv("GENERATION_MAX_TOKENS", 1024))
+ROUTING = os.getenv("ROUTING", "0") == "1"
+ROUTE_FAST_MODEL = os.getenv("ROUTE_FAST_MODEL", "gemini-2.5-flash")
+ROUTE_FAST_MAX_TOKENS = int(os.getenv("ROUTE_FAST_MAX_TOKENS", 512))
+ROUTE_MAX_WORDS = int(os.getenv("ROUTE_MAX_WORDS", 12))
+ROUTE_MIN_SIMILARITY = float(os.getenv("ROUTE_MIN_SIMILARITY", 0.75))
+ROUTE_KNOWN_QUESTIONS = os.getenv("ROUTE_KNOWN_QUESTIONS", "./known_questions.txt")
+ROUTE_KNOWN_OVERLAP = float(os.getenv("ROUTE_KNOWN_OVERLAP", 0.6))
+
+# "supabase" (match_knowledge RPC), "numpy" (exact, local snapshot), "ivf" (approximate, see ann.py)
+# or "hybrid" (metadata filter + BM25 prefilter + exact dense scoring of the survivors, see hybrid.py)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "supabase")
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshot")
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+# chunks kept by the hybrid BM25 prefilter before dense scoring; 0 = metadata filter only
+HYBRID_LEXICAL_K = int(os.getenv("HYBRID_LEXICAL_K", 200))
+# similarity a hybrid result loses per filtered field its chunk does not state (prose, not the template)
+HYBRID_UNSTATED_PENALTY = float(os.getenv("HYBRID_UNSTATED_PENALTY", 0.02))
+# how often (s) each worker checks whether SNAPSHOT_DIR points at a newly published snapshot; 0 = never
+SNAPSHOT_RELOAD_S = float(os.getenv("SNAPSHOT_RELOAD_S", 30))
+
+# keep-alive pool per upstream client and whether to prime connections/indexes before readiness
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", 60))
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+# requests slower than this (ms) are logged with their per-stage breakdown
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 5000))
+
+# created in lifespan(); anything already set (e.g. a stub in a benchmark) is kept
+client = None
+supabase = None
+retriever = None
+snapshot_loaded = None
+_supabase_http = None
+
+startup = {"ready": False, "startup_ms": None, "warmup_ms": None, "warmup_error": None,
+           "import_to_ready_ms": None, "first_request_ms": None}
+
+admission = Admission(MAX_PENDING)
+embed_stage = Stage("embed", EMBED_CONCURRENCY)
+retrieve_stage = Stage("retrieve", RETRIEVE_CONCURRENCY)
+generate_stage = Stage("generate", GENERATE_CONCURRENCY)
+
+ttft_ms = LatencyWindow()
+generation_ms = LatencyWindow()
+
+def make_upstream(name: str, hedge_percentile: float = 0):
+    return Upstream(name, CircuitBreaker(name, BREAKER_FAILURES, BREAKER_RESET_S), UPSTREAM_RETRIES, RETRY_BACKOFF_MS, hedge_percentile)
+
+gemini_embed = make_upstream("gemini_embed", HEDGE_PERCENTILE)
+supabase_rpc = make_upstream("supabase", HEDGE_PERCENTILE)
+# generation is neither hedged nor cheap to repeat; it is retried only if the deadline leaves room.
+# The fast route has its own breaker, so an outage of one model does not fail the other
+gemini_generate = make_upstream("gemini_generate")
+gemini_generate_fast = make_upstream("gemini_generate_fast") if ROUTING else None
+upstreams = tuple(u for u in (gemini_embed, supabase_rpc, gemini_generate, gemini_generate_fast) if u is not None)
+BREAKER_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+embed_cache = EmbeddingCache(EMBED_CACHE_SIZE, EMBED_CACHE_TTL, EMBED_CACHE_PATH)
+answer_cache = SemanticCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD, path=ANSWER_CACHE_PATH) if ANSWER_CACHE_SIZE > 0 else None
+
+metrics = Registry()
+metrics.histogram(STAGE_SECONDS, "Time spent in each /chat pipeline stage.", SECONDS)
+metrics.histogram("http_request_seconds", "Request latency by route (streams: until the last event).", SECONDS)
+metrics.counter("http_requests_total", "Requests by route and status.")
+metrics.counter("upstream_calls_total", "Calls to Gemini and the retriever.")
+metrics.counter("upstream_errors_total", "Failed upstream calls by kind (rate_limit, timeout, server, error).")
+metrics.callback("upstream_retries_total", "Upstream calls retried after a failure.",
+                 lambda: [({"upstream": u.name}, u.retried) for u in upstreams], "counter")
+metrics.callback("upstream_hedges_total", "Hedged second requests sent, and how many finished first.",
+                 lambda: [({"upstream": u.name, "result": r}, n) for u in upstreams for r, n in (("sent", u.hedged), ("won", u.hedge_wins))], "counter")
+metrics.callback("upstream_starved_total", "Upstream calls that timed out on the caller's deadline, not counted against the breaker.",
+                 lambda: [({"upstream": u.name}, u.starved) for u in upstreams], "counter")
+metrics.callback("upstream_circuit_state", "Circuit breaker per upstream: 0 closed, 1 half open, 2 open.",
+                 lambda: [({"upstream": u.name}, BREAKER_STATES[u.breaker.state]) for u in upstreams])
+metrics.callback("upstream_circuit_opened_total", "Times an upstream's breaker opened.",
+                 lambda: [({"upstream": u.name}, u.breaker.opened) for u in upstreams], "counter")
+metrics.callback("upstream_rejected_total", "Calls failed fast while an upstream's breaker was open.",
+                 lambda: [({"upstream": u.name}, u.breaker.rejected) for u in upstreams], "counter")
+metrics.counter("chat_generation_routes_total", "Generated answers by route (full, fast) and the reason it was chosen.")
+metrics.histogram("chat_generation_seconds", "Answer generation time by route.", SECONDS)
+metrics.counter("chat_degraded_total", "Answers served without generation, by kind (cached, retrieval_only).")
+metrics.histogram("chat_prompt_chars", "Size of the generation prompt.", CHARS)
+metrics.histogram("chat_context_tokens_saved", "Estimated prompt tokens removed by context assembly.", [0, 50, 100, 250, 500, 1000, 2000, 4000])
+metrics.counter("chat_context_chunks_dropped_total", "Retrieved chunks left out of the prompt, by reason.")
+metrics.counter("snapshot_reloads_total", "Switches to a newly published retrieval snapshot, by result.")
+metrics.histogram("chat_response_chars", "Size of the generated answer.", CHARS)
+metrics.histogram("chat_batch_size", "Questions per /chat/batch call.", [1, 2, 5, 10, 25, 50, 100])
+metrics.counter("chat_batch_items_total", "/chat/batch answers by status.")
+metrics.callback("chat_inflight_requests", "Requests admitted and not finished.", lambda: admission.pending)
+metrics.callback("chat_stage_active", "Calls running per stage.", lambda: [({"stage": st.name}, st.active) for st in stages])
+metrics.callback("chat_stage_waiting", "Calls waiting for a stage slot.", lambda: [({"stage": st.name}, st.waiting) for st in stages])
+
+
+stages = (embed_stage, retrieve_stage, generate_stage)
+
+
+@contextmanager
+def upstream(name: str):
+    metrics.inc("upstream_calls_total", upstream=name)
+    try:
+        yield
+    except Exception as e:
+        metrics.inc("upstream_errors_total", upstream=name, kind=error_kind(e))
+        raise
+
+
+def finish_trace(trace: Trace, route: str, status: int):
+    if trace.finished:
+        return
+    trace.finished = True
+    total = trace.elapsed_ms()
+    metrics.inc("http_requests_total", route=route, status=str(status))
+    metrics.observe("http_request_seconds", total / 1000, route=route)
+    if total >= SLOW_REQUEST_MS:
+        log.warning(json.dumps({"slow_request": trace.id, "route": route, "status": status, "total_ms": round(total, 1),
+                          "generation_route": trace.generation_route, "stages": trace.stages}))
+
+
+def load_retriever(backend: str, snapshot_dir: str):
+    if backend in ("numpy", "ivf", "hybrid"):
+        if snapshot_exists(snapshot_dir):
+            if backend == "hybrid":
+                return HybridIndex(NumpyIndex.load(snapshot_dir), HYBRID_LEXICAL_K, HYBRID_UNSTATED_PENALTY)
+            if backend == "ivf" and ivf_exists(snapshot_dir):
+                return IVFIndex.load(snapshot_dir, nprobe=IVF_NPROBE)
+            if backend == "ivf":
+                log.warning(f"no ivf index in {snapshot_dir}, using exact numpy search")
+            return NumpyIndex.load(snapshot_dir)
+        log.warning(f"no snapshot in {snapshot_dir}, falling back to supabase")
+    return SupabaseRetriever(supabase)
+
+def load_snapshot():
+    """
+    (retriever, snapshot id). The snapshot files are memory-mapped read-only,
+    so every worker shares one copy in the page cache. SNAPSHOT_DIR is
+    resolved once, so a snapshot published while loading cannot mix in
+    """
+    loaded = snapshot_id(SNAPSHOT_DIR)
+    index = load_retriever(RETRIEVAL_BACKEND, loaded[0] if loaded else SNAPSHOT_DIR)
+    return index, (loaded if index.name != "supabase" else None)
+
+async def watch_snapshot():
+    global retriever, snapshot_loaded
+    # a publish that failed to load is not retried until the next one
+    failed = None
+    while True:
+        await asyncio.sleep(SNAPSHOT_RELOAD_S)
+        current = None
+        try:
+            current = snapshot_id(SNAPSHOT_DIR)
+            if current is None or current in (snapshot_loaded, failed):
+                continue
+            # built off the event loop; requests keep searching the old index until the swap
+            new, loaded = await asyncio.to_thread(load_snapshot)
+            if loaded is None:
+                # load_snapshot fell back to supabase: the published dir is not a complete snapshot
+                raise ValueError(f"{current[0]} has no complete local snapshot")
+            retriever, snapshot_loaded = new, loaded
+        except Exception as e:
+            failed = current
+            metrics.inc("snapshot_reloads_total", result="error")
+            log.error(f"snapshot reload from {current and current[0]} failed, "
+                      f"keeping {snapshot_loaded and snapshot_loaded[0]}: {e!r}")
+            continue
+        metrics.inc("snapshot_reloads_total", result="ok")
+        log.info(f"switched to snapshot {loaded[0]} ({len(new)} chunks)")
+
+
+def ensure_clients():
+    global client, supabase, retriever, snapshot_loaded, _supabase_http
+    if client is None:
+        client = make_genai_client(HTTP_POOL_SIZE, HTTP_KEEPALIVE)
+    if supabase is None:
+        # bounded by the retrieve budget, so an abandoned RPC frees its retrieve_stage thread soon after
+        supabase, _supabase_http = make_supabase_client(HTTP_POOL_SIZE, HTTP_KEEPALIVE, REQUEST_TIMEOUT * RETRIEVE_TIMEOUT_SHARE)
+    if retriever is None:
+        retriever, snapshot_loaded = load_snapshot()
+
+async def warm_up():
+    # one real embed + retrieval opens the pooled connections and pages in any local index
+    resp = await client.aio.models.embed_content(
+        model=MODEL, contents="antenatal care", config=genai.types.EmbedContentConfig(task_type="RETRIEVAL_QUERY"),
+    )
+    await retrieve_stage.run(match_knowledge, resp.embeddings[0].values, 1)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    t0 = time.perf_counter()
+    ensure_clients()
+    if WARMUP:
+        t1 = time.perf_counter()
+        try:
+            await warm_up()
+        except Exception as e:
+            # a failed warm-up only means the first requests pay the handshakes
+            startup["warmup_error"] = str(e)
+            log.warning(f"warm-up failed: {e}")
+        startup["warmup_ms"] = round((time.perf_counter() - t1) * 1000, 1)
+    startup["startup_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    startup["import_to_ready_ms"] = round((time.perf_counter() - IMPORTED_AT) * 1000, 1)
+    startup["ready"] = True
+    watcher = None
+    if SNAPSHOT_RELOAD_S > 0 and RETRIEVAL_BACKEND != "supabase":
+        watcher = asyncio.create_task(watch_snapshot())
+    yield
+    startup["ready"] = False
+    if watcher is not None:
+        watcher.cancel()
+    for st in stages:
+        st.shutdown()
+    embed_cache.close()
+    if answer_cache is not None:
+        answer_cache.close()
+    if _supabase_http is not None:
+        _supabase_http.close()
+    if hasattr(client, "aio") and hasattr(client.aio, "aclose"):
+        await client.aio.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],)
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # the trace is shared with the handler (and a streamed body) through a context variable
+    trace = Trace(request.headers.get("x-request-id"), request.url.path)
+    token = current_trace.set(trace)
+    try:
+        response = await call_next(request)
+    finally:
+        current_trace.reset(token)
+    response.headers["X-Trace-Id"] = trace.id
+
+    route = getattr(request.scope.get("route"), "path", "other")
+    # streams are finished by the generator once the last event is sent
+    if not trace.streaming:
+        finish_trace(trace, route, response.status_code)
+    if startup["first_request_ms"] is None and route.startswith("/chat"):
+        startup["first_request_ms"] = round(trace.elapsed_ms(), 1)
+    return response
 
 
 class ChatResponse(BaseModel):
@@ -27,25 +339,122 @@ class ChatRequest(BaseModel):
     message: str
     match_count: int = 3
 
-def embedding_task(txt: str):
-    try:
-        resp = client.models.embed_content(model=MODEL, contents=txt, config=genai.types.EmbedContentConfig(task_type="RETRIEVAL_QUERY"))
-        return resp.embeddings[0].values
-    except Exception as e:
-        return f"got error: {e}"
+class ChatBatchRequest(BaseModel):
+    requests: list[ChatRequest]
+    # NDJSON, one line per answer as it completes, instead of all results in order
+    stream: bool = False
+
+class ChatBatchItem(BaseModel):
+    index: int
+    response: str | None = None
+    sources: list | None = None
+    # {"status": ..., "detail": ...} when this question failed; the rest of the batch is unaffected
+    error: dict | None = None
+    # "cached" or "retrieval_only" when the answer was not generated (see DEGRADED_ANSWERS)
+    degraded: str | None = None
+    # generation route ("full" or "fast"); None for a cached answer
+    route: str | None = None
+
+class ChatBatchResponse(BaseModel):
+    results: list[ChatBatchItem]
+
+async def embed_batch(texts: list, timeout: float = None):
+    async def attempt():
+        with upstream("gemini_embed"):
+            return await embed_stage.run_async(
+                client.aio.models.embed_content,
+                model=MODEL, contents=texts, config=genai.types.EmbedContentConfig(task_type="RETRIEVAL_QUERY"),
+            )
+    resp = await gemini_embed.call(attempt, REQUEST_TIMEOUT * EMBED_TIMEOUT_SHARE if timeout is None else timeout)
+    return [e.values for e in resp.embeddings]
+
+# a flush is one embed_content call, so it is held to the API's limit too
+embed_coalescer = Coalescer(embed_batch, min(EMBED_BATCH_SIZE, EMBED_MAX_BATCH), EMBED_BATCH_WAIT_MS)
+metrics.callback("embed_batch_size", "Queries per batched embedding call.", lambda: embed_coalescer.batch_size, "histogram")
+metrics.callback("embed_batch_wait_ms", "Time a query waited for its embedding batch to be sent.", lambda: embed_coalescer.wait_ms, "histogram")
 
-def search_knowledge(q: str, match_cnt: int):
-    q_embed = embedding_task(q)
+def cache_lookups(*named):
+    return [({"cache": name, "result": r}, getattr(c, attr)) for name, c in named if c is not None
+            for r, attr in (("hit", "hits"), ("miss", "misses"))]
 
-    res = supabase.rpc('match_knowledge', {
-        "query_embedding": q_embed,
-        "match_count": match_cnt
-    }).execute()
+metrics.callback("cache_lookups_total", "Embedding and answer cache lookups by result.",
+                 lambda: cache_lookups(("embedding", embed_cache), ("answer", answer_cache)), "counter")
 
-    return res.data
+async def embedding_task(txt: str, timeout: float = None):
+    key = embed_cache.key(txt)
+    cached = embed_cache.get(key)
+    if cached is not None:
+        return cached
 
-def generate_response(ctx: str, q: str):
-    system_prompt = f'''
+    # errors propagate to the caller, only real vectors are cached
+    if EMBED_BATCH_SIZE > 1:
+        # the shared batch call has its own budget; this caller only waits as long as it has
+        vec = await asyncio.wait_for(embed_coalescer.submit(txt), timeout)
+    else:
+        vec = (await embed_batch([txt], timeout))[0]
+    embed_cache.put(key, vec)
+    return vec
+
+async def embed_many(texts: list):
+    """embeddings for a batch of questions: cache hits, then each distinct miss once, in as few calls as possible"""
+    keys = [embed_cache.key(t) for t in texts]
+    vecs = [embed_cache.get(k) for k in keys]
+    missing = {}
+    for k, t, v in zip(keys, texts, vecs):
+        if v is None:
+            missing.setdefault(k, t)
+    fresh = {}
+    pending = list(missing.items())
+    for start in range(0, len(pending), EMBED_MAX_BATCH):
+        part = pending[start:start + EMBED_MAX_BATCH]
+        for (k, _), vec in zip(part, await embed_batch([t for _, t in part])):
+            fresh[k] = vec
+            embed_cache.put(k, vec)
+    return [v if v is not None else fresh[k] for k, v in zip(keys, vecs)]
+
+def match_knowledge(q_embed, match_cnt: int, query: str = None):
+    # one reference for the whole call, in case a snapshot reload swaps the global meanwhile
+    index = retriever
+    with upstream(index.name):
+        # the hybrid index also filters on what the question text asks for
+        if query is not None and index.name == "hybrid":
+            return index.search([q_embed], match_cnt, texts=[query])[0]
+        return index.search([q_embed], match_cnt)[0]
+
+async def retrieve(q_embed, match_cnt: int, query: str = None, timeout: float = None):
+    if retriever.name != "supabase":
+        # a local index has no network call to retry or hedge
+        return await retrieve_stage.run(match_knowledge, q_embed, match_cnt, query)
+    return await supabase_rpc.call(
+        lambda: retrieve_stage.run(match_knowledge, q_embed, match_cnt, query),
+        REQUEST_TIMEOUT * RETRIEVE_TIMEOUT_SHARE if timeout is None else timeout,
+    )
+
+def match_many(q_embeds, match_cnt: int, queries):
+    index = retriever
+    with upstream(index.name):
+        if index.name == "hybrid":
+            return index.search(q_embeds, match_cnt, texts=queries)
+        return index.search(q_embeds, match_cnt)
+
+async def retrieve_many(q_embeds, counts, queries):
+    """
+    results for many queries; a local index scores them all in one call, the
+    RPC is one call per query, run side by side within the retrieve stage's
+    limit. A failed query's slot holds its exception
+    """
+    if retriever.name == "supabase":
+        return await asyncio.gather(*(retrieve(q, k, t) for q, k, t in zip(q_embeds, counts, queries)), return_exceptions=True)
+    found = await retrieve_stage.run(match_many, q_embeds, max(counts), queries)
+    # top-k of a larger k is the same ranking, cut to each question's own count
+    return [r[:k] for r, k in zip(found, counts)]
+
+async def search_knowledge(q: str, match_cnt: int):
+    q_embed = await embedding_task(q)
+    return await retrieve(q_embed, match_cnt, q)
+
+def build_prompt(ctx: str, q: str):
+    return f'''
         You are a compassionate maternal health assistant.
         Do not diagnose.
         Use the following trusted information:
@@ -54,12 +463,89 @@ def generate_response(ctx: str, q: str):
         Question: {q}
         '''
 
-    resp = client.models.generate_content(
-        model="gemini-2.5-pro",
-        contents=system_prompt,
-        config=genai.types.GenerateContentConfig(temperature=0.7, max_output_tokens=1024,)
-    )
-    return resp
+GENERATION_CONFIG = genai.types.GenerateContentConfig(temperature=0.7, max_output_tokens=GENERATION_MAX_TOKENS,)
+
+router = Router(
+    Route("full", GENERATION_MODEL, GENERATION_CONFIG),
+    Route("fast", ROUTE_FAST_MODEL, genai.types.GenerateContentConfig(temperature=0.7, max_output_tokens=ROUTE_FAST_MAX_TOKENS,)) if ROUTING else None,
+    ROUTE_MAX_WORDS, ROUTE_MIN_SIMILARITY,
+    load_known_questions(ROUTE_KNOWN_QUESTIONS) if ROUTING else (), ROUTE_KNOWN_OVERLAP,
+)
+
+def generator(route: Route):
+    return gemini_generate_fast if route.name == "fast" else gemini_generate
+
+def choose_route(q: str, results):
+    route, reason = router.choose(q, results)
+    metrics.inc("chat_generation_routes_total", route=route.name, reason=reason)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.generation_route = route.name
+    return route
+
+def record_generation(route: Route, seconds: float):
+    route.latency.add(seconds * 1000)
+    metrics.observe("chat_generation_seconds", seconds, route=route.name)
+
+def prompt_for(ctx: str, q: str):
+    with timed(metrics, "prompt"):
+        prompt = build_prompt(ctx, q)
+    metrics.observe("chat_prompt_chars", len(prompt))
+    return prompt
+
+async def generate_response(ctx: str, q: str, timeout: float = REQUEST_TIMEOUT, route: Route = None):
+    route = route or router.full
+    up = generator(route)
+    prompt = prompt_for(ctx, q)
+    async def attempt():
+        with upstream(up.name):
+            return await generate_stage.run_async(
+                client.aio.models.generate_content,
+                model=route.model,
+                contents=prompt,
+                config=route.config
+            )
+    start = time.perf_counter()
+    with timed(metrics, "generate"):
+        resp = await up.call(attempt, timeout)
+    record_generation(route, time.perf_counter() - start)
+    metrics.observe("chat_response_chars", len(resp.text or ""))
+    return resp.text
+
+async def stream_response(ctx: str, q: str, route: Route = None):
+    route = route or router.full
+    up = generator(route)
+    # a stream is never retried (its tokens may already be sent) but still reports to the breaker
+    breaker = up.breaker
+    breaker.check()
+    prompt = prompt_for(ctx, q)
+    size = 0
+    start = time.perf_counter()
+    async with generate_stage.slot():
+        try:
+            with timed(metrics, "generate"), upstream(up.name):
+                stream = await client.aio.models.generate_content_stream(
+                    model=route.model,
+                    contents=prompt,
+                    config=route.config
+                )
+                async for chunk in stream:
+                    if chunk.text:
+                        size += len(chunk.text)
+                        yield chunk.text
+        except Exception as e:
+            if transient(e):
+                breaker.failure()
+            else:
+                breaker.success()
+            raise
+        except BaseException:
+            # closed early by the reader: the deadline passed or the client left
+            breaker.abandon()
+            raise
+    breaker.success()
+    record_generation(route, time.perf_counter() - start)
+    metrics.observe("chat_response_chars", size)
 
 
 @app.get("/")
@@ -68,22 +554,389 @@ def read_root():
 
 @app.get("/health")
 def check():
-    return {"status": "healthy"}
+    # readiness: 503 until clients exist and warm-up has run
+    if not startup["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "healthy", **startup}
+
+@app.get("/stats")
+def stats():
+    return {
+        "pending": admission.pending,
+        "max_pending": admission.max_pending,
+        "stages": {st.name: st.stats() for st in stages},
+        "embed_cache": embed_cache.stats(),
+        "embed_batching": embed_coalescer.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "stream": {"ttft_ms": ttft_ms.stats(), "generation_ms": generation_ms.stats()},
+        "retriever": retriever.name if retriever else None,
+        "hybrid": retriever.stats() if retriever and retriever.name == "hybrid" else None,
+        "snapshot": snapshot_loaded[0] if snapshot_loaded else None,
+        "upstreams": {u.name: u.stats() for u in upstreams},
+        "routing": router.stats(),
+        "startup": startup,
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def fetch_count(match_count: int):
+    return max(match_count, ADAPTIVE_MAX) if ADAPTIVE_MATCH_COUNT else match_count
+
+def build_context(results):
+    with timed(metrics, "context"):
+        kept, report = assemble_context(
+            results, CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_SIMILARITY, CONTEXT_NEAR_DUP,
+            ADAPTIVE_MARGIN if ADAPTIVE_MATCH_COUNT else None,
+        )
+    metrics.observe("chat_context_tokens_saved", report["tokens_saved"])
+    for reason, n in report["dropped"].items():
+        if n:
+            metrics.inc("chat_context_chunks_dropped_total", n, reason=reason)
+    return kept, report
+
+def context_headers(response: Response, report):
+    response.headers["X-Context-Chunks"] = f"{report['kept']}/{report['retrieved']}"
+    response.headers["X-Context-Tokens"] = str(report["tokens_kept"])
+    response.headers["X-Context-Tokens-Saved"] = str(report["tokens_saved"])
+
+def to_sources(results):
+    return [ {"content": ctx["content"], "similarity": ctx.get("similarity", 0)} for ctx in results]
+
+def cached_answer(q_embed, chunks):
+    if answer_cache is None:
+        return None, None
+    return answer_cache.get(q_embed, chunks)
+
+def remember_answer(q_embed, chunks, text: str, sources):
+    if answer_cache is not None and text:
+        answer_cache.put(q_embed, chunks, text, sources)
+
+DEGRADED_PREFIX = "I can't write an answer right now. This is the trusted information most relevant to your question:\n\n"
+
+def can_degrade(e: Exception):
+    # generation is down or failing, not merely slow: a timeout means the deadline is already spent
+    return DEGRADED_ANSWERS and (isinstance(e, CircuitOpen) or (transient(e) and not isinstance(e, asyncio.TimeoutError)))
+
+def degraded_answer(q_embed, results, chunks):
+    """
+    (text, sources, kind) without generation: a cached answer to a close
+    enough question built on some of the same chunks, with its own sources,
+    else the retrieved chunks
+    """
+    hit = answer_cache.nearest(q_embed, chunks) if answer_cache is not None else None
+    if hit is not None:
+        text, sources, kind = hit["response"], hit["sources"], "cached"
+    else:
+        text, sources, kind = DEGRADED_PREFIX + "\n\n".join(r["content"] for r in results), to_sources(results), "retrieval_only"
+    metrics.inc("chat_degraded_total", kind=kind)
+    return text, sources, kind
+
+def unavailable(e: CircuitOpen):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_in)))})
+
+async def answer(req: ChatRequest, response: Response):
+    deadline = Deadline(REQUEST_TIMEOUT)
+    # the context
+    with timed(metrics, "embed"):
+        q_embed = await embedding_task(req.message, deadline.budget(EMBED_TIMEOUT_SHARE))
+    with timed(metrics, "retrieve"):
+        results = await retrieve(q_embed, fetch_count(req.match_count), req.message, deadline.budget(RETRIEVE_TIMEOUT_SHARE))
+    if not results:
+        raise HTTPException(status_code=404, detail="No info found")
+
+    results, report = build_context(results)
+    context_headers(response, report)
+
+    chunks = chunk_set_key(results)
+    with timed(metrics, "answer_cache"):
+        hit, similarity = cached_answer(q_embed, chunks)
+    if hit is not None:
+        response.headers["X-Answer-Cache"] = "hit"
+        response.headers["X-Answer-Cache-Similarity"] = f"{similarity:.4f}"
+        return ChatResponse(response=hit["response"], sources=hit["sources"])
+    response.headers["X-Answer-Cache"] = "miss"
+
+    context = '\n'.join([r["content"] for r in results])
+
+    route = choose_route(req.message, results)
+    response.headers["X-Generation-Route"] = route.name
+    try:
+        ans_resp = await generate_response(context, req.message, deadline.remaining(), route)
+    except Exception as e:
+        if not can_degrade(e):
+            raise
+        text, sources, kind = degraded_answer(q_embed, results, chunks)
+        response.headers["X-Degraded"] = kind
+        return ChatResponse(response=text, sources=sources)
+
+    sources = to_sources(results)
+    remember_answer(q_embed, chunks, ans_resp, sources)
+    return ChatResponse(response=ans_resp, sources=sources)
 
 @app.post('/chat', response_model=ChatResponse)
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, response: Response):
+    try:
+        async with admission:
+            return await asyncio.wait_for(answer(req, response), REQUEST_TIMEOUT)
+
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="Server is busy, try again shortly", headers={"Retry-After": "1"})
+    except CircuitOpen as e:
+        raise unavailable(e)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Request took longer than {REQUEST_TIMEOUT}s")
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_failure(e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def answer_item(req: ChatRequest, q_embed, results, limit: asyncio.Semaphore, deadline: Deadline):
+    if isinstance(results, Exception):
+        raise results
+    if not results:
+        raise HTTPException(status_code=404, detail="No info found")
+
+    results, _ = build_context(results)
+    chunks = chunk_set_key(results)
+    with timed(metrics, "answer_cache"):
+        hit, _ = cached_answer(q_embed, chunks)
+    if hit is not None:
+        return {"response": hit["response"], "sources": hit["sources"]}
+
+    # out of time: a 504 for this item, not a zero-budget call the generate breaker would count against gemini
+    if deadline.remaining() <= 0:
+        raise asyncio.TimeoutError()
+    context = '\n'.join([r["content"] for r in results])
+    route = choose_route(req.message, results)
+    async with limit:
+        if deadline.remaining() <= 0:
+            raise asyncio.TimeoutError()
+        try:
+            text = await generate_response(context, req.message, deadline.remaining(), route)
+        except Exception as e:
+            if not can_degrade(e):
+                raise
+            text, sources, kind = degraded_answer(q_embed, results, chunks)
+            return {"response": text, "sources": sources, "degraded": kind, "route": route.name}
+    sources = to_sources(results)
+    remember_answer(q_embed, chunks, text, sources)
+    return {"response": text, "sources": sources, "route": route.name}
+
+def item_error(e: Exception):
+    if isinstance(e, HTTPException):
+        return {"status": e.status_code, "detail": e.detail}
+    if isinstance(e, CircuitOpen):
+        return {"status": 503, "detail": str(e)}
+    if isinstance(e, asyncio.TimeoutError):
+        return {"status": 504, "detail": f"Request took longer than {REQUEST_TIMEOUT}s"}
+    log_failure(e)
+    return {"status": 500, "detail": str(e)}
+
+async def batch_item(index: int, job):
+    try:
+        item = ChatBatchItem(index=index, **await job)
+    except Exception as e:
+        item = ChatBatchItem(index=index, error=item_error(e))
+    metrics.inc("chat_batch_items_total", status=str(item.error["status"] if item.error else 200))
+    return item
+
+async def reraise(e: Exception):
+    raise e
+
+async def answer_batch(reqs: list):
+    """
+    one embedding pass and one retrieval pass for the whole batch, then a
+    coroutine per question generating its answer, at most BATCH_CONCURRENCY
+    at a time. Each coroutine resolves to a ChatBatchItem, with an error
+    instead of an answer if its question failed. The whole batch shares one
+    REQUEST_TIMEOUT deadline
+    """
+    deadline = Deadline(REQUEST_TIMEOUT)
+    texts = [r.message for r in reqs]
+    try:
+        with timed(metrics, "embed"):
+            q_embeds = await asyncio.wait_for(embed_many(texts), deadline.remaining())
+        with timed(metrics, "retrieve"):
+            found = await asyncio.wait_for(retrieve_many(q_embeds, [fetch_count(r.match_count) for r in reqs], texts),
+                                           deadline.remaining())
+    except Exception as e:
+        # nothing to answer from: every question gets the same error
+        return [batch_item(i, reraise(e)) for i in range(len(reqs))]
+
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    return [batch_item(i, answer_item(r, q, res, limit, deadline)) for i, (r, q, res) in enumerate(zip(reqs, q_embeds, found))]
+
+async def stream_batch(reqs: list, trace: Trace):
+    tasks = []
+    try:
+        tasks = [asyncio.ensure_future(job) for job in await answer_batch(reqs)]
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            yield item.model_dump_json() + "\n"
+    finally:
+        # a client that went away leaves nothing running
+        for t in tasks:
+            t.cancel()
+        if trace is not None:
+            finish_trace(trace, "/chat/batch", 200)
+
+@app.post('/chat/batch', response_model=ChatBatchResponse)
+async def chat_batch(batch: ChatBatchRequest):
+    if len(batch.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} questions per batch")
+    metrics.observe("chat_batch_size", len(batch.requests))
+    # the whole batch takes one admission slot; generate_stage still bounds generation server-wide
+    try:
+        admission.acquire()
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="Server is busy, try again shortly", headers={"Retry-After": "1"})
+
+    if batch.stream:
+        trace = current_trace.get()
+        if trace is not None:
+            trace.streaming = True
+        return AdmittedStream(stream_batch(batch.requests, trace), trace, "/chat/batch", media_type="application/x-ndjson")
+
     try:
-        # the context
-        results = search_knowledge(req.message, req.match_count)
+        return ChatBatchResponse(results=await asyncio.gather(*await answer_batch(batch.requests)))
+    finally:
+        admission.release()
+
+def log_failure(e: Exception):
+    trace = current_trace.get()
+    if trace is not None:
+        log.error(f"request {trace.id} failed in {trace.stage or 'admission'} ({error_kind(e)}): {e!r}")
+
+
+class AdmittedStream(StreamingResponse):
+    """
+    a streaming response holding an admission slot. The slot goes back when
+    sending ends, however it ends: a client gone before the body is first
+    iterated never runs the body's own cleanup
+    """
+
+    def __init__(self, content, trace: Trace, route: str, **kwargs):
+        super().__init__(content, **kwargs)
+        self.trace = trace
+        self.route = route
+        self.released = False
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        admission.release()
+        if self.trace is not None:
+            # a no-op when the body finished the trace; 499 when it never got to
+            finish_trace(self.trace, self.route, 499)
+
+
+def sse(event: str, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def answer_stream(req: ChatRequest, trace: Trace):
+    deadline = Deadline(REQUEST_TIMEOUT)
+    status = 200
+    try:
+        with timed(metrics, "embed"):
+            q_embed = await embedding_task(req.message, deadline.budget(EMBED_TIMEOUT_SHARE))
+        with timed(metrics, "retrieve"):
+            results = await asyncio.wait_for(
+                retrieve(q_embed, fetch_count(req.match_count), req.message, deadline.budget(RETRIEVE_TIMEOUT_SHARE)),
+                deadline.remaining(),
+            )
         if not results:
-            raise HTTPException(status_code=404, detail="No info found")
+            status = 404
+            yield sse("error", {"status": 404, "detail": "No info found"})
+            return
 
-        context = '\n'.join([r["content"] for r in results])
+        results, report = build_context(results)
 
-        ans_resp = generate_response(context, req.message)
+        chunks = chunk_set_key(results)
+        with timed(metrics, "answer_cache"):
+            hit, _ = cached_answer(q_embed, chunks)
+        if hit is not None:
+            yield sse("sources", hit["sources"])
+            yield sse("delta", {"text": hit["response"]})
+            yield sse("done", {"cache": "hit", "ttft_ms": 0.0, "generation_ms": 0.0, "context": report})
+            return
 
-        source = [ {"content": ctx["content"], "similarity": ctx.get("similarity", 0)} for ctx in results]
-        return ChatResponse(response=ans_resp, sources=source)
+        # sources go out as soon as retrieval is done, before any generation
+        sources = to_sources(results)
+        yield sse("sources", sources)
 
+        context = '\n'.join([r["content"] for r in results])
+        start = time.perf_counter()
+        first = None
+        parts = []
+        route = choose_route(req.message, results)
+        deltas = stream_response(context, req.message, route)
+        try:
+            while True:
+                try:
+                    delta = await asyncio.wait_for(anext(deltas), deadline.remaining())
+                except StopAsyncIteration:
+                    break
+                if first is None:
+                    first = (time.perf_counter() - start) * 1000
+                    ttft_ms.add(first)
+                parts.append(delta)
+                yield sse("delta", {"text": delta})
+        except Exception as e:
+            # once part of an answer is out it cannot be swapped for another one
+            if parts or not can_degrade(e):
+                raise
+            text, cached_sources, kind = degraded_answer(q_embed, results, chunks)
+            if kind == "cached":
+                # the answer is another question's, so its sources replace the ones already sent
+                yield sse("sources", cached_sources)
+            yield sse("delta", {"text": text})
+            yield sse("done", {"cache": "miss", "degraded": kind, "route": route.name, "context": report})
+            return
+        finally:
+            await deltas.aclose()
+
+        total = (time.perf_counter() - start) * 1000
+        generation_ms.add(total)
+        remember_answer(q_embed, chunks, "".join(parts), sources)
+        yield sse("done", {"cache": "miss", "route": route.name, "ttft_ms": round(first or total, 1), "generation_ms": round(total, 1), "context": report})
+
+    except asyncio.TimeoutError:
+        status = 504
+        yield sse("error", {"status": 504, "detail": f"Request took longer than {REQUEST_TIMEOUT}s"})
+    except CircuitOpen as e:
+        status = 503
+        yield sse("error", {"status": 503, "detail": str(e), "retry_after": max(1, math.ceil(e.retry_in))})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        status = 500
+        log_failure(e)
+        yield sse("error", {"status": 500, "detail": str(e)})
+    finally:
+        if trace is not None:
+            finish_trace(trace, "/chat/stream", status)
+
+@app.post('/chat/stream')
+async def chat_stream(req: ChatRequest):
+    # admission is checked up front so an overloaded server still answers 503
+    try:
+        admission.acquire()
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="Server is busy, try again shortly", headers={"Retry-After": "1"})
+
+    trace = current_trace.get()
+    if trace is not None:
+        trace.streaming = True
+    return AdmittedStream(
+        answer_stream(req, trace), trace, "/chat/stream",
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
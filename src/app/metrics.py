@@ -0,0 +1,144 @@
+import contextvars
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from pipeline import Histogram
+
+SECONDS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+CHARS = [100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+STAGE_SECONDS = "chat_stage_seconds"
+
+_TRACE_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def _labels(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt_value(v):
+    return "+Inf" if v == float("inf") else repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Registry:
+    """counters, histograms and callback gauges, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._meta = {}
+        self._buckets = {}
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str):
+        self._meta[name] = ("counter", help)
+
+    def histogram(self, name: str, help: str, buckets):
+        self._meta[name] = ("histogram", help)
+        self._buckets[name] = buckets
+
+    def callback(self, name: str, help: str, fn, kind: str = "gauge"):
+        # fn returns a number, a [(labels, value)] list, or a Histogram
+        self._meta[name] = (kind, help)
+        self._callbacks[name] = fn
+
+    def inc(self, name: str, n: float = 1, **labels):
+        with self._lock:
+            self._counters[(name, _labels(labels))] += n
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = Histogram(self._buckets[name])
+            h.add(value)
+
+    def _samples(self, name):
+        if name in self._callbacks:
+            v = self._callbacks[name]()
+            if isinstance(v, Histogram):
+                return [((), v)]
+            if isinstance(v, list):
+                return [(_labels(l), x) for l, x in v]
+            return [((), v)]
+        store = self._histograms if self._meta[name][0] == "histogram" else self._counters
+        return sorted((labels, v) for (n, labels), v in list(store.items()) if n == name)
+
+    def render(self):
+        lines = []
+        for name, (kind, help) in self._meta.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, v in self._samples(name):
+                if isinstance(v, Histogram):
+                    for le, n in v.cumulative():
+                        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', _fmt_value(le))])} {n}")
+                    lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(float(v.sum))}")
+                    lines.append(f"{name}_count{_fmt_labels(labels)} {v.count}")
+                else:
+                    lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(v)}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """one request: its id and the time spent in each stage (ms)"""
+
+    def __init__(self, trace_id: str = None, path: str = ""):
+        self.id = trace_id if trace_id and _TRACE_ID.match(trace_id) else uuid.uuid4().hex
+        self.path = path
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.stage = None
+        # "full" or "fast" once an answer is generated (see routing.py)
+        self.generation_route = None
+        self.streaming = False
+        self.finished = False
+
+    def add(self, stage: str, ms: float):
+        self.stages[stage] = round(self.stages.get(stage, 0.0) + ms, 1)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def timed(registry: Registry, stage: str):
+    # one stage of the current request: goes to the stage histogram and the request's trace
+    trace = current_trace.get()
+    if trace is not None:
+        trace.stage = stage
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t
+        registry.observe(STAGE_SECONDS, dt, stage=stage)
+        if trace is not None:
+            trace.add(stage, dt * 1000)
+
+
+def error_kind(e: Exception):
+    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+    if code == 429 or "RESOURCE_EXHAUSTED" in str(e):
+        return "rate_limit"
+    if isinstance(e, TimeoutError):
+        return "timeout"
+    if isinstance(code, int) and code >= 500:
+        return "server"
+    return "error"
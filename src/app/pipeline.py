@@ -0,0 +1,197 @@
+import asyncio
+import bisect
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Admission:
+    """caps how many requests may be inside the pipeline (running or queued)"""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.pending = 0
+
+    def acquire(self):
+        # the event loop is single threaded, so a plain counter is enough
+        if self.pending >= self.max_pending:
+            raise Overloaded(f"{self.pending} requests already pending")
+        self.pending += 1
+
+    def release(self):
+        self.pending -= 1
+
+    async def __aenter__(self):
+        self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+        return False
+
+
+class Stage:
+    """one step of embed -> retrieve -> generate, limited to `limit` concurrent calls"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self._sem = asyncio.Semaphore(limit)
+        self._pool = ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"stage-{name}")
+
+    @property
+    def waiting(self):
+        return max(0, len(getattr(self._sem, "_waiters", None) or ()))
+
+    @asynccontextmanager
+    async def slot(self):
+        # held for the whole call, including a streamed response
+        async with self._sem:
+            self.active += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        # blocking client calls go to this stage's own bounded thread pool
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, lambda: fn(*args, **kwargs))
+
+    async def run_async(self, coro_fn, *args, **kwargs):
+        async with self.slot():
+            return await coro_fn(*args, **kwargs)
+
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class LatencyWindow:
+    """the last `size` samples (ms) of one timing, summarised as percentiles"""
+
+    def __init__(self, size: int = 1000):
+        self.count = 0
+        self._samples = deque(maxlen=size)
+
+    def add(self, ms: float):
+        self.count += 1
+        self._samples.append(ms)
+
+    def percentile(self, p: float):
+        s = sorted(self._samples)
+        return s[min(len(s) - 1, int(p / 100 * (len(s) - 1)))] if s else None
+
+    def stats(self):
+        s = sorted(self._samples)
+        if not s:
+            return {"count": self.count}
+        pick = lambda p: round(s[min(len(s) - 1, int(p * (len(s) - 1)))], 1)
+        return {"count": self.count, "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+class Histogram:
+    """fixed-bucket histogram: cumulative counts per upper bound, plus count and sum"""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value: float):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        out, total = [], 0
+        for le, n in zip(self.buckets + [float("inf")], self._counts):
+            total += n
+            out.append((le, total))
+        return out
+
+    def stats(self):
+        mean = round(self.sum / self.count, 2) if self.count else None
+        return {"count": self.count, "mean": mean, "buckets": {str(le): n for le, n in self.cumulative()}}
+
+
+class Coalescer:
+    """
+    collects items submitted within `max_wait_ms` of the first one (or until
+    `max_batch` distinct items are queued) and resolves them with one call of
+    `fn(items) -> results`; equal items share a single slot in the batch
+    """
+
+    def __init__(self, fn, max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._pending = {}
+        self._timer = None
+        self._tasks = set()
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.wait_ms = Histogram([0.5, 1, 2, 5, 10, 20, 50])
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        if item in self._pending:
+            self._pending[item][0].append(fut)
+        else:
+            self._pending[item] = ([fut], time.perf_counter())
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        items = list(batch)
+        now = time.perf_counter()
+        self.batch_size.add(len(items))
+        for _, queued in batch.values():
+            self.wait_ms.add((now - queued) * 1000)
+        try:
+            results = await self.fn(items)
+        except Exception as e:
+            # every waiter of a failed batch sees the same error
+            for futs, _ in batch.values():
+                for f in futs:
+                    if not f.done():
+                        f.set_exception(e)
+            return
+        for item, res in zip(items, results):
+            for f in batch[item][0]:
+                # a waiter that timed out has already been cancelled
+                if not f.done():
+                    f.set_result(res)
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": len(self._pending),
+            "batch_size": self.batch_size.stats(),
+            "wait_ms": self.wait_ms.stats(),
+        }
@@ -0,0 +1,220 @@
+import asyncio
+import random
+import time
+
+from pipeline import LatencyWindow
+
+
+class CircuitOpen(Exception):
+    """an upstream's breaker is open, so the call was not attempted"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def transient(e: Exception):
+    # worth retrying and a sign of an unhealthy upstream; a 4xx other than 408/429 is the request's own fault
+    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+    return not (isinstance(code, int) and 400 <= code < 500 and code not in (408, 429))
+
+
+class Deadline:
+    """the time left for one request, shared out between its stages"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.end = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.end - time.monotonic())
+
+    def budget(self, share: float = None):
+        # a stage gets its share of the whole deadline, never more than is left
+        if share is None:
+            return self.remaining()
+        return min(self.remaining(), self.seconds * share)
+
+
+class CircuitBreaker:
+    """
+    opens after `failures` consecutive transient failures and rejects calls
+    for `reset_s`; then one probe call is let through (half open), and its
+    outcome closes the breaker or opens it again
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name: str, failures: int = 5, reset_s: float = 10.0):
+        self.name = name
+        self.failures = failures
+        self.reset_s = reset_s
+        self.state = self.CLOSED
+        self.consecutive = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def retry_in(self):
+        return max(0.0, self._opened_at + self.reset_s - time.monotonic())
+
+    def check(self):
+        """raises CircuitOpen unless a call may go out now"""
+        if not self.failures:
+            return
+        if self.state == self.OPEN and not self.retry_in():
+            self.state = self.HALF_OPEN
+        if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._probing):
+            self.rejected += 1
+            raise CircuitOpen(self.name, self.retry_in() or self.reset_s)
+        if self.state == self.HALF_OPEN:
+            self._probing = True
+
+    def abandon(self):
+        # a call cancelled by its caller says nothing about the upstream
+        self._probing = False
+
+    def success(self):
+        self.consecutive = 0
+        self._probing = False
+        self.state = self.CLOSED
+
+    def failure(self):
+        self.consecutive += 1
+        self._probing = False
+        if self.failures and (self.state == self.HALF_OPEN or self.consecutive >= self.failures):
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.consecutive, "opened": self.opened,
+                "rejected": self.rejected, "retry_in_s": round(self.retry_in(), 1) if self.state == self.OPEN else 0.0}
+
+
+class Upstream:
+    """
+    the calls to one upstream: each attempt is bounded by the caller's
+    timeout, transient failures are retried with full-jitter backoff when
+    the time left still covers a typical call, and with hedge_percentile set
+    an attempt still running after that percentile of recent latencies gets
+    a second, identical request racing it. Every attempt goes through the
+    circuit breaker, which only hears about timeouts the upstream had a
+    typical call's worth of time to avoid: a caller out of time is not an
+    unhealthy upstream
+    """
+
+    # samples needed before hedging, and how often the hedge delay is recomputed
+    MIN_SAMPLES = 20
+    REFRESH_EVERY = 10
+
+    def __init__(self, name: str, breaker: CircuitBreaker, retries: int = 2, backoff_ms: float = 100,
+                 hedge_percentile: float = 0):
+        self.name = name
+        self.breaker = breaker
+        self.retries = retries
+        self.backoff = backoff_ms / 1000
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyWindow(500)
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.starved = 0
+        self._hedge_after = None
+        self._typical = 0.0
+
+    def _record(self, seconds: float):
+        self.latency.add(seconds * 1000)
+        if self.latency.count % self.REFRESH_EVERY == 0:
+            self._typical = self.latency.percentile(50) / 1000
+            if self.hedge_percentile and self.latency.count >= self.MIN_SAMPLES:
+                self._hedge_after = self.latency.percentile(self.hedge_percentile) / 1000
+
+    async def _timed(self, call):
+        t = time.monotonic()
+        result = await call()
+        self._record(time.monotonic() - t)
+        return result
+
+    async def _attempt(self, call, timeout: float):
+        first = asyncio.ensure_future(self._timed(call))
+        if self._hedge_after is None or self._hedge_after >= timeout:
+            return await asyncio.wait_for(first, timeout)
+
+        end = time.monotonic() + timeout
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_after)
+            if not done:
+                self.hedged += 1
+                tasks.add(asyncio.ensure_future(self._timed(call)))
+            while True:
+                if not done:
+                    done, _ = await asyncio.wait(tasks, timeout=end - time.monotonic(), return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        raise asyncio.TimeoutError()
+                winner = next((t for t in done if t.exception() is None), None)
+                if winner is not None:
+                    self.hedge_wins += winner is not first
+                    return winner.result()
+                tasks -= done
+                # both failed, or the only one did: the first error is the answer
+                if not tasks:
+                    raise next(iter(done)).exception()
+                done = set()
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def call(self, call, timeout: float):
+        """
+        await call() (a fresh coroutine per attempt) within `timeout` seconds
+        overall; raises the last error, asyncio.TimeoutError or CircuitOpen
+        """
+        end = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            budget = end - time.monotonic()
+            if budget <= 0:
+                self.starved += 1
+                raise asyncio.TimeoutError()
+            self.breaker.check()
+            try:
+                result = await self._attempt(call, budget)
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                if not transient(e):
+                    # the upstream answered, it just refused this request
+                    self.breaker.success()
+                    raise
+                if isinstance(e, asyncio.TimeoutError) and budget < self._typical:
+                    # less time than a typical call takes: the caller's deadline, not the upstream, ran out
+                    self.starved += 1
+                    self.breaker.abandon()
+                    raise
+                self.breaker.failure()
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                if attempt >= self.retries or time.monotonic() + delay + self._typical >= end:
+                    raise
+                attempt += 1
+                self.retried += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.success()
+            return result
+
+    def stats(self):
+        return {
+            "latency_ms": self.latency.stats(),
+            "retries": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "starved": self.starved,
+            "hedge_after_ms": round(self._hedge_after * 1000, 1) if self._hedge_after is not None else None,
+            "breaker": self.breaker.stats(),
+        }
@@ -0,0 +1,212 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+# chunk texts as one utf-8 blob, sliced by offsets; the older chunks.jsonl is still read
+CHUNKS_BLOB = "chunks.bin"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.npy"
+CHUNKS_FILE = "chunks.jsonl"
+
+
+def _normalize(mat):
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def top_k(scores, k: int):
+    """row-wise indices of the k largest scores, best first"""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1)
+    return np.take_along_axis(idx, order, axis=1)
+
+
+class SupabaseRetriever:
+    """the `match_knowledge` RPC, one network round trip per query"""
+
+    name = "supabase"
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def search(self, queries, k: int):
+        out = []
+        for q in queries:
+            res = self.supabase.rpc('match_knowledge', {
+                "query_embedding": list(map(float, q)),
+                "match_count": k
+            }).execute()
+            out.append(res.data or [])
+        return out
+
+
+class ChunkStore:
+    """
+    the chunk texts and ids of a snapshot, memory-mapped read-only. Every
+    worker process maps the same files, so the texts sit once in the page
+    cache however many workers there are. Indexing gives the same
+    {"id", "content"} dicts as a list loaded from chunks.jsonl
+    """
+
+    def __init__(self, snapshot_dir: str):
+        self.offsets = np.load(os.path.join(snapshot_dir, OFFSETS_FILE), mmap_mode="r")
+        self.ids = np.load(os.path.join(snapshot_dir, IDS_FILE), mmap_mode="r")
+        size = int(self.offsets[-1]) if len(self.offsets) else 0
+        # a zero-length file cannot be mapped
+        self.blob = np.memmap(os.path.join(snapshot_dir, CHUNKS_BLOB), dtype=np.uint8, mode="r") if size else np.empty(0, np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def content(self, i: int):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+    def __getitem__(self, i):
+        return {"id": int(self.ids[i]), "content": self.content(i)}
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def load_chunks(snapshot_dir: str):
+    if os.path.exists(os.path.join(snapshot_dir, OFFSETS_FILE)):
+        return ChunkStore(snapshot_dir)
+    with open(os.path.join(snapshot_dir, CHUNKS_FILE)) as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+
+class NumpyIndex:
+    """exact cosine search over a snapshot of the `knowledge` table held in RAM"""
+
+    name = "numpy"
+
+    def __init__(self, vectors, chunks):
+        self.vectors = vectors
+        self.chunks = chunks
+
+    @classmethod
+    def load(cls, snapshot_dir: str, mmap: bool = True):
+        vectors = np.load(os.path.join(snapshot_dir, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        chunks = load_chunks(snapshot_dir)
+        if len(chunks) != vectors.shape[0]:
+            raise ValueError(f"snapshot mismatch: {vectors.shape[0]} vectors, {len(chunks)} chunks")
+        return cls(vectors, chunks)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def search(self, queries, k: int):
+        q = _normalize(np.atleast_2d(queries))
+        scores = q @ self.vectors.T
+        idx = top_k(scores, k)
+        return [
+            [self._record(i, scores[row, i]) for i in idx[row]]
+            for row in range(idx.shape[0])
+        ]
+
+    def _record(self, i, score):
+        chunk = self.chunks[i]
+        return {"id": chunk.get("id"), "content": chunk["content"], "similarity": float(score)}
+
+
+def snapshot_exists(snapshot_dir: str):
+    return os.path.exists(os.path.join(snapshot_dir, VECTORS_FILE)) and any(
+        os.path.exists(os.path.join(snapshot_dir, f)) for f in (OFFSETS_FILE, CHUNKS_FILE))
+
+
+def snapshot_id(snapshot_dir: str):
+    """what SNAPSHOT_DIR currently points at; changes when a new snapshot is published"""
+    real = os.path.realpath(snapshot_dir)
+    try:
+        return real, os.stat(os.path.join(real, VECTORS_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def write_snapshot(out_dir: str, ids, contents, vectors):
+    """
+    the one writer of the snapshot layout: normalized vectors.npy, the texts
+    as one chunks.bin blob sliced by offsets.npy, and ids.npy
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, VECTORS_FILE), np.ascontiguousarray(_normalize(vectors)))
+    encoded = [c.encode() for c in contents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(os.path.join(out_dir, CHUNKS_BLOB), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(out_dir, OFFSETS_FILE), offsets)
+    np.save(os.path.join(out_dir, IDS_FILE), np.asarray(ids, dtype=np.int64))
+
+
+def publish_snapshot(snapshot_dir: str, link: str):
+    """
+    points `link` (the app's SNAPSHOT_DIR) at snapshot_dir with one rename, so
+    a reader sees either the old snapshot or the new one, never a mix.
+    Running workers switch on their next check; requests already searching
+    the old snapshot finish on it, so keep the old directory for a while
+    """
+    if os.path.isdir(link) and not os.path.islink(link):
+        raise ValueError(f"{link} is a directory; move it aside so it can be replaced by a symlink")
+    tmp = f"{link}.tmp-{os.getpid()}"
+    os.symlink(os.path.abspath(snapshot_dir), tmp)
+    os.replace(tmp, link)
+
+
+def export_snapshot(supabase, out_dir: str, page: int = 1000):
+    """pull every row of `knowledge` and write it as a snapshot (see write_snapshot)"""
+    ids, contents, vectors = [], [], []
+    start = 0
+    while True:
+        res = supabase.table("knowledge").select("id, content, embedding").order("id").range(start, start + page - 1).execute()
+        rows = res.data or []
+        for r in rows:
+            emb = r["embedding"]
+            # pgvector columns come back from PostgREST as "[0.1,0.2,...]"
+            if isinstance(emb, str):
+                emb = json.loads(emb)
+            ids.append(r["id"])
+            contents.append(r["content"])
+            vectors.append(emb)
+        print(f"exported {len(ids)} rows...")
+        if len(rows) < page:
+            break
+        start += page
+
+    write_snapshot(out_dir, ids, contents, np.asarray(vectors, dtype=np.float32))
+    print(f"snapshot written to {out_dir}: {len(ids)} x {len(vectors[0]) if vectors else 0}")
+
+
+if __name__ == "__main__":
+    # python retrieval.py export ./snapshots/2026-10-18 [./snapshot]
+    # python retrieval.py publish ./snapshots/2026-10-18 ./snapshot
+    if len(sys.argv) < 3 or sys.argv[1] not in ("export", "publish") or (sys.argv[1] == "publish" and len(sys.argv) < 4):
+        print("usage: python retrieval.py export <snapshot_dir> [link_to_publish]")
+        print("       python retrieval.py publish <snapshot_dir> <link>")
+        sys.exit(1)
+
+    if sys.argv[1] == "export":
+        from dotenv import load_dotenv
+        from supabase import create_client
+
+        load_dotenv()
+        export_snapshot(create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY")), sys.argv[2])
+    if len(sys.argv) > 3:
+        publish_snapshot(sys.argv[2], sys.argv[3])
+        print(f"{sys.argv[3]} -> {os.path.abspath(sys.argv[2])}")
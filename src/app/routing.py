@@ -0,0 +1,75 @@
+from pipeline import LatencyWindow
+from text import tokenize
+
+
+class Route:
+    """one generation tier: a model and its generation config"""
+
+    def __init__(self, name: str, model: str, config):
+        self.name = name
+        self.model = model
+        self.config = config
+        self.count = 0
+        self.latency = LatencyWindow()
+
+    def stats(self):
+        return {"model": self.model, "max_output_tokens": getattr(self.config, "max_output_tokens", None),
+                "requests": self.count, "generate_ms": self.latency.stats()}
+
+
+def load_known_questions(path: str):
+    """one question per line; blank lines and # comments are skipped. Missing file = no known questions"""
+    try:
+        with open(path) as f:
+            return [l.strip() for l in f if l.strip() and not l.lstrip().startswith("#")]
+    except FileNotFoundError:
+        return []
+
+
+class Router:
+    """
+    picks the generation route of a question from local signals only. Near
+    matches of a known question (word overlap), and short questions whose
+    best retrieved chunk is a close match, take the fast route; everything
+    else, or everything when there is no fast route, the full one
+    """
+
+    def __init__(self, full: Route, fast: Route = None, max_words: int = 12, min_similarity: float = 0.75,
+                 known=(), known_overlap: float = 0.6):
+        self.full = full
+        self.fast = fast
+        self.max_words = max_words
+        self.min_similarity = min_similarity
+        self.known_overlap = known_overlap
+        self.known = [s for s in (frozenset(tokenize(q)) for q in known) if s]
+        self.reasons = {}
+
+    def routes(self):
+        return [r for r in (self.full, self.fast) if r is not None]
+
+    def overlap(self, question: str):
+        """best jaccard overlap of the question's words with a known question"""
+        words = frozenset(tokenize(question))
+        if not words:
+            return 0.0
+        return max((len(words & k) / len(words | k) for k in self.known), default=0.0)
+
+    def choose(self, question: str, results):
+        """(route, reason) for a question and what retrieval found for it"""
+        if self.fast is None:
+            route, reason = self.full, "default"
+        elif self.known and self.overlap(question) >= self.known_overlap:
+            route, reason = self.fast, "known_question"
+        elif len(question.split()) > self.max_words:
+            route, reason = self.full, "long_question"
+        elif max((r.get("similarity") or 0.0 for r in results), default=0.0) < self.min_similarity:
+            route, reason = self.full, "weak_match"
+        else:
+            route, reason = self.fast, "short_grounded"
+        route.count += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return route, reason
+
+    def stats(self):
+        return {"routes": {r.name: r.stats() for r in self.routes()}, "reasons": self.reasons,
+                "known_questions": len(self.known)}
@@ -0,0 +1,21 @@
+import re
+
+_WORD = re.compile(r"\w+")
+STOPWORDS = frozenset("a an and are as at be by for from has have in is it of on or than that the to was who with".split())
+
+
+def tokenize(text: str):
+    """lowercased words without stopwords, for BM25 (hybrid.py) and question matching (routing.py)"""
+    return [w for w in _WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+def shingles(text: str, k: int = 3):
+    """the k-word windows of tokenize(text), for near-duplicate checks (context.py, data/synthetic/dedup.py)"""
+    words = tokenize(text)
+    if len(words) <= k:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+def jaccard(a: set, b: set):
+    return len(a & b) / len(a | b) if a or b else 1.0
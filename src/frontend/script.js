@@ -1,4 +1,4 @@
-const THE_URL = "http://127.0.0.1:8004/";
+const THE_URL = "http://127.0.0.1:8004";
 
 const chatBox = document.getElementById("chat-box");
 const userInput = document.getElementById("user-input");
@@ -6,11 +6,7 @@ const sendBtn = document.getElementById("send-btn");
 const loading = document.getElementById("loading");
 
 
-const addMessage = (content, isUser = false, sources = null) => {
-  const msgDiv = document.createElement("div");
-  msgDiv.className = `${isUser ? 'user-message' : 'bot-message'}`;
-  msgDiv.textContent = content;
-
+const addSources = (msgDiv, sources) => {
   if (sources && sources.length > 0) {
     const srcDiv = document.createElement("div");
     srcDiv.className = "sources";
@@ -20,9 +16,46 @@ const addMessage = (content, isUser = false, sources = null) => {
   }
 }
 
+const addMessage = (content, isUser = false, sources = null) => {
+  const msgDiv = document.createElement("div");
+  msgDiv.className = `${isUser ? 'user-message' : 'bot-message'}`;
+  const textSpan = document.createElement("span");
+  textSpan.textContent = content;
+  msgDiv.appendChild(textSpan);
+  chatBox.appendChild(msgDiv);
+
+  addSources(msgDiv, sources);
+  chatBox.scrollTop = chatBox.scrollHeight;
+  return msgDiv;
+}
+
+// reads `event: ...` / `data: ...` blocks off a fetch body as they arrive
+async function* readEvents(resp) {
+  const reader = resp.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let end;
+    while ((end = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      let event = "message", data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      yield { event, data: data ? JSON.parse(data) : null };
+    }
+  }
+}
+
 async function sendMessage() {
   const msg = userInput.value.trim();
-  console.log(msg);
   if (!msg) return;
 
   userInput.disabled = true;
@@ -33,20 +66,35 @@ async function sendMessage() {
   userInput.value = "";
 
   try {
-    const resp = await fetch(`${THE_URL}/chat`, {
-      method: POST,
+    const resp = await fetch(`${THE_URL}/chat/stream`, {
+      method: "POST",
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify(`{"message": {"question": ${msg} }, "match_count": 2`)
+      body: JSON.stringify({ message: msg, match_count: 2 })
     });
 
     if (!resp.ok) {
       throw new Error(`HTTP error! status: ${resp.status}`);
     }
 
-    const data = await resp.json();
-    addMessage(data.response, false, data.sources);
+    const botDiv = addMessage("", false);
+    const textSpan = botDiv.firstChild;
+    let sources = null;
+
+    for await (const { event, data } of readEvents(resp)) {
+      if (event === "sources") {
+        sources = data;
+      } else if (event === "delta") {
+        // first token is on screen, the spinner is no longer needed
+        loading.classList.add("hidden");
+        textSpan.textContent += data.text;
+        chatBox.scrollTop = chatBox.scrollHeight;
+      } else if (event === "error") {
+        throw new Error(data.detail);
+      }
+    }
+    addSources(botDiv, sources);
   }
   catch (error) {
     addMessage(`Error: ${error.message}. Please check if backend is running.`, false);